@@ -3,9 +3,14 @@ This module contains various commands that can be executed by the bot.
 It includes commands for changing the bot's status, generating images, etc.
 """
 
+import asyncio
+import io
 import logging
 import discord
 
+# Discord accepts at most 10 attachments per message.
+MAX_ATTACHMENTS = 10
+
 
 async def ping(_, message: discord.Message):
     """
@@ -33,6 +38,8 @@ async def change_status(bot, message):
 async def generate_image(bot, message: discord.Message):
     """
     Generates an image based on the message.
+    While the job waits or runs, a status message shows its queue position or
+    progress, and is removed once the image is sent.
     """
 
     if not bot.settings.use_stable_diffusion:
@@ -40,20 +47,84 @@ async def generate_image(bot, message: discord.Message):
             "The bot is not configured to generate images.", mention_author=True
         )
         return
+    from addons.stable_diffusion_conection import SDQueueFullError
 
     logging.info("Generating image...")
     sd_client = bot.stable_diffusion_connection
-    async with message.channel.typing():
-        content = message.content.split(message.content)[1].strip()
+    content = message.content.partition(" ")[2].strip()
+
+    inverse_prompt = None
+    if "|" in content:
+        content, inverse_prompt = content.split("|")
+
+    try:
+        job = sd_client.submit(content, inverse_prompt, owner_id=message.author.id)
+    except SDQueueFullError:
+        await message.reply(
+            "Too many images in the queue, please try again later.",
+            mention_author=True,
+        )
+        return
+
+    status_text = _image_status(sd_client.position(job), {})
+    status = await message.reply(status_text, mention_author=False)
+    interval = bot.settings.sd_progress_interval_ms / 1000.0
+    while not job.done():
+        try:
+            await asyncio.wait_for(job.result(), timeout=interval)
+        except asyncio.TimeoutError:
+            position = sd_client.position(job)
+            progress = await sd_client.progress(job) if position == 0 else {}
+            text = _image_status(position, progress)
+            if text != status_text and not job.done():
+                status_text = text
+                await status.edit(content=text)
+
+    images = await job.result()
+    if not images:
+        if job.cancelled:
+            await status.edit(content="Image generation cancelled.")
+        else:
+            await status.edit(content="Image generation failed.")
+        return
+
+    files = [
+        discord.File(io.BytesIO(image), filename=f"image_{i + 1}.png")
+        for i, image in enumerate(images)
+    ]
+    for start in range(0, len(files), MAX_ATTACHMENTS):
+        await message.reply(
+            files=files[start : start + MAX_ATTACHMENTS], mention_author=True
+        )
+    await status.delete()
+
+
+async def cancel_image(bot, message: discord.Message):
+    """
+    Cancels the image generations requested by the user.
+    """
+    sd_client = bot.stable_diffusion_connection
+    if sd_client is None:
+        await message.reply(
+            "The bot is not configured to generate images.", mention_author=True
+        )
+        return
 
-        inverse_prompt = None
-        if "|" in content:
-            content, inverse_prompt = content.split("|")
+    jobs = [job for job in sd_client.jobs() if job.owner_id == message.author.id]
+    if not jobs:
+        await message.reply("You have no image in the queue.", mention_author=True)
+        return
 
-        file_name = await sd_client.txt2img(content, inverse_prompt)
-        if not file_name:
-            return
+    logging.info("Cancelling %s image job(s)...", len(jobs))
+    for job in jobs:
+        await sd_client.cancel(job)
 
-        await message.reply(file=discord.File(file_name), mention_author=True)
 
-        sd_client.delete_image(file_name)
+def _image_status(position: int, progress: dict) -> str:
+    if position > 0:
+        return f"Waiting for image generation... (position {position} in queue)"
+    percent = int(progress.get("progress", 0) * 100)
+    eta = progress.get("eta_relative", 0)
+    if percent <= 0:
+        return "Generating image..."
+    return f"Generating image... {percent}% (about {eta:.0f}s left)"
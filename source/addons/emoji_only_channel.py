@@ -1,20 +1,128 @@
 """
 Emoji only channel manager
+Messages with anything but emojis are queued per channel and removed in
+batches with Discord's bulk-delete endpoint.
 """
 
+import asyncio
+import datetime
+import logging
 import re
+import time
+from typing import Dict, List
 
+import discord
 
-async def manage_emojis_channel(message):
+from core.metrics import REGISTRY
+
+# Unicode emoji code points (Extended_Pictographic), with the modifiers used in
+# emoji sequences: ZWJ, variation selectors, keycap, skin tones and tags.
+_EMOJI_CHARS = (
+    "\u00a9\u00ae\u203c\u2049\u2122\u2139\u2194-\u2199\u21a9\u21aa"
+    "\u231a\u231b\u2328\u23cf\u23e9-\u23f3\u23f8-\u23fa\u24c2"
+    "\u25aa\u25ab\u25b6\u25c0\u25fb-\u25fe\u2600-\u27bf\u2934\u2935"
+    "\u2b05-\u2b07\u2b1b\u2b1c\u2b50\u2b55\u3030\u303d\u3297\u3299"
+    "\U0001f000-\U0001faff"
+    "\u200d\ufe0e\ufe0f\u20e3\U000e0020-\U000e007f"
+)
+
+# Whole message made of whitespace, custom Discord emojis (<:name:id>, animated
+# <a:name:id>), keycaps (1, #, * + U+20E3) and Unicode emojis.
+_EMOJI_ONLY = re.compile(
+    r"(?:\s|<a?:\w+:\d+>|[0-9#*]\ufe0f?\u20e3|[" + _EMOJI_CHARS + "])*"
+)
+
+# Discord only bulk-deletes 2 to 100 messages younger than 14 days.
+BULK_DELETE_MAX = 100
+BULK_DELETE_MAX_AGE = datetime.timedelta(days=14, minutes=-5)
+
+
+def is_emoji_only(content: str) -> bool:
+    """
+    Whether a message only contains emojis (and whitespace).
+    """
+    return _EMOJI_ONLY.fullmatch(content) is not None
+
+
+class EmojiModerator:
     """
-    Remove all discord emojis
+    Removes messages that are not emoji-only, batching the deletions per channel.
     """
 
-    message_content = message.content.lower()
+    def __init__(self, flush_interval_ms: int = 1000):
+        self.flush_interval = flush_interval_ms / 1000.0
+        self._queues: Dict[int, List[discord.Message]] = {}
+        self._tasks: Dict[int, asyncio.Task] = {}
+        self.violations = 0
+        self.deleted = 0
+
+    @property
+    def backlog(self) -> int:
+        """
+        Messages waiting to be deleted.
+        """
+        return sum(len(queue) for queue in self._queues.values())
+
+    def submit(self, message: discord.Message) -> bool:
+        """
+        Check a message and queue it for deletion if it breaks the rule.
+        """
+        if is_emoji_only(message.content):
+            return False
+        self.violations += 1
+        REGISTRY.inc("emoji_moderation_violations_total")
+        channel_id = message.channel.id
+        self._queues.setdefault(channel_id, []).append(message)
+        task = self._tasks.get(channel_id)
+        if task is None or task.done():
+            self._tasks[channel_id] = asyncio.create_task(
+                self._flush_channel(message.channel)
+            )
+        return True
+
+    async def _flush_channel(self, channel):
+        # Let the burst accumulate, then drain the queue batch by batch.
+        await asyncio.sleep(self.flush_interval)
+        while self._queues.get(channel.id):
+            messages = self._queues.pop(channel.id)
+            start = time.monotonic()
+            await self._delete(channel, messages)
+            REGISTRY.observe("emoji_moderation_flush_seconds", time.monotonic() - start)
+        self._queues.pop(channel.id, None)
+
+    async def _delete(self, channel, messages: List[discord.Message]):
+        limit = discord.utils.utcnow() - BULK_DELETE_MAX_AGE
+        recent = [m for m in messages if m.created_at > limit]
+        single = [m for m in messages if m.created_at <= limit]
+        for start in range(0, len(recent), BULK_DELETE_MAX):
+            batch = recent[start : start + BULK_DELETE_MAX]
+            if len(batch) == 1:
+                single.extend(batch)
+                continue
+            try:
+                await channel.delete_messages(batch)
+                self._count_deleted(len(batch))
+            except discord.HTTPException as e:
+                logging.error("Error bulk deleting messages: %s", e)
+                single.extend(batch)
+
+        for message in single:
+            try:
+                await message.delete()
+                self._count_deleted(1)
+            except discord.NotFound:
+                pass
+            except discord.HTTPException as e:
+                logging.error("Error deleting message: %s", e)
 
-    re_emoji = re.compile(r"<[^\s]+>")
-    message_content = re_emoji.sub("", message_content)
+    def _count_deleted(self, count: int):
+        self.deleted += count
+        REGISTRY.inc("emoji_moderation_deleted_total", count)
 
-    re_chars = re.compile(r"[a-z0-9\.\-=\*\&\^%\$\#@!`\~\?]")
-    if re_chars.search(message_content):
-        await message.delete()
+    def metrics(self) -> Dict[str, float]:
+        """
+        Gauges of the moderation queue.
+        """
+        return {
+            "emoji_moderation_backlog": self.backlog,
+        }
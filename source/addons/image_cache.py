@@ -0,0 +1,174 @@
+"""
+Content-addressed cache of generated images.
+Images are keyed on a hash of the canonical txt2img payload (prompt, negative
+prompt, steps, checkpoint, seed, ...) and stored as PNG files in a directory
+bounded in size, evicting the least recently used entries.
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+_WHITESPACE = re.compile(r"\s+")
+
+# Payload fields whose whitespace does not change the generated image.
+_TEXT_FIELDS = ("prompt", "negative_prompt")
+
+
+def canonical_payload(payload: Dict[str, Any]) -> str:
+    """
+    Canonical JSON of a txt2img payload: sorted keys, compact separators and
+    collapsed whitespace in the prompts.
+    """
+    payload = dict(payload)
+    for field in _TEXT_FIELDS:
+        if isinstance(payload.get(field), str):
+            payload[field] = _WHITESPACE.sub(" ", payload[field]).strip()
+    return json.dumps(payload, sort_keys=True, separators=(",", ":"))
+
+
+def has_seed(payload: Dict[str, Any]) -> bool:
+    """
+    Whether the payload asks for a fixed seed (A1111 uses -1 for random).
+    """
+    try:
+        return int(payload.get("seed", -1)) >= 0
+    except (TypeError, ValueError):
+        return False
+
+
+class ImageCache:
+    """
+    Size-bounded on-disk LRU cache of generated images.
+    Each entry is stored as `<key>-<n>.png` files; the file mtimes keep the
+    LRU order across restarts.
+    """
+
+    def __init__(self, path: str, max_bytes: int):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[str, List[str]]" = OrderedDict()
+        self._sizes: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        os.makedirs(path, exist_ok=True)
+        self._load_index()
+
+    @property
+    def size(self) -> int:
+        """
+        Bytes currently stored.
+        """
+        return sum(self._sizes.values())
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._entries
+
+    def key_for(self, payload: Dict[str, Any]) -> str:
+        """
+        Cache key of a txt2img payload.
+        """
+        return hashlib.sha256(canonical_payload(payload).encode("utf-8")).hexdigest()
+
+    def _load_index(self):
+        groups: Dict[str, List[str]] = {}
+        touched: Dict[str, float] = {}
+        for name in os.listdir(self.path):
+            key, _, rest = name.partition("-")
+            if len(key) != 64 or not rest[:-4].isdigit() or not rest.endswith(".png"):
+                continue
+            groups.setdefault(key, []).append(name)
+            full = os.path.join(self.path, name)
+            touched[key] = max(touched.get(key, 0.0), os.path.getmtime(full))
+            self._sizes[key] = self._sizes.get(key, 0) + os.path.getsize(full)
+        for key in sorted(groups, key=touched.get):
+            self._entries[key] = sorted(groups[key], key=lambda name: int(name[65:-4]))
+
+    def _get(self, key: str) -> Optional[List[bytes]]:
+        with self._lock:
+            names = self._entries.get(key)
+            if names is None:
+                return None
+            self._entries.move_to_end(key)
+        try:
+            images = []
+            for name in names:
+                full = os.path.join(self.path, name)
+                with open(full, "rb") as file:
+                    images.append(file.read())
+                os.utime(full)
+            return images
+        except OSError as e:
+            logging.error("Error reading cached image %s: %s", key, e)
+            self._delete(key)
+            return None
+
+    def _put(self, key: str, images: List[bytes]):
+        names = [f"{key}-{i}.png" for i in range(len(images))]
+        for name, image in zip(names, images):
+            with open(os.path.join(self.path, name), "wb") as file:
+                file.write(image)
+        with self._lock:
+            self._entries[key] = names
+            self._entries.move_to_end(key)
+            self._sizes[key] = sum(len(image) for image in images)
+        while self.size > self.max_bytes and len(self._entries) > 1:
+            self._delete(next(iter(self._entries)))
+
+    def _delete(self, key: str):
+        with self._lock:
+            names = self._entries.pop(key, [])
+            self._sizes.pop(key, None)
+        for name in names:
+            try:
+                os.remove(os.path.join(self.path, name))
+            except FileNotFoundError:
+                pass
+
+    def lookup(self, key: str) -> bool:
+        """
+        Whether `key` is cached, counting a hit or a miss.
+        """
+        if key in self._entries:
+            self.hits += 1
+            return True
+        self.misses += 1
+        return False
+
+    async def get(self, key: str) -> Optional[List[bytes]]:
+        """
+        Return the cached images of `key`, if any.
+        """
+        return await asyncio.to_thread(self._get, key)
+
+    async def put(self, key: str, images: List[bytes]):
+        """
+        Store images, evicting the least recently used entries if needed.
+        """
+        try:
+            await asyncio.to_thread(self._put, key, images)
+        except OSError as e:
+            logging.error("Error caching image %s: %s", key, e)
+
+    def metrics(self) -> Dict[str, float]:
+        """
+        Gauges and counters of the cache.
+        """
+        lookups = self.hits + self.misses
+        return {
+            "sd_cache_hits_total": self.hits,
+            "sd_cache_misses_total": self.misses,
+            "sd_cache_hit_rate": self.hits / lookups if lookups else 0.0,
+            "sd_cache_entries": len(self),
+            "sd_cache_bytes": self.size,
+        }
@@ -1,45 +1,136 @@
 """
 Client for the AUTOMATIC1111 Stable Diffusion Web UI (txt2img endpoint).
 
-Notes on this refactor:
-- Logic is preserved; only readability and documentation are improved.
-- Added type hints, constants, and clearer variable names.
-- Comments and docstrings are in English.
+Requests go through a pooled keep-alive aiohttp session and bounded job
+queues, since an A1111 server can only run one generation at a time. With
+several servers, each job is dispatched to the healthy node expected to
+finish it first (queue depth times recent latency, preferring nodes that
+already have the checkpoint loaded). Jobs expose their queue position, the
+running job can be followed through `/sdapi/v1/progress` and stopped with
+`/sdapi/v1/interrupt`.
 """
 
+import asyncio
 import base64
+import itertools
 import json
 import logging
-import os
-import random
-import functools
-import typing
-import asyncio
+import time
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, Sequence
+
+import aiohttp
 
-from typing import Any, Dict, Optional
+from addons.image_cache import ImageCache, has_seed
+from core.metrics import REGISTRY
+
+
+class SDQueueFullError(Exception):
+    """
+    Raised when the job queue of the Stable Diffusion server is full.
+    """
+
+
+class SDJob:
+    """
+    A txt2img request waiting in (or running from) a node queue.
+    """
 
-import requests
+    _ids = itertools.count(1)
+
+    def __init__(self, payload: Dict[str, Any], owner_id: Optional[int] = None):
+        self.id = next(self._ids)
+        self.payload = payload
+        self.owner_id = owner_id
+        self.node: Optional["SDNode"] = None
+        self.cache_key: Optional[str] = None
+        self.running = False
+        self.cancelled = False
+        self.future: asyncio.Future = asyncio.get_running_loop().create_future()
+
+    @property
+    def checkpoint(self) -> Optional[str]:
+        """
+        Checkpoint the job needs loaded.
+        """
+        return self.payload.get("override_settings", {}).get("sd_model_checkpoint")
+
+    def done(self) -> bool:
+        """
+        Whether the job finished, failed or was cancelled.
+        """
+        return self.future.done()
+
+    async def result(self) -> List[bytes]:
+        """
+        Wait for the job and return the generated PNG images (empty on error).
+        """
+        return await asyncio.shield(self.future)
 
 
-def to_thread(func: typing.Callable):
+class SDNode:
     """
-    Function to run sync functions in a thread pool.
+    One AUTOMATIC1111 server with its own job queue and health state.
     """
 
-    @functools.wraps(func)
-    async def wrapper(*args, **kwargs):
-        return await asyncio.to_thread(func, *args, **kwargs)
+    # Weight of the newest generation time in the latency average.
+    EWMA_ALPHA = 0.3
+
+    # Generation time assumed before a node has served any job.
+    DEFAULT_LATENCY_SECONDS = 10.0
+
+    def __init__(self, url: str):
+        self.url = url
+        self.queue: Deque[SDJob] = deque()
+        self.running: Dict[int, SDJob] = {}
+        self.workers: List[asyncio.Task] = []
+        self.wakeup = asyncio.Event()
+        self.healthy = True
+        self.failures = 0
+        self.checkpoint: Optional[str] = None
+        self.latency: Optional[float] = None
+
+    @property
+    def load(self) -> int:
+        """
+        Jobs queued or running on the node.
+        """
+        return len(self.queue) + len(self.running)
+
+    def has_checkpoint(self, checkpoint: Optional[str]) -> bool:
+        """
+        Whether `checkpoint` is the model loaded on the node.
+        A1111 reports titles like "name.safetensors [hash]".
+        """
+        if not checkpoint or not self.checkpoint:
+            return False
+        return self.checkpoint == checkpoint or self.checkpoint.startswith(checkpoint)
 
-    return wrapper
+    def expected_wait(self) -> float:
+        """
+        Seconds until a new job would finish on this node.
+        """
+        latency = self.latency or self.DEFAULT_LATENCY_SECONDS
+        return (self.load + 1) * latency
+
+    def observe(self, seconds: float):
+        """
+        Fold a generation time into the latency average.
+        """
+        if self.latency is None:
+            self.latency = seconds
+        else:
+            self.latency += self.EWMA_ALPHA * (seconds - self.latency)
 
 
 class SDClient:
-    """Thin client around AUTOMATIC1111's `/sdapi/v1/txt2img` endpoint.
+    """Async client around AUTOMATIC1111's `/sdapi/v1/txt2img` endpoint.
 
     Parameters
     ----------
-    url : str
-        Base URL of the AUTOMATIC1111 server (without the endpoint path).
+    url : str | Sequence[str]
+        Base URL of the AUTOMATIC1111 server (without the endpoint path), or
+        several of them as a list or a comma-separated string.
     sd_checkpoint : str
         Name or identifier of the SD checkpoint to load (as in Web UI).
     steps : int
@@ -47,82 +138,324 @@ class SDClient:
     negative_prompt_path : str | None, optional
         Path to a text file containing a default negative prompt. If provided,
         it will be used when `inverse_prompt` is not passed to `txt2img`.
+    max_queue : int, optional
+        Maximum number of jobs waiting for each server.
+    concurrency : int, optional
+        Jobs sent to each server at the same time (A1111 runs them one by one).
+    health_interval_seconds : float, optional
+        Time between health checks when there are several servers.
+    cache : ImageCache | None, optional
+        Cache of generated images. Only requests with a fixed seed are cached.
+    pin_seed : int | None, optional
+        Seed given to requests without one, so they can be cached too.
     """
 
-    # Endpoint path appended to the provided base URL.
+    # Endpoint paths appended to the provided base URL.
     TXT2IMG_PATH = "/sdapi/v1/txt2img"
-
-    # File naming pattern and simple safeguards used by delete_image.
-    OUTPUT_PREFIX = "output_"
-    OUTPUT_SUFFIX = ".png"
+    PROGRESS_PATH = "/sdapi/v1/progress"
+    INTERRUPT_PATH = "/sdapi/v1/interrupt"
+    OPTIONS_PATH = "/sdapi/v1/options"
 
     # HTTP timeout in seconds (10 minutes). Kept as in original logic.
     DEFAULT_TIMEOUT_SECONDS = 60 * 10
 
+    # Keep-alive connections kept open per server.
+    POOL_SIZE = 4
+
+    # Consecutive failed checks (or requests) before a node is evicted.
+    MAX_FAILURES = 2
+
+    # Extra seconds expected on a node that must load another checkpoint.
+    CHECKPOINT_SWAP_SECONDS = 15.0
+
     def __init__(
         self,
-        url: str,
+        url: str | Sequence[str],
         sd_checkpoint: str,
         steps: int,
         negative_prompt_path: Optional[str] = None,
+        max_queue: int = 10,
+        concurrency: int = 1,
+        health_interval_seconds: float = 30,
+        cache: Optional[ImageCache] = None,
+        pin_seed: Optional[int] = None,
     ) -> None:
-        self.url = f"{url}{self.TXT2IMG_PATH}"
+        urls = url.split(",") if isinstance(url, str) else list(url)
+        self.nodes = [SDNode(u.strip().rstrip("/")) for u in urls if u.strip()]
+        if not self.nodes:
+            raise ValueError("At least one Stable Diffusion URL is required.")
         self.sd_checkpoint = sd_checkpoint
         self.steps = steps
+        self.max_queue = max_queue
+        self.concurrency = concurrency
+        self.health_interval = health_interval_seconds
+        self.cache = cache
+        self.pin_seed = pin_seed
 
         self.negative_prompt: str = ""
         if negative_prompt_path is not None:
             self.negative_prompt = self.load_prompt(negative_prompt_path)
 
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._health_task: Optional[asyncio.Task] = None
+
     # ---------------------------------------------------------------------
-    # Filesystem helpers
+    # Helpers
     # ---------------------------------------------------------------------
-    def delete_image(self, file_name: str) -> None:
-        """Delete a previously generated image file if it matches our pattern.
-
-        This is a safety check to avoid deleting arbitrary files.
-        """
-        if not (
-            file_name.startswith(self.OUTPUT_PREFIX)
-            and file_name.endswith(self.OUTPUT_SUFFIX)
-            and os.path.exists(file_name)
-        ):
-            return
-
-        os.remove(file_name)
-        logging.info("Image deleted: %s", file_name)
-
     def load_prompt(self, prompt_path: str) -> str:
         """Load a prompt from a UTF-8 encoded text file and return it as a string."""
         with open(prompt_path, "r", encoding="utf-8") as file:
             return file.read()
 
+    @staticmethod
+    def _decode_images(payload: Dict[str, Any], images: List[str]) -> List[bytes]:
+        # A1111 prepends a grid image to batches of several images.
+        expected = int(payload.get("batch_size", 1)) * int(payload.get("n_iter", 1))
+        if expected > 0 and len(images) > expected:
+            images = images[-expected:]
+        return [base64.b64decode(image) for image in images]
+
+    # ---------------------------------------------------------------------
+    # HTTP
+    # ---------------------------------------------------------------------
+    def _get_session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(
+                    limit=self.POOL_SIZE * len(self.nodes), keepalive_timeout=60
+                ),
+                timeout=aiohttp.ClientTimeout(total=self.DEFAULT_TIMEOUT_SECONDS),
+            )
+        return self._session
+
+    async def close(self) -> None:
+        """Stop the workers and health checks and close the HTTP session."""
+        if self._health_task is not None:
+            self._health_task.cancel()
+            self._health_task = None
+        for node in self.nodes:
+            for worker in node.workers:
+                worker.cancel()
+            node.workers = []
+        if self._session is not None:
+            await self._session.close()
+
+    async def progress(self, job: SDJob) -> Dict[str, Any]:
+        """Progress of the node running `job` (progress, eta_relative)."""
+        if job.node is None:
+            return {}
+        try:
+            async with self._get_session().get(
+                f"{job.node.url}{self.PROGRESS_PATH}",
+                params={"skip_current_image": "true"},
+                timeout=aiohttp.ClientTimeout(total=10),
+            ) as response:
+                return await response.json()
+        except Exception as e:
+            logging.error("Error reading progress from %s: %s", job.node.url, e)
+            return {}
+
+    async def interrupt(self, node: SDNode) -> None:
+        """Stop the generation running on `node`."""
+        try:
+            async with self._get_session().post(
+                f"{node.url}{self.INTERRUPT_PATH}",
+                timeout=aiohttp.ClientTimeout(total=10),
+            ) as response:
+                response.raise_for_status()
+        except Exception as e:
+            logging.error("Error interrupting generation on %s: %s", node.url, e)
+
+    # ---------------------------------------------------------------------
+    # Health
+    # ---------------------------------------------------------------------
+    async def check_health(self, node: SDNode) -> bool:
+        """Probe `node` and update its health and loaded checkpoint."""
+        try:
+            async with self._get_session().get(
+                f"{node.url}{self.OPTIONS_PATH}",
+                timeout=aiohttp.ClientTimeout(total=5),
+            ) as response:
+                response.raise_for_status()
+                options = await response.json()
+        except Exception as e:
+            if node.healthy:
+                logging.warning(
+                    "Stable Diffusion node %s failed check: %s", node.url, e
+                )
+            self._mark_failure(node)
+            return False
+
+        node.checkpoint = options.get("sd_model_checkpoint", node.checkpoint)
+        node.failures = 0
+        if not node.healthy:
+            logging.info("Stable Diffusion node %s is back", node.url)
+            node.healthy = True
+        return True
+
+    def _mark_failure(self, node: SDNode):
+        node.failures += 1
+        if node.healthy and node.failures >= self.MAX_FAILURES:
+            logging.warning("Evicting Stable Diffusion node %s", node.url)
+            node.healthy = False
+            self._redispatch(node)
+
+    def _redispatch(self, node: SDNode):
+        """Move the queued jobs of an evicted node to healthy ones."""
+        if not any(n.healthy for n in self.nodes):
+            return
+        while node.queue:
+            job = node.queue.popleft()
+            self._dispatch(job, self._pick_node(job))
+
+    async def _health_loop(self):
+        while True:
+            await asyncio.gather(*(self.check_health(node) for node in self.nodes))
+            await asyncio.sleep(self.health_interval)
+
+    # ---------------------------------------------------------------------
+    # Queue
+    # ---------------------------------------------------------------------
+    def _pick_node(self, job: SDJob) -> SDNode:
+        candidates = [node for node in self.nodes if node.healthy] or self.nodes
+
+        def cost(node: SDNode) -> float:
+            swap = 0.0 if node.has_checkpoint(job.checkpoint) else 1.0
+            return node.expected_wait() + swap * self.CHECKPOINT_SWAP_SECONDS
+
+        return min(candidates, key=cost)
+
+    def _dispatch(self, job: SDJob, node: SDNode):
+        job.node = node
+        node.queue.append(job)
+        node.workers = [w for w in node.workers if not w.done()]
+        while len(node.workers) < self.concurrency:
+            node.workers.append(asyncio.create_task(self._worker(node)))
+        node.wakeup.set()
+
+    def position(self, job: SDJob) -> int:
+        """Jobs ahead of `job` on its node (0 when it is running or done)."""
+        if job.running or job.done() or job.node is None:
+            return 0
+        try:
+            return len(job.node.running) + job.node.queue.index(job)
+        except ValueError:
+            return 0
+
+    def submit(
+        self,
+        prompt: str,
+        inverse_prompt: Optional[str] = None,
+        owner_id: Optional[int] = None,
+    ) -> SDJob:
+        """Queue a generation. Raises SDQueueFullError if the queues are full."""
+        if self._health_task is None and len(self.nodes) > 1:
+            self._health_task = asyncio.create_task(self._health_loop())
+        job = SDJob(self.build_payload(prompt, inverse_prompt), owner_id)
+        if self.cache is not None:
+            if self.pin_seed is not None and not has_seed(job.payload):
+                job.payload["seed"] = self.pin_seed
+            if has_seed(job.payload):
+                job.cache_key = self.cache.key_for(job.payload)
+                if self.cache.lookup(job.cache_key):
+                    asyncio.create_task(self._serve_cached(job))
+                    return job
+        node = self._pick_node(job)
+        if len(node.queue) >= self.max_queue:
+            raise SDQueueFullError("The image generation queue is full.")
+        self._dispatch(job, node)
+        return job
+
+    async def _serve_cached(self, job: SDJob):
+        images = await self.cache.get(job.cache_key)
+        if job.done():
+            return
+        if images:
+            logging.info("Image served from cache: %s", job.cache_key)
+            job.future.set_result(images)
+        else:
+            self._dispatch(job, self._pick_node(job))
+
+    async def cancel(self, job: SDJob) -> None:
+        """Cancel a queued job, or interrupt it if it is already running."""
+        job.cancelled = True
+        if job.running:
+            await self.interrupt(job.node)
+            return
+        if job.node is not None and job in job.node.queue:
+            job.node.queue.remove(job)
+        if not job.done():
+            job.future.set_result([])
+
+    def jobs(self) -> list[SDJob]:
+        """Running and queued jobs of every node."""
+        jobs = []
+        for node in self.nodes:
+            jobs.extend(node.running.values())
+            jobs.extend(node.queue)
+        return jobs
+
+    def metrics(self) -> Dict[str, float]:
+        """Gauges of the node pool and the image cache."""
+        gauges = {
+            "sd_nodes": len(self.nodes),
+            "sd_nodes_healthy": sum(1 for node in self.nodes if node.healthy),
+            "sd_queue_depth": sum(len(node.queue) for node in self.nodes),
+            "sd_running": sum(len(node.running) for node in self.nodes),
+        }
+        if self.cache is not None:
+            gauges.update(self.cache.metrics())
+        return gauges
+
+    async def _worker(self, node: SDNode):
+        while True:
+            if not node.queue:
+                node.wakeup.clear()
+                await node.wakeup.wait()
+                continue
+            job = node.queue.popleft()
+            job.running = True
+            node.running[job.id] = job
+            start = time.monotonic()
+            try:
+                images = await self._generate(node, job.payload)
+            except Exception as e:
+                logging.error("Error generating image: %s", e)
+                images = []
+            finally:
+                job.running = False
+                del node.running[job.id]
+            if images:
+                node.checkpoint = job.checkpoint or node.checkpoint
+            if images and not job.cancelled:
+                # Interrupted jobs return early, their time isn't a latency.
+                elapsed = time.monotonic() - start
+                node.observe(elapsed)
+                REGISTRY.observe("sd_generation_seconds", elapsed, node=node.url)
+            if not job.done():
+                job.future.set_result([] if job.cancelled else images)
+            if images and job.cache_key and not job.cancelled:
+                await self.cache.put(job.cache_key, images)
+
     # ---------------------------------------------------------------------
     # Generation
     # ---------------------------------------------------------------------
-    @to_thread
-    def txt2img(self, prompt: str, inverse_prompt: Optional[str] = None) -> str:
-        """Generate an image from a text prompt.
+    def build_payload(
+        self, prompt: str, inverse_prompt: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """Build the txt2img payload.
 
         The `prompt` may be either a plaintext prompt or a JSON string with
         full AUTOMATIC1111 payload. If JSON is provided, we respect it and only
         ensure the checkpoint and steps are set according to this client.
-
-        Returns
-        -------
-        str
-            Filename of the generated PNG on success, or an empty string on error.
         """
-        is_json = False
         json_payload: Optional[Dict[str, Any]] = None
 
         # Try to detect a JSON-based prompt.
         try:
             json_payload = json.loads(prompt)
-            is_json = True
             logging.info("prompt is json")
         except json.JSONDecodeError:
-            is_json = False
             logging.info("prompt is plain text")
 
         # Default negative prompt if none provided at call time.
@@ -136,7 +469,7 @@ class SDClient:
         )
 
         # Build payload either from provided JSON or from plaintext prompt.
-        if is_json and json_payload is not None:
+        if isinstance(json_payload, dict):
             # Ensure checkpoint and steps are consistent with client config.
             json_payload["override_settings"] = {
                 "sd_model_checkpoint": self.sd_checkpoint,
@@ -147,47 +480,59 @@ class SDClient:
                 )  # keep original behavior
             else:
                 json_payload["steps"] = self.steps
-            payload = json.dumps(json_payload)
-        else:
-            # Drop any hidden-thought prefix if present and keep the visible tail.
-            visible_prompt = prompt.split("</think>")[-1]
-            payload = json.dumps(
-                {
-                    "prompt": visible_prompt,
-                    "negative_prompt": inverse_prompt,
-                    "steps": self.steps,
-                    "override_settings": {
-                        "sd_model_checkpoint": self.sd_checkpoint,
-                    },
-                }
-            )
-
-        headers = {"Content-Type": "application/json"}
+            return json_payload
+
+        # Drop any hidden-thought prefix if present and keep the visible tail.
+        visible_prompt = prompt.split("</think>")[-1]
+        return {
+            "prompt": visible_prompt,
+            "negative_prompt": inverse_prompt,
+            "steps": self.steps,
+            "override_settings": {
+                "sd_model_checkpoint": self.sd_checkpoint,
+            },
+        }
 
-        # Keep the same effective timeout as the original implementation (10 minutes).
-        timeout_seconds = self.DEFAULT_TIMEOUT_SECONDS
+    async def _generate(self, node: SDNode, payload: Dict[str, Any]) -> List[bytes]:
         try:
-            response = requests.request(
-                "POST", self.url, headers=headers, data=payload, timeout=timeout_seconds
-            )
+            async with self._get_session().post(
+                f"{node.url}{self.TXT2IMG_PATH}", json=payload
+            ) as response:
+                if response.status != 200:
+                    logging.error("Error generating image: %s", await response.text())
+                    if response.status >= 500:
+                        self._mark_failure(node)
+                    return []
+                data = await response.json()
+        except aiohttp.ClientConnectionError as e:
+            logging.error("HTTP request to %s failed: %s", node.url, e)
+            self._mark_failure(node)
+            return []
         except Exception as e:
             logging.error("HTTP request failed: %s", e)
-            return ""
+            return []
 
-        if response.status_code != 200:
-            logging.error("Error generating image: %s", response.text)
-            return ""
-
-        # Decode image and persist to disk with a random filename.
+        # Decode the images in memory, off the event loop.
         try:
-            data = response.json()
-            random_number = random.randint(0, 100000)
-            file_name = f"{self.OUTPUT_PREFIX}{random_number}{self.OUTPUT_SUFFIX}"
-            with open(file_name, "wb") as f:
-                f.write(base64.b64decode(data["images"][0]))
+            images = await asyncio.to_thread(
+                self._decode_images, payload, data["images"]
+            )
         except Exception as e:
             logging.error("Error decoding image: %s", e)
-            return ""
+            return []
 
-        logging.info("Image generated: %s", file_name)
-        return file_name
+        logging.info("Image generated on %s: %d image(s)", node.url, len(images))
+        return images
+
+    async def txt2img(
+        self, prompt: str, inverse_prompt: Optional[str] = None
+    ) -> List[bytes]:
+        """Generate images from a text prompt through the job queue.
+
+        Returns
+        -------
+        list[bytes]
+            PNG images (several with `batch_size`/`n_iter`), or an empty list
+            on error.
+        """
+        return await self.submit(prompt, inverse_prompt).result()
@@ -1,5 +1,5 @@
 """
-This module initializes the Discord bot, sets up the OpenAI provider, and handles incoming messages.
+This module initializes the Discord bot, sets up the chat provider, and handles incoming messages.
 It listens for messages, checks if a response is needed, builds the chat context,
 and streams a response back to the channel.
 """
@@ -7,22 +7,62 @@ and streams a response back to the channel.
 import discord
 import asyncio
 from core.config import Settings
-from llm.openai_provider import OpenAIProvider
+from core.config_watcher import ConfigWatcher
+from core.metrics import REGISTRY, JsonLinesSink, PrometheusExporter
+from core.state import build_state_store
+from llm.base import ChatProvider
+from llm.factory import build_provider
 from handlers.message_handler import MessageHandler
 
 intents = discord.Intents.default()
 intents.message_content = True
 
 
+def create_client(settings: Settings) -> discord.Client:
+    """
+    Single-connection client, or an AutoShardedClient when sharding is enabled
+    (all shards, or the shard range given to this process by the launcher).
+    """
+    if not settings.sharded and settings.shard_ids_data is None:
+        return discord.Client(intents=intents)
+    return discord.AutoShardedClient(
+        intents=intents,
+        shard_count=settings.shard_count or None,
+        shard_ids=settings.shard_ids_data,
+    )
+
+
 async def main():
     """
     Main function to initialize the Discord bot and set up the message handler.
     It retrieves settings, initializes the Discord client, and starts listening for messages.
     """
     settings = Settings.get_settings()
-    client = discord.Client(intents=intents)
-    provider: OpenAIProvider | None = None
-    handler: MessageHandler | None = None
+    if settings.metrics_jsonl_path:
+        REGISTRY.add_sink(JsonLinesSink(settings.metrics_jsonl_path))
+    if settings.metrics_port:
+        await PrometheusExporter(REGISTRY, "0.0.0.0", settings.metrics_port).start()
+
+    state_store = build_state_store(settings.state_store_url)
+    client = create_client(settings)
+    # Built before login so the LLM connection is warm for the first reply,
+    # and no message is dropped while waiting for on_ready.
+    provider: ChatProvider = build_provider(settings)
+    warmup = None
+    if getattr(provider, "warmup", None):  # optional for providers
+        warmup = asyncio.create_task(provider.warmup())
+    handler = MessageHandler(settings, provider, None, state_store)
+
+    def apply_settings(new_settings: Settings):
+        nonlocal settings
+        settings = new_settings
+        handler.apply_settings(new_settings)
+
+    # Reload the configuration on file changes or SIGHUP.
+    watcher = ConfigWatcher(
+        settings, apply_settings, settings.config_watch_interval_seconds
+    )
+    watcher.start()
 
     @client.event
     async def on_ready():
@@ -31,24 +71,41 @@ async def main():
                 "Discord client user is not set. Ensure the bot is logged in."
             )
         print(f"Logged as {client.user} (id={client.user.id})")
+        # Also called again after a reconnect, the handler is kept, but events
+        # were missed while disconnected.
+        handler.bot_user = client.user
+        handler.context_cache.invalidate()
 
-        nonlocal provider, handler
-
-        provider = OpenAIProvider(
-            api_key=settings.llm_api_key,
-            model=settings.model,
-            base_url=settings.llm_base_url,
-        )
-        handler = MessageHandler(settings, provider, client.user)
+    @client.event
+    async def on_resumed():
+        # Events of the gap may not all be replayed, fall back to the history.
+        handler.context_cache.invalidate()
 
     @client.event
     async def on_message(message: discord.Message):
-        if not handler:
-            print("Handler is not initialized yet.")
-            return
+        if handler.bot_user is None:
+            # Messages are dispatched while guilds load, before on_ready.
+            handler.bot_user = client.user
         await handler.handle_message(message)
 
-    await client.start(settings.discord_token)
+    @client.event
+    async def on_raw_message_edit(payload: discord.RawMessageUpdateEvent):
+        handler.handle_message_edit(payload)
+
+    @client.event
+    async def on_raw_message_delete(payload: discord.RawMessageDeleteEvent):
+        handler.handle_message_delete(payload)
+
+    @client.event
+    async def on_raw_bulk_message_delete(payload: discord.RawBulkMessageDeleteEvent):
+        handler.handle_bulk_message_delete(payload)
+
+    try:
+        await client.start(settings.discord_token)
+    finally:
+        watcher.stop()
+        if warmup:
+            warmup.cancel()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,99 @@
+"""
+Micro-benchmark of the per-message channel allowlist check.
+Compares the previous approach (`re.search` of every configured entry on
+every message) with the compiled ChannelMatcher, for growing allowlists.
+
+Run from the `source` directory:
+    python -m benchmarks.bench_channel_matcher
+"""
+
+import argparse
+import random
+import re
+import time
+from typing import List, Tuple
+
+from core.channels import ChannelMatcher
+
+
+def make_config(entries: int, rng: random.Random) -> List[str]:
+    """
+    Allowlist of literal `guild:channel` ids with a few per-guild wildcards.
+    """
+    config = []
+    for i in range(entries):
+        guild = rng.randrange(10**17, 10**18)
+        if i % 20 == 0:
+            config.append(f"{guild}:.*")
+        else:
+            config.append(f"{guild}:{rng.randrange(10**17, 10**18)}")
+    return config
+
+
+def make_traffic(
+    config: List[str], messages: int, channels: int, rng: random.Random
+) -> List[Tuple[int, int]]:
+    """
+    (guild, channel) of incoming messages: half allowed, half from elsewhere.
+    """
+    pool = []
+    for i in range(channels):
+        if i % 2 == 0:
+            guild, _, channel = rng.choice(config).partition(":")
+            channel = channel if channel.isdigit() else str(rng.randrange(10**18))
+            pool.append((int(guild), int(channel)))
+        else:
+            pool.append((rng.randrange(10**18), rng.randrange(10**18)))
+    return [rng.choice(pool) for _ in range(messages)]
+
+
+def run_loop(config: List[str], traffic) -> float:
+    """
+    Previous implementation: re.search of every entry per message.
+    """
+    start = time.perf_counter()
+    for guild, channel in traffic:
+        final_id = f"{guild}:{channel}"
+        for pattern in config:
+            if re.search(pattern, final_id):
+                break
+    return time.perf_counter() - start
+
+
+def run_matcher(config: List[str], traffic) -> float:
+    """
+    Compiled matcher, built once like at startup.
+    """
+    matcher = ChannelMatcher(config)
+    start = time.perf_counter()
+    for guild, channel in traffic:
+        matcher.matches(guild, channel)
+    return time.perf_counter() - start
+
+
+def main():
+    """
+    Run the benchmark for growing allowlists and print a table.
+    """
+    args = argparse.ArgumentParser(description=__doc__)
+    args.add_argument("--messages", type=int, default=20000)
+    args.add_argument("--channels", type=int, default=500)
+    args.add_argument("--seed", type=int, default=0)
+    options = args.parse_args()
+    rng = random.Random(options.seed)
+
+    print(f"{'entries':>8} {'loop us/msg':>12} {'matcher us/msg':>15} {'speedup':>8}")
+    for entries in (5, 50, 500):
+        config = make_config(entries, rng)
+        traffic = make_traffic(config, options.messages, options.channels, rng)
+        matcher = ChannelMatcher(config)
+        for guild, channel in traffic[:1000]:
+            expected = any(re.search(p, f"{guild}:{channel}") for p in config)
+            assert matcher.matches(guild, channel) == expected
+        old = run_loop(config, traffic) / options.messages * 1e6
+        new = run_matcher(config, traffic) / options.messages * 1e6
+        print(f"{entries:>8} {old:>12.2f} {new:>15.3f} {old / new:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
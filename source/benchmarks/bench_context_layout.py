@@ -0,0 +1,84 @@
+"""
+Benchmark of the prompt prefix reuse of the context layouts.
+Replays a conversation in one channel and, for every reply, counts the prompt
+tokens shared with the previous prompt of the channel: the part an upstream
+prompt cache (OpenAI prompt caching, llama.cpp/Ollama KV reuse) can serve.
+
+Run from the `source` directory:
+    python -m benchmarks.bench_context_layout
+"""
+
+import argparse
+import asyncio
+import random
+from typing import Dict, List
+
+from core.config import Settings
+from core.context_cache import CachedMessage
+from core.tokens import count_tokens
+from handlers.message_handler import MessageHandler
+from llm.fake_provider import FakeProvider
+
+WORDS = "the bot answers questions about games music code and food every day".split()
+
+
+def shared_prefix_tokens(previous: List[Dict[str, str]], chat: List[Dict[str, str]]):
+    """
+    Tokens of the leading messages two prompts have in common.
+    """
+    tokens = 0
+    for a, b in zip(previous, chat):
+        if a != b:
+            break
+        tokens += count_tokens(b["content"])
+    return tokens
+
+
+async def replay(layout: str, messages: int, window: int, rng: random.Random):
+    """
+    Prompt tokens and reusable prefix tokens over the conversation.
+    """
+    settings = Settings(context_layout=layout, max_context_messages=window)
+    handler = MessageHandler(settings, FakeProvider(), bot_user=None)
+    channel = type("Channel", (), {"id": 1})()
+    buffer: List[CachedMessage] = []
+
+    async def fetch(_):
+        return list(buffer)
+
+    handler._fetch_channel_messages = fetch
+
+    previous: List[Dict[str, str]] = []
+    total = reused = 0
+    for i in range(messages):
+        content = " ".join(rng.choice(WORDS) for _ in range(rng.randint(5, 40)))
+        buffer.append(CachedMessage(i, i % 5, f"user{i % 5}", content))
+        del buffer[:-window]
+        chat, usage = await handler.build_context(channel)
+        total += usage.prompt_tokens
+        reused += shared_prefix_tokens(previous, chat)
+        previous = chat
+    return total, reused
+
+
+def main():
+    """
+    Run the conversation with both layouts and print a table.
+    """
+    args = argparse.ArgumentParser(description=__doc__)
+    args.add_argument("--messages", type=int, default=500)
+    args.add_argument("--window", type=int, default=15)
+    args.add_argument("--seed", type=int, default=0)
+    options = args.parse_args()
+
+    print(f"{'layout':>8} {'prompt tokens':>14} {'cacheable':>10}")
+    for layout in ("sliding", "stable"):
+        rng = random.Random(options.seed)
+        total, reused = asyncio.run(
+            replay(layout, options.messages, options.window, rng)
+        )
+        print(f"{layout:>8} {total:>14} {reused / total:>9.0%}")
+
+
+if __name__ == "__main__":
+    main()
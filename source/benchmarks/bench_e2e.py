@@ -0,0 +1,238 @@
+"""
+Offline end-to-end benchmark of the reply pipeline.
+Drives MessageHandler.handle_message with synthetic traffic across many
+guilds and channels, using FakeProvider as the LLM and fake Discord objects
+that simulate history latency and edit rate limits.
+
+Reports reply latency percentiles, time to first token, edits per reply,
+event-loop lag and memory. With thresholds it works as a regression gate:
+the exit code is 1 when any of them is exceeded.
+
+Run from the `source` directory, e.g.:
+    python -m benchmarks.bench_e2e --messages 200 --rate 2 --max-p95-ms 8000
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import sys
+import time
+import tracemalloc
+from types import SimpleNamespace
+from typing import Any, Dict, List
+
+from benchmarks.fakes import FakeChannel, FakeGuild, FakeUser
+from core.config import Settings
+from core.metrics import REGISTRY
+from handlers.message_handler import MessageHandler
+from llm.fake_provider import FakeProvider
+
+
+class MemorySink:
+    """
+    Keeps finished traces in memory.
+    """
+
+    def __init__(self):
+        self.records: List[Dict[str, Any]] = []
+
+    def emit(self, record: Dict[str, Any]):
+        """
+        Store a trace record.
+        """
+        self.records.append(record)
+
+
+def percentile(values: List[float], p: float) -> float:
+    """
+    Nearest-rank percentile, 0 for an empty list.
+    """
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(p * len(values)))]
+
+
+async def _monitor_loop_lag(samples: List[float], stop: asyncio.Event):
+    interval = 0.01
+    while not stop.is_set():
+        start = time.monotonic()
+        await asyncio.sleep(interval)
+        samples.append(time.monotonic() - start - interval)
+
+
+def build_settings(options: argparse.Namespace) -> Settings:
+    """
+    Settings of the benchmarked bot; every channel is a chat channel.
+    """
+    return Settings(
+        chat_channels=".*",
+        emoji_only_channels="",
+        mention_required=False,
+        base_prompt_path="",
+        sd_url="",
+        edit_min_interval_ms=options.edit_min_interval_ms,
+        edit_min_delta_chars=options.edit_min_delta_chars,
+        llm_max_in_flight=options.max_in_flight,
+        llm_max_queue=options.messages,
+    )
+
+
+async def run(options: argparse.Namespace) -> Dict[str, Any]:
+    """
+    Run one benchmark and return its report.
+    """
+    rng = random.Random(options.seed)
+    sink = MemorySink()
+    REGISTRY.sinks = [sink]
+
+    answer = " ".join(f"word{i}" for i in range(options.answer_tokens))
+    provider = FakeProvider(
+        answer, ttft_ms=options.ttft_ms, tokens_per_second=options.tokens_per_second
+    )
+    bot = FakeUser(1, "bot", bot=True)
+    handler = MessageHandler(build_settings(options), provider, bot)
+
+    guilds = [FakeGuild(100 + i) for i in range(options.guilds)]
+    channels = [
+        FakeChannel(
+            10_000 + i,
+            guilds[i % len(guilds)],
+            history_latency_ms=options.history_latency_ms,
+        )
+        for i in range(options.channels)
+    ]
+    users = [FakeUser(1000 + i, f"user{i}") for i in range(50)]
+    background = set()
+
+    def on_message(message):
+        task = asyncio.create_task(handler.handle_message(message))
+        background.add(task)
+        task.add_done_callback(background.discard)
+
+    def on_edit(message):
+        handler.handle_message_edit(
+            SimpleNamespace(
+                channel_id=message.channel.id,
+                message_id=message.id,
+                data={"content": message.content},
+            )
+        )
+
+    for channel in channels:
+        channel.on_message = on_message
+        channel.on_edit = on_edit
+
+    lag: List[float] = []
+    stop = asyncio.Event()
+    monitor = asyncio.create_task(_monitor_loop_lag(lag, stop))
+    tracemalloc.start()
+    started = time.monotonic()
+
+    for i in range(options.messages):
+        channel = rng.choice(channels)
+        message = channel.post(f"question number {i}?", rng.choice(users))
+        await handler.handle_message(message)
+        await asyncio.sleep(rng.expovariate(options.rate))
+
+    deadline = time.monotonic() + options.timeout
+    while len(sink.records) < options.messages and time.monotonic() < deadline:
+        await asyncio.sleep(0.05)
+
+    elapsed = time.monotonic() - started
+    _, peak_memory = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    stop.set()
+    await monitor
+
+    records = sink.records
+    totals = [r["total_ms"] for r in records if r["status"] == "ok"]
+    ttft = [r["spans_ms"].get("first_token", 0) for r in records]
+    edits = [r.get("edits", 0) for r in records]
+    return {
+        "messages": options.messages,
+        "replies": len(records),
+        "errors": sum(1 for r in records if r["status"] != "ok"),
+        "elapsed_s": round(elapsed, 2),
+        "latency_ms_p50": round(percentile(totals, 0.50), 1),
+        "latency_ms_p95": round(percentile(totals, 0.95), 1),
+        "latency_ms_p99": round(percentile(totals, 0.99), 1),
+        "ttft_ms_p95": round(percentile(ttft, 0.95), 1),
+        "edits_per_reply": round(sum(edits) / len(edits), 2) if edits else 0,
+        "throttled_edits": sum(c.edit_bucket.throttled for c in channels),
+        "history_fetches": sum(c.history_calls for c in channels),
+        "loop_lag_ms_p99": round(percentile(lag, 0.99) * 1000, 2),
+        "loop_lag_ms_max": round(max(lag, default=0) * 1000, 2),
+        "peak_memory_mb": round(peak_memory / 1024 / 1024, 2),
+    }
+
+
+def check(report: Dict[str, Any], options: argparse.Namespace) -> List[str]:
+    """
+    Compare the report with the configured thresholds.
+    """
+    failures = []
+    limits = {
+        "latency_ms_p95": options.max_p95_ms,
+        "ttft_ms_p95": options.max_ttft_p95_ms,
+        "edits_per_reply": options.max_edits_per_reply,
+        "loop_lag_ms_p99": options.max_loop_lag_ms,
+        "peak_memory_mb": options.max_memory_mb,
+    }
+    for key, limit in limits.items():
+        if limit is not None and report[key] > limit:
+            failures.append(f"{key}={report[key]} > {limit}")
+    if report["replies"] < report["messages"]:
+        failures.append(f"only {report['replies']}/{report['messages']} replies")
+    return failures
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    """
+    Command line options.
+    """
+    args = argparse.ArgumentParser(description=__doc__)
+    traffic = args.add_argument_group("traffic")
+    traffic.add_argument("--messages", type=int, default=100)
+    traffic.add_argument("--rate", type=float, default=2, help="messages/second")
+    traffic.add_argument("--guilds", type=int, default=10)
+    traffic.add_argument("--channels", type=int, default=50)
+    traffic.add_argument("--seed", type=int, default=0)
+    traffic.add_argument("--timeout", type=float, default=120)
+
+    backend = args.add_argument_group("fake backends")
+    backend.add_argument("--ttft-ms", type=float, default=300)
+    backend.add_argument("--tokens-per-second", type=float, default=80)
+    backend.add_argument("--answer-tokens", type=int, default=150)
+    backend.add_argument("--history-latency-ms", type=float, default=150)
+
+    bot = args.add_argument_group("bot settings")
+    bot.add_argument("--edit-min-interval-ms", type=int, default=500)
+    bot.add_argument("--edit-min-delta-chars", type=int, default=40)
+    bot.add_argument("--max-in-flight", type=int, default=8)
+
+    gate = args.add_argument_group("regression gate")
+    gate.add_argument("--max-p95-ms", type=float)
+    gate.add_argument("--max-ttft-p95-ms", type=float)
+    gate.add_argument("--max-edits-per-reply", type=float)
+    gate.add_argument("--max-loop-lag-ms", type=float)
+    gate.add_argument("--max-memory-mb", type=float)
+    return args.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    """
+    Run the benchmark, print the report as JSON and apply the gate.
+    """
+    options = parse_args(argv)
+    report = asyncio.run(run(options))
+    print(json.dumps(report, indent=2))
+    failures = check(report, options)
+    for failure in failures:
+        print(f"REGRESSION: {failure}", file=sys.stderr)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
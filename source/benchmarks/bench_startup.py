@@ -0,0 +1,151 @@
+"""
+Startup benchmark of the bot.
+Every run starts a fresh interpreter that imports the bot, builds the provider
+and the message handler the way app.py does, then answers one message from a
+fake channel. Reports the import time, the time to build the handler and the
+time to the first reply since the start of the imports. With --openai the
+OpenAI provider is built too (no request is sent), to measure the cost of the
+openai package when it is configured.
+
+The LLM is a FakeProvider that answers immediately, so the numbers are the
+bot's own startup cost. With thresholds it works as a regression gate: the
+exit code is 1 when any of them is exceeded.
+
+Run from the `source` directory, e.g.:
+    python -m benchmarks.bench_startup --runs 5 --max-first-reply-ms 1500
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from typing import Any, Dict, List
+
+
+def child(openai: bool):
+    """
+    One cold start, run in a fresh interpreter. Prints its timings as JSON.
+    """
+    started = time.perf_counter()
+    import app  # noqa: F401, the imports of the real entry point
+
+    import asyncio
+
+    from benchmarks.fakes import FakeChannel, FakeGuild, FakeUser
+    from core.config import Settings
+    from handlers.message_handler import MessageHandler
+    from llm.factory import build_provider
+
+    imported = time.perf_counter()
+
+    async def first_reply() -> Dict[str, float]:
+        settings = Settings(
+            chat_channels=".*",
+            emoji_only_channels="",
+            mention_required=False,
+            base_prompt_path="",
+            sd_url="",
+            llm_backends=json.dumps([{"type": "fake", "response": "Hello there."}]),
+        )
+        provider = build_provider(settings)
+        handler = MessageHandler(settings, provider, FakeUser(1, "bot", bot=True))
+        built = time.perf_counter()
+
+        channel = FakeChannel(
+            10_000, FakeGuild(100), history_latency_ms=0, request_latency_ms=0
+        )
+        replied = asyncio.Event()
+        channel.on_message = lambda message: replied.set()
+        await handler.handle_message(channel.post("hello?", FakeUser(1000, "user")))
+        await asyncio.wait_for(replied.wait(), timeout=30)
+        timings = {
+            "handler_ms": (built - imported) * 1000,
+            "first_reply_ms": (time.perf_counter() - started) * 1000,
+        }
+        if openai:
+            before = time.perf_counter()
+            build_provider(Settings(llm_backends=""))
+            timings["openai_provider_ms"] = (time.perf_counter() - before) * 1000
+        return timings
+
+    timings = asyncio.run(first_reply())
+    timings["import_ms"] = (imported - started) * 1000
+    print(json.dumps(timings))
+
+
+def run(options: argparse.Namespace) -> Dict[str, Any]:
+    """
+    Run the cold starts and return the median and max of every timing.
+    """
+    command = [sys.executable, "-m", "benchmarks.bench_startup", "--child"]
+    if options.openai:
+        command.append("--openai")
+    runs: List[Dict[str, float]] = []
+    process_ms: List[float] = []
+    for _ in range(options.runs):
+        started = time.perf_counter()
+        output = subprocess.run(
+            command, capture_output=True, text=True, check=True, env=os.environ
+        ).stdout
+        process_ms.append((time.perf_counter() - started) * 1000)
+        runs.append(json.loads(output.strip().splitlines()[-1]))
+
+    report: Dict[str, Any] = {"runs": options.runs}
+    for key in runs[0]:
+        values = [r[key] for r in runs]
+        report[f"{key}_p50"] = round(statistics.median(values), 1)
+        report[f"{key}_max"] = round(max(values), 1)
+    report["process_ms_p50"] = round(statistics.median(process_ms), 1)
+    return report
+
+
+def check(report: Dict[str, Any], options: argparse.Namespace) -> List[str]:
+    """
+    Thresholds exceeded by the report.
+    """
+    failures = []
+    for key, limit in (
+        ("import_ms_p50", options.max_import_ms),
+        ("first_reply_ms_p50", options.max_first_reply_ms),
+    ):
+        if limit is not None and report[key] > limit:
+            failures.append(f"{key}={report[key]} > {limit}")
+    return failures
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    """
+    Command line options.
+    """
+    args = argparse.ArgumentParser(description=__doc__)
+    args.add_argument("--runs", type=int, default=5)
+    args.add_argument("--openai", action="store_true")
+    args.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+
+    gate = args.add_argument_group("regression gate")
+    gate.add_argument("--max-import-ms", type=float)
+    gate.add_argument("--max-first-reply-ms", type=float)
+    return args.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    """
+    Run the benchmark, print the report as JSON and apply the gate.
+    """
+    options = parse_args(argv)
+    if options.child:
+        child(options.openai)
+        return 0
+    report = run(options)
+    print(json.dumps(report, indent=2))
+    failures = check(report, options)
+    for failure in failures:
+        print(f"REGRESSION: {failure}", file=sys.stderr)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
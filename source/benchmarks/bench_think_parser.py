@@ -0,0 +1,87 @@
+"""
+Micro-benchmark of the think-tag handling of streamed replies.
+Compares the previous approach (append every chunk to a string buffer and
+re-scan it whole) with the incremental ThinkTagParser.
+
+Run from the `source` directory:
+    python -m benchmarks.bench_think_parser
+"""
+
+import argparse
+import time
+
+from core.think import ThinkTagParser
+
+
+def _sanitize_visible(output: str) -> str:
+    visible = output.split("</think>")[-1]
+    if "<think>" in output and "</think>" not in output:
+        return ""
+    return visible
+
+
+def make_chunks(think_tokens: int, answer_tokens: int):
+    """
+    Build a stream of small chunks like the ones emitted by reasoning models.
+    """
+    chunks = ["<th", "ink>"]
+    chunks += [f"thought{i} " for i in range(think_tokens)]
+    chunks += ["</thi", "nk>"]
+    chunks += [f"word{i} " for i in range(answer_tokens)]
+    return chunks
+
+
+def run_buffer(chunks, edit_every: int) -> float:
+    """
+    Previous implementation: string concatenation and a full re-scan per chunk.
+    """
+    start = time.perf_counter()
+    buffer = ""
+    for i, chunk in enumerate(chunks, 1):
+        buffer += chunk
+        visible = _sanitize_visible(buffer)
+        if i % edit_every == 0:
+            len(visible)
+    _sanitize_visible(buffer)
+    return time.perf_counter() - start
+
+
+def run_parser(chunks, edit_every: int) -> float:
+    """
+    Incremental parser, materializing the visible text only at edit time.
+    """
+    start = time.perf_counter()
+    parser = ThinkTagParser()
+    for i, chunk in enumerate(chunks, 1):
+        parser.feed(chunk)
+        if i % edit_every == 0:
+            len(parser.text())
+    parser.flush()
+    parser.text()
+    return time.perf_counter() - start
+
+
+def main():
+    """
+    Run the benchmark for growing response sizes and print a table.
+    """
+    args = argparse.ArgumentParser(description=__doc__)
+    args.add_argument("--edit-every", type=int, default=15)
+    args.add_argument("--repeat", type=int, default=5)
+    options = args.parse_args()
+
+    print(
+        f"{'think':>8} {'answer':>8} {'buffer ms':>10} {'parser ms':>10} {'speedup':>8}"
+    )
+    for think_tokens, answer_tokens in ((200, 200), (2000, 500), (8000, 2000)):
+        chunks = make_chunks(think_tokens, answer_tokens)
+        old = min(run_buffer(chunks, options.edit_every) for _ in range(options.repeat))
+        new = min(run_parser(chunks, options.edit_every) for _ in range(options.repeat))
+        print(
+            f"{think_tokens:>8} {answer_tokens:>8} {old * 1000:>10.2f} "
+            f"{new * 1000:>10.2f} {old / new:>7.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
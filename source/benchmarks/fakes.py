@@ -0,0 +1,181 @@
+"""
+Fake Discord objects used by the offline benchmarks.
+They implement the small part of the discord.py API the bot uses, and simulate
+the latency of history fetches and the per-channel rate limit of message
+edits the way discord.py does: by delaying requests once the bucket is empty.
+"""
+
+import asyncio
+import itertools
+import time
+from dataclasses import dataclass, field
+from typing import Callable, List, Optional
+
+_ids = itertools.count(1_000_000)
+
+
+@dataclass
+class FakeUser:
+    """
+    Message author.
+    """
+
+    id: int
+    display_name: str
+    bot: bool = False
+
+
+@dataclass
+class FakeGuild:
+    """
+    Guild (server) of a channel.
+    """
+
+    id: int
+
+
+class _Bucket:
+    """
+    Discord-like fixed window rate limit: `limit` requests per `per` seconds.
+    """
+
+    def __init__(self, limit: int, per: float):
+        self.limit = limit
+        self.per = per
+        self.remaining = limit
+        self.reset_at = 0.0
+        self.throttled = 0
+
+    async def acquire(self):
+        now = time.monotonic()
+        if now >= self.reset_at:
+            self.remaining = self.limit
+            self.reset_at = now + self.per
+        if self.remaining <= 0:
+            self.throttled += 1
+            await asyncio.sleep(self.reset_at - now)
+            self.remaining = self.limit
+            self.reset_at = time.monotonic() + self.per
+        self.remaining -= 1
+
+
+class FakeChannel:
+    """
+    Text channel with a message history and rate-limited message edits.
+    """
+
+    def __init__(
+        self,
+        channel_id: int,
+        guild: FakeGuild,
+        *,
+        history_latency_ms: float = 100,
+        request_latency_ms: float = 30,
+        edits_per_window: int = 5,
+        window_seconds: float = 5,
+    ):
+        self.id = channel_id
+        self.guild = guild
+        self.messages: List["FakeMessage"] = []
+        self.history_latency = history_latency_ms / 1000.0
+        self.request_latency = request_latency_ms / 1000.0
+        self.edit_bucket = _Bucket(edits_per_window, window_seconds)
+        self.history_calls = 0
+        # Gateway events of the bot's own messages, like discord.py dispatches them.
+        self.on_message: Optional[Callable[["FakeMessage"], None]] = None
+        self.on_edit: Optional[Callable[["FakeMessage"], None]] = None
+
+    async def history(
+        self,
+        limit: int | None = 100,
+        oldest_first: bool | None = None,
+        before=None,
+        after=None,
+    ):
+        """
+        Latest messages of the channel, newest first (oldest first after
+        `after`, like discord.py).
+        """
+        self.history_calls += 1
+        await asyncio.sleep(self.history_latency)
+        messages = [
+            m
+            for m in self.messages
+            if (before is None or m.id < before.id)
+            and (after is None or m.id > after.id)
+        ]
+        if oldest_first is None:
+            oldest_first = after is not None
+        if oldest_first:
+            messages = messages[:limit] if limit else messages
+        else:
+            messages = list(reversed(messages[-limit:] if limit else messages))
+        for message in messages:
+            yield message
+
+    async def send(self, content: str, **_) -> "FakeMessage":
+        """
+        Post a new message in the channel.
+        """
+        await asyncio.sleep(self.request_latency)
+        message = self.post(content, FakeUser(0, "bot", bot=True))
+        if self.on_message:
+            self.on_message(message)
+        return message
+
+    def post(self, content: str, author: FakeUser, **kwargs) -> "FakeMessage":
+        """
+        Add a message to the channel without any latency.
+        """
+        message = FakeMessage(next(_ids), content, author, self, **kwargs)
+        self.messages.append(message)
+        return message
+
+
+@dataclass(eq=False)
+class FakeMessage:
+    """
+    Message with the reply/edit/delete API used by the bot.
+    """
+
+    id: int
+    content: str
+    author: FakeUser
+    channel: FakeChannel
+    mentions: List[FakeUser] = field(default_factory=list)
+    edits: int = 0
+    deleted: bool = False
+    reference: Optional["FakeMessage"] = None
+
+    @property
+    def guild(self) -> FakeGuild:
+        """
+        Guild of the message channel.
+        """
+        return self.channel.guild
+
+    async def reply(self, content: str, **_) -> "FakeMessage":
+        """
+        Answer this message.
+        """
+        message = await self.channel.send(content)
+        message.reference = self
+        return message
+
+    async def edit(self, content: str, **_):
+        """
+        Replace the content, waiting like discord.py if the channel bucket is empty.
+        """
+        await self.channel.edit_bucket.acquire()
+        await asyncio.sleep(self.channel.request_latency)
+        self.content = content
+        self.edits += 1
+        if self.channel.on_edit:
+            self.channel.on_edit(self)
+
+    async def delete(self):
+        """
+        Delete the message.
+        """
+        await asyncio.sleep(self.channel.request_latency)
+        self.deleted = True
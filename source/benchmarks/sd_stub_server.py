@@ -0,0 +1,198 @@
+"""
+Stub AUTOMATIC1111 servers for testing the Stable Diffusion client without GPUs.
+Each node implements the txt2img, progress, interrupt and options endpoints,
+runs one generation at a time, takes `step_ms` per sampling step and
+`swap_ms` to load a different checkpoint, and can be taken down and back up
+to exercise health checks.
+
+Run from the `source` directory, e.g. three nodes on ports 7860-7862:
+    python -m benchmarks.sd_stub_server --nodes 3 --step-ms 100
+then set SD_URL=http://127.0.0.1:7860,http://127.0.0.1:7861,http://127.0.0.1:7862
+"""
+
+import argparse
+import asyncio
+import base64
+import struct
+import zlib
+from typing import List, Optional
+
+from aiohttp import web
+
+
+def _tiny_png() -> bytes:
+    def chunk(kind: bytes, data: bytes) -> bytes:
+        body = kind + data
+        return struct.pack(">I", len(data)) + body + struct.pack(">I", zlib.crc32(body))
+
+    header = struct.pack(">IIBBBBB", 1, 1, 8, 2, 0, 0, 0)
+    pixels = zlib.compress(b"\x00\x80\x80\x80")
+    return (
+        b"\x89PNG\r\n\x1a\n"
+        + chunk(b"IHDR", header)
+        + chunk(b"IDAT", pixels)
+        + chunk(b"IEND", b"")
+    )
+
+
+PNG_BASE64 = base64.b64encode(_tiny_png()).decode()
+
+
+class StubNode:
+    """
+    One fake A1111 server.
+    """
+
+    def __init__(
+        self,
+        port: int,
+        *,
+        host: str = "127.0.0.1",
+        step_ms: float = 100,
+        swap_ms: float = 2000,
+        checkpoint: str = "",
+    ):
+        self.host = host
+        self.port = port
+        self.step = step_ms / 1000.0
+        self.swap = swap_ms / 1000.0
+        self.checkpoint = checkpoint
+        self.down = False
+        self.generations = 0
+        self.swaps = 0
+        self._progress = 0.0
+        self._eta = 0.0
+        self._interrupted = False
+        self._lock = asyncio.Lock()
+        self._runner: Optional[web.AppRunner] = None
+
+    @property
+    def url(self) -> str:
+        """
+        Base URL of the node.
+        """
+        return f"http://{self.host}:{self.port}"
+
+    def _app(self) -> web.Application:
+        app = web.Application(middlewares=[self._availability])
+        app.router.add_post("/sdapi/v1/txt2img", self.txt2img)
+        app.router.add_get("/sdapi/v1/progress", self.progress)
+        app.router.add_post("/sdapi/v1/interrupt", self.interrupt)
+        app.router.add_get("/sdapi/v1/options", self.options)
+        return app
+
+    @web.middleware
+    async def _availability(self, request: web.Request, handler):
+        if self.down:
+            raise web.HTTPServiceUnavailable()
+        return await handler(request)
+
+    async def txt2img(self, request: web.Request) -> web.Response:
+        """
+        Sleep like a generation and return placeholder images.
+        """
+        payload = await request.json()
+        steps = int(payload.get("steps", 20))
+        count = int(payload.get("batch_size", 1)) * int(payload.get("n_iter", 1))
+        wanted = payload.get("override_settings", {}).get("sd_model_checkpoint")
+        async with self._lock:
+            self._interrupted = False
+            if wanted and wanted != self.checkpoint:
+                self.swaps += 1
+                await asyncio.sleep(self.swap)
+                self.checkpoint = wanted
+            for step in range(steps):
+                if self._interrupted:
+                    break
+                self._progress = step / steps
+                self._eta = (steps - step) * self.step
+                await asyncio.sleep(self.step)
+            self._progress = self._eta = 0.0
+            self.generations += 1
+        images = [PNG_BASE64] * (count + 1 if count > 1 else 1)
+        return web.json_response({"images": images, "parameters": payload})
+
+    async def progress(self, _: web.Request) -> web.Response:
+        """
+        Progress of the running generation.
+        """
+        return web.json_response(
+            {
+                "progress": self._progress,
+                "eta_relative": self._eta,
+                "current_image": None,
+            }
+        )
+
+    async def interrupt(self, _: web.Request) -> web.Response:
+        """
+        Stop the running generation after the current step.
+        """
+        self._interrupted = True
+        return web.json_response({})
+
+    async def options(self, _: web.Request) -> web.Response:
+        """
+        Loaded checkpoint, as the health check reads it.
+        """
+        return web.json_response({"sd_model_checkpoint": self.checkpoint})
+
+    async def start(self):
+        """
+        Start serving.
+        """
+        self._runner = web.AppRunner(self._app())
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.host, self.port).start()
+
+    async def stop(self):
+        """
+        Stop serving.
+        """
+        if self._runner:
+            await self._runner.cleanup()
+            self._runner = None
+
+
+async def serve(options: argparse.Namespace):
+    """
+    Run the nodes until interrupted.
+    """
+    nodes: List[StubNode] = [
+        StubNode(
+            options.port + i,
+            host=options.host,
+            step_ms=options.step_ms,
+            swap_ms=options.swap_ms,
+        )
+        for i in range(options.nodes)
+    ]
+    for node in nodes:
+        await node.start()
+        print(f"Stub Stable Diffusion node on {node.url}")
+    print("SD_URL=" + ",".join(node.url for node in nodes))
+    try:
+        await asyncio.Event().wait()
+    finally:
+        for node in nodes:
+            await node.stop()
+
+
+def main(argv=None):
+    """
+    Parse the command line and serve.
+    """
+    args = argparse.ArgumentParser(description=__doc__)
+    args.add_argument("--nodes", type=int, default=1)
+    args.add_argument("--host", default="127.0.0.1")
+    args.add_argument("--port", type=int, default=7860)
+    args.add_argument("--step-ms", type=float, default=100)
+    args.add_argument("--swap-ms", type=float, default=2000)
+    try:
+        asyncio.run(serve(args.parse_args(argv)))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
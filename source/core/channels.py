@@ -0,0 +1,58 @@
+"""
+Channel allowlists compiled once at startup.
+Entries are `guild_id:channel_id` strings searched as regular expressions
+(e.g. `123:.*`), except literal ids (e.g. `123:456`) that match exactly: a
+search would also match `9123:4567`. Literal ids go to a set, every other
+entry is merged into a single alternation regex, and per-channel results are
+memoized.
+"""
+
+import re
+from collections import OrderedDict
+from typing import Iterable, Optional, Tuple
+
+_LITERAL_ID = re.compile(r"\d+:\d+")
+
+
+class ChannelMatcher:
+    """
+    Tells whether a `guild_id:channel_id` pair matches any configured entry.
+    """
+
+    def __init__(self, patterns: Iterable[str], memo_size: int = 4096):
+        self.patterns = [p for p in patterns if p]
+        self.memo_size = memo_size
+        self.exact_ids = set()
+        wildcards = []
+        for pattern in self.patterns:
+            if _LITERAL_ID.fullmatch(pattern):
+                self.exact_ids.add(pattern)
+            else:
+                wildcards.append(pattern)
+        self.regex: Optional[re.Pattern] = None
+        if wildcards:
+            self.regex = re.compile("|".join(f"(?:{p})" for p in wildcards))
+        self._memo: "OrderedDict[Tuple[int, int], bool]" = OrderedDict()
+
+    def __bool__(self) -> bool:
+        return bool(self.patterns)
+
+    def _match(self, final_id: str) -> bool:
+        if final_id in self.exact_ids:
+            return True
+        return self.regex is not None and self.regex.search(final_id) is not None
+
+    def matches(self, guild_id: int, channel_id: int) -> bool:
+        """
+        Whether the channel is in the allowlist.
+        """
+        key = (guild_id, channel_id)
+        result = self._memo.get(key)
+        if result is not None:
+            self._memo.move_to_end(key)
+            return result
+        result = self._match(f"{guild_id}:{channel_id}")
+        self._memo[key] = result
+        if len(self._memo) > self.memo_size:
+            self._memo.popitem(last=False)
+        return result
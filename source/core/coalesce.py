@@ -0,0 +1,116 @@
+"""
+Per-channel request coalescing.
+Bursts of messages in the same channel are debounced into a single generation,
+and in-flight generations can be cancelled when a newer message supersedes them.
+"""
+
+import asyncio
+import logging
+from typing import Awaitable, Callable, Dict, Generic, Hashable, Optional, TypeVar
+
+T = TypeVar("T")
+
+
+class _Pending(Generic[T]):
+    def __init__(self, item: T, first_seen: float):
+        self.item = item
+        self.first_seen = first_seen
+        self.deadline = first_seen
+        self.task: asyncio.Task | None = None
+
+
+class ChannelCoalescer(Generic[T]):
+    """
+    Debounces submissions per key (usually a channel id) and runs the job only
+    for the latest item of each burst.
+
+    A burst ends when no new item arrives for `window_ms`. To keep latency
+    bounded under a steady stream of messages, a burst never waits more than
+    `MAX_WINDOWS` windows since its first item.
+
+    `on_dropped(item, reason)` is called for the items whose job never
+    completes: "superseded" when a newer item replaced it while waiting,
+    "cancelled" when its job was cancelled.
+    """
+
+    MAX_WINDOWS = 4
+
+    def __init__(
+        self,
+        window_ms: int,
+        cancel_superseded: bool = False,
+        on_dropped: Optional[Callable[[T, str], None]] = None,
+    ):
+        self.window = window_ms / 1000.0
+        self.cancel_superseded = cancel_superseded
+        self.on_dropped = on_dropped
+        self._pending: Dict[Hashable, _Pending[T]] = {}
+        self._running: Dict[Hashable, asyncio.Task] = {}
+        self.coalesced = 0
+        self.cancelled = 0
+
+    def submit(self, key: Hashable, item: T, job: Callable[[T], Awaitable[None]]):
+        """
+        Schedule `job(item)` for `key`, replacing any item still waiting there.
+        """
+        if self.cancel_superseded:
+            self.cancel(key)
+
+        if self.window <= 0:
+            self._start(key, item, job)
+            return
+
+        now = asyncio.get_running_loop().time()
+        pending = self._pending.get(key)
+        if pending is None:
+            pending = _Pending(item, now)
+            self._pending[key] = pending
+            pending.task = asyncio.create_task(self._wait_and_run(key, job))
+        else:
+            self._dropped(pending.item, "superseded")
+            pending.item = item
+            self.coalesced += 1
+        pending.deadline = min(
+            now + self.window, pending.first_seen + self.window * self.MAX_WINDOWS
+        )
+
+    def cancel(self, key: Hashable) -> bool:
+        """
+        Cancel the in-flight job of `key`, if any.
+        """
+        task = self._running.get(key)
+        if task is None or task.done():
+            return False
+        logging.info("Cancelling superseded generation for %s", key)
+        task.cancel()
+        self.cancelled += 1
+        return True
+
+    async def _wait_and_run(self, key: Hashable, job: Callable[[T], Awaitable[None]]):
+        loop = asyncio.get_running_loop()
+        pending = self._pending[key]
+        while (delay := pending.deadline - loop.time()) > 0:
+            await asyncio.sleep(delay)
+        del self._pending[key]
+        self._start(key, pending.item, job)
+
+    def _start(self, key: Hashable, item: T, job: Callable[[T], Awaitable[None]]):
+        task = asyncio.create_task(job(item))
+        self._running[key] = task
+
+        def _done(finished: asyncio.Task):
+            if self._running.get(key) is finished:
+                del self._running[key]
+            if finished.cancelled():
+                # Also when it was cancelled before it even started.
+                self._dropped(item, "cancelled")
+
+        task.add_done_callback(_done)
+
+    def _dropped(self, item: T, reason: str):
+        if self.on_dropped is None:
+            return
+        try:
+            self.on_dropped(item, reason)
+        except Exception as e:
+            logging.error("Error handling dropped item: %s", e)
@@ -5,10 +5,105 @@ OpenAI API key, model, and other operational settings.
 """
 
 import os
-from dataclasses import dataclass
-from dotenv import load_dotenv
+import re
+from dataclasses import dataclass, field, fields
+from typing import Any, Callable, Dict
+from dotenv import dotenv_values, find_dotenv, load_dotenv
 
-load_dotenv()
+# Variables of the process environment take precedence over the .env file,
+# at startup and when the file is reloaded.
+_PROCESS_ENV = set(os.environ)
+DOTENV_PATH = find_dotenv()
+load_dotenv(DOTENV_PATH)
+_dotenv_names = set(dotenv_values(DOTENV_PATH)) if DOTENV_PATH else set()
+
+# Settings applied to a running bot by a reload. Changes to the others are
+# only picked up by a restart (clients, pools, caches and stores built once).
+RELOADABLE = {
+    "context_layout",
+    "context_token_budget",
+    "reserved_completion_tokens",
+    "edit_min_delta_chars",
+    "safe_edit_length",
+    "edit_min_interval_ms",
+    "channel_edit_burst",
+    "channel_edits_per_second",
+    "coalesce_window_ms",
+    "cancel_superseded",
+    "memory_summary_max_tokens",
+    "rag_top_k",
+    "rag_min_score",
+    "rag_max_tokens",
+    "mention_required",
+    "chat_channels",
+    "emoji_only_channels",
+    "emoji_flush_interval_ms",
+    "base_prompt_path",
+    "sd_progress_interval_ms",
+}
+
+
+def reload_dotenv():
+    """
+    Re-read the .env file into the environment.
+    """
+    global _dotenv_names
+    if not DOTENV_PATH:
+        return
+    values = dotenv_values(DOTENV_PATH)
+    for name, value in values.items():
+        if name not in _PROCESS_ENV and value is not None:
+            os.environ[name] = value
+    for name in _dotenv_names - set(values):
+        if name not in _PROCESS_ENV:
+            os.environ.pop(name, None)
+    _dotenv_names = set(values)
+
+
+def process_environ() -> Dict[str, str]:
+    """
+    The environment without the variables loaded from the .env file, for
+    child processes: they load the file themselves and can then reload it.
+    """
+    return {
+        name: value
+        for name, value in os.environ.items()
+        if name in _PROCESS_ENV or name not in _dotenv_names
+    }
+
+
+def _flag(value: str) -> bool:
+    return value.lower() == "true"
+
+
+def _optional_int(value: str) -> int | None:
+    return int(value) if value else None
+
+
+def env(name: str, default: str | None = None, cast: Callable[[str], Any] = str):
+    """
+    Settings field read from the environment variable `name` each time a
+    Settings is created, so a reload sees the current environment.
+    """
+
+    def read():
+        value = os.getenv(name, default)
+        return value if value is None or cast is str else cast(value)
+
+    return field(default_factory=read)
+
+
+def parse_shard_ids(value: str) -> list[int] | None:
+    """
+    Parse a shard list like "0-3" or "0,2,4"; None when empty.
+    """
+    if not value:
+        return None
+    shard_ids = []
+    for part in value.split(","):
+        first, _, last = part.strip().partition("-")
+        shard_ids.extend(range(int(first), int(last or first) + 1))
+    return shard_ids
 
 
 @dataclass
@@ -17,29 +112,106 @@ class Settings:
     Configuration settings for the Discord bot and OpenAI API.
     """
 
-    discord_token: str = os.getenv("DISCORD_TOKEN", "")
-    llm_base_url: str = os.getenv("LLM_BASE_URL", "")
-    llm_api_key: str = os.getenv("LLM_API_KEY", "")
-    model: str = os.getenv("LLM_MODEL", "gpt-4o-mini")
-    max_context_messages: int = int(os.getenv("MAX_CONTEXT_MESSAGES", "15"))
-    edit_every_n_chunks: int = int(os.getenv("EDIT_EVERY_N_CHUNKS", "15"))
-    min_message_length: int = int(os.getenv("MIN_MESSAGE_LENGTH", "20"))
-    safe_edit_length: int = int(os.getenv("SAFE_EDIT_LENGTH", "1000"))
-    edit_min_interval_ms: int = int(os.getenv("EDIT_MIN_INTERVAL_MS", "500"))
-    mention_required: bool = os.getenv("MENTION_REQUIRED", "false").lower() == "true"
-    chat_channels: str = os.getenv("CHAT_CHANNELS", "")
-    emoji_only_channels: str = os.getenv("EMOJI_ONLY_CHANNELS", "")
-    base_prompt_path: str = os.getenv("BASE_PROMPT_PATH", "default")
-    sd_checkpoint: str | None = os.getenv("SD_CHECKPOINT", None)
-    sd_url: str | None = os.getenv("SD_URL", None)
+    discord_token: str = env("DISCORD_TOKEN", "")
+    llm_base_url: str = env("LLM_BASE_URL", "")
+    llm_api_key: str = env("LLM_API_KEY", "")
+    model: str = env("LLM_MODEL", "gpt-4o-mini")
+    llm_backends: str = env("LLM_BACKENDS", "")
+    llm_first_token_timeout_ms: int = env("LLM_FIRST_TOKEN_TIMEOUT_MS", "20000", int)
+    llm_retries: int = env("LLM_RETRIES", "2", int)
+    llm_connect_timeout_ms: int = env("LLM_CONNECT_TIMEOUT_MS", "5000", int)
+    llm_read_timeout_ms: int = env("LLM_READ_TIMEOUT_MS", "60000", int)
+    llm_max_connections: int = env("LLM_MAX_CONNECTIONS", "100", int)
+    llm_max_keepalive_connections: int = env("LLM_MAX_KEEPALIVE_CONNECTIONS", "20", int)
+    llm_keepalive_expiry_seconds: float = env(
+        "LLM_KEEPALIVE_EXPIRY_SECONDS", "60", float
+    )
+    llm_http2: bool = env("LLM_HTTP2", "false", _flag)
+    llm_stream_flush_ms: int = env("LLM_STREAM_FLUSH_MS", "50", int)
+    llm_stream_flush_chars: int = env("LLM_STREAM_FLUSH_CHARS", "256", int)
+    llm_stream_usage: bool = env("LLM_STREAM_USAGE", "true", _flag)
+    llm_hedge_after_ms: int = env("LLM_HEDGE_AFTER_MS", "0", int)
+    llm_probe_interval_ms: int = env("LLM_PROBE_INTERVAL_MS", "30000", int)
+    # Most history messages in a context; the token budget may keep fewer.
+    max_context_messages: int = env("MAX_CONTEXT_MESSAGES", "50", int)
+    # Latest messages cached per channel to build contexts from.
+    context_candidate_messages: int = env("CONTEXT_CANDIDATE_MESSAGES", "100", int)
+    context_layout: str = env("CONTEXT_LAYOUT", "sliding")
+    context_token_budget: int = env("CONTEXT_TOKEN_BUDGET", "4096", int)
+    reserved_completion_tokens: int = env("RESERVED_COMPLETION_TOKENS", "512", int)
+    edit_min_delta_chars: int = env("EDIT_MIN_DELTA_CHARS", "40", int)
+    min_message_length: int = env("MIN_MESSAGE_LENGTH", "20", int)
+    safe_edit_length: int = env("SAFE_EDIT_LENGTH", "1000", int)
+    edit_min_interval_ms: int = env("EDIT_MIN_INTERVAL_MS", "500", int)
+    channel_edit_burst: float = env("CHANNEL_EDIT_BURST", "5", float)
+    channel_edits_per_second: float = env("CHANNEL_EDITS_PER_SECOND", "1", float)
+    coalesce_window_ms: int = env("COALESCE_WINDOW_MS", "0", int)
+    cancel_superseded: bool = env("CANCEL_SUPERSEDED", "false", _flag)
+    llm_max_in_flight: int = env("LLM_MAX_IN_FLIGHT", "8", int)
+    llm_max_queue: int = env("LLM_MAX_QUEUE", "64", int)
+    llm_drop_policy: str = env("LLM_DROP_POLICY", "reject")
+    response_cache: str = env("RESPONSE_CACHE", "")
+    response_cache_path: str = env("RESPONSE_CACHE_PATH", "response_cache.sqlite3")
+    response_cache_max_entries: int = env("RESPONSE_CACHE_MAX_ENTRIES", "1000", int)
+    response_cache_ttl_seconds: int = env("RESPONSE_CACHE_TTL_SECONDS", "86400", int)
+    response_cache_trailing_messages: int = env(
+        "RESPONSE_CACHE_TRAILING_MESSAGES", "3", int
+    )
+    response_cache_min_chars: int = env("RESPONSE_CACHE_MIN_CHARS", "16", int)
+    response_cache_max_temperature: float = env(
+        "RESPONSE_CACHE_MAX_TEMPERATURE", "0.3", float
+    )
+    memory_path: str = env("MEMORY_PATH", "")
+    memory_summary_batch: int = env("MEMORY_SUMMARY_BATCH", "20", int)
+    memory_summary_max_tokens: int = env("MEMORY_SUMMARY_MAX_TOKENS", "300", int)
+    rag_index_path: str = env("RAG_INDEX_PATH", "")
+    rag_embeddings: str = env("RAG_EMBEDDINGS", "hash")
+    rag_embedding_model: str = env("RAG_EMBEDDING_MODEL", "text-embedding-3-small")
+    rag_dimensions: int = env("RAG_DIMENSIONS", "256", int)
+    rag_top_k: int = env("RAG_TOP_K", "4", int)
+    rag_min_score: float = env("RAG_MIN_SCORE", "0.3", float)
+    rag_min_chars: int = env("RAG_MIN_CHARS", "20", int)
+    rag_max_tokens: int = env("RAG_MAX_TOKENS", "500", int)
+    rag_backfill_messages: int = env("RAG_BACKFILL_MESSAGES", "1000", int)
+    metrics_port: int = env("METRICS_PORT", "0", int)
+    metrics_jsonl_path: str = env("METRICS_JSONL_PATH", "")
+    sharded: bool = env("SHARDED", "false", _flag)
+    shard_count: int = env("SHARD_COUNT", "0", int)
+    shard_ids: str = env("SHARD_IDS", "")
+    state_store_url: str = env("STATE_STORE_URL", "")
+    llm_global_max_in_flight: int = env("LLM_GLOBAL_MAX_IN_FLIGHT", "0", int)
+    discord_global_requests_per_second: float = env(
+        "DISCORD_GLOBAL_REQUESTS_PER_SECOND", "0", float
+    )
+    mention_required: bool = env("MENTION_REQUIRED", "false", _flag)
+    chat_channels: str = env("CHAT_CHANNELS", "")
+    emoji_only_channels: str = env("EMOJI_ONLY_CHANNELS", "")
+    emoji_flush_interval_ms: int = env("EMOJI_FLUSH_INTERVAL_MS", "1000", int)
+    base_prompt_path: str = env("BASE_PROMPT_PATH", "default")
+    sd_checkpoint: str | None = env("SD_CHECKPOINT", None)
+    sd_url: str | None = env("SD_URL", None)
+    sd_health_interval_seconds: float = env("SD_HEALTH_INTERVAL_SECONDS", "30", float)
+    sd_cache_path: str = env("SD_CACHE_PATH", "")
+    sd_cache_max_mb: int = env("SD_CACHE_MAX_MB", "512", int)
+    sd_pin_seed: int | None = env("SD_PIN_SEED", None, _optional_int)
+    sd_max_queue: int = env("SD_MAX_QUEUE", "10", int)
+    sd_progress_interval_ms: int = env("SD_PROGRESS_INTERVAL_MS", "2000", int)
+    context_cache_max_channels: int = env("CONTEXT_CACHE_MAX_CHANNELS", "1000", int)
+    context_cache_ttl_seconds: int = env("CONTEXT_CACHE_TTL_SECONDS", "3600", int)
+    config_watch_interval_seconds: float = env(
+        "CONFIG_WATCH_INTERVAL_SECONDS", "5", float
+    )
 
     def __init__(self, **kwargs):
         """
         Initialize the Settings object with provided keyword arguments.
         """
-        for key, value in kwargs.items():
-            if hasattr(self, key):
-                setattr(self, key, value)
+        for settings_field in fields(self):
+            if settings_field.name in kwargs:
+                value = kwargs[settings_field.name]
+            else:
+                value = settings_field.default_factory()
+            setattr(self, settings_field.name, value)
 
         # Process the chat channels and emoji-only channels
         self.chat_channels_data = (
@@ -49,6 +221,9 @@ class Settings:
             self.emoji_only_channels.split(",") if self.emoji_only_channels else []
         )
 
+        # Shards run by this process, e.g. "0-3" or "0,2,4"
+        self.shard_ids_data = parse_shard_ids(self.shard_ids)
+
         # Load the base prompt from the specified file or use a default prompt
         if os.path.exists(self.base_prompt_path):
             with open(self.base_prompt_path, "r", encoding="utf-8") as file:
@@ -62,9 +237,46 @@ class Settings:
         # Determine if Stable Diffusion is enabled
         self.use_stable_diffusion = self.sd_url is not None and self.sd_url != ""
 
+    def validate(self):
+        """
+        Raise ValueError when a setting can't be used.
+        """
+        if self.context_layout not in ("sliding", "stable"):
+            raise ValueError(f"Unknown CONTEXT_LAYOUT: {self.context_layout}")
+        if self.response_cache not in ("", "memory", "sqlite"):
+            raise ValueError(f"Unknown RESPONSE_CACHE backend: {self.response_cache}")
+        for pattern in self.chat_channels_data + self.emoji_only_channels_data:
+            try:
+                re.compile(pattern)
+            except re.error as e:
+                raise ValueError(f"Invalid channel pattern {pattern!r}: {e}")
+        if self.max_context_messages < 1:
+            raise ValueError("MAX_CONTEXT_MESSAGES must be at least 1.")
+        if self.context_candidate_messages < self.max_context_messages:
+            raise ValueError(
+                "CONTEXT_CANDIDATE_MESSAGES must be at least MAX_CONTEXT_MESSAGES."
+            )
+        if self.context_token_budget <= self.reserved_completion_tokens:
+            raise ValueError(
+                "CONTEXT_TOKEN_BUDGET must be larger than RESERVED_COMPLETION_TOKENS."
+            )
+
     @staticmethod
     def get_settings() -> "Settings":
         """
-        Retrieves the settings for the application from environment variables.
+        Retrieves the settings for the application from environment variables,
+        validated like reloaded ones.
+        """
+        settings = Settings()
+        settings.validate()
+        return settings
+
+    @staticmethod
+    def from_env() -> "Settings":
+        """
+        Re-read the .env file and the prompt file, and return validated settings.
         """
-        return Settings()
+        reload_dotenv()
+        settings = Settings()
+        settings.validate()
+        return settings
@@ -0,0 +1,143 @@
+"""
+Configuration reloading without restart.
+The .env file and the base prompt file are polled for changes, and SIGHUP
+forces a reload. A new Settings snapshot is built and validated, then handed
+to the subscribers in one go; invalid configurations are logged and ignored.
+"""
+
+import asyncio
+import logging
+import os
+import signal
+from dataclasses import fields
+from typing import Callable, Dict, List, Optional
+
+from core.config import DOTENV_PATH, RELOADABLE, Settings
+
+
+class ConfigWatcher:
+    """
+    Watches the configuration files and applies new settings.
+
+    Parameters
+    ----------
+    settings : Settings
+        Settings currently in use.
+    apply : callable
+        Called with the new settings after a successful reload.
+    interval_seconds : float
+        Polling interval of the file modification times, 0 to only reload on
+        SIGHUP.
+    """
+
+    def __init__(
+        self,
+        settings: Settings,
+        apply: Callable[[Settings], None],
+        interval_seconds: float = 5,
+    ):
+        self.settings = settings
+        self.apply = apply
+        self.interval = interval_seconds
+        self.reloads = 0
+        self._mtimes = self._read_mtimes()
+        self._task: Optional[asyncio.Task] = None
+
+    def _paths(self) -> List[str]:
+        paths = [self.settings.base_prompt_path]
+        if DOTENV_PATH:
+            paths.append(DOTENV_PATH)
+        return paths
+
+    def _read_mtimes(self) -> Dict[str, Optional[int]]:
+        mtimes = {}
+        for path in self._paths():
+            try:
+                mtimes[path] = os.stat(path).st_mtime_ns
+            except OSError:
+                mtimes[path] = None
+        return mtimes
+
+    def start(self):
+        """
+        Start polling and handle SIGHUP.
+        """
+        try:
+            asyncio.get_running_loop().add_signal_handler(signal.SIGHUP, self.reload)
+        except (AttributeError, NotImplementedError, RuntimeError):
+            logging.info("SIGHUP is not available, config reloads rely on polling")
+        if self.interval > 0:
+            self._task = asyncio.create_task(self._watch())
+
+    def stop(self):
+        """
+        Stop polling and restore the default SIGHUP handling.
+        """
+        if self._task:
+            self._task.cancel()
+        try:
+            asyncio.get_running_loop().remove_signal_handler(signal.SIGHUP)
+        except (AttributeError, NotImplementedError, RuntimeError):
+            pass
+
+    async def _watch(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            mtimes = self._read_mtimes()
+            if mtimes != self._mtimes:
+                self.reload()
+
+    def reload(self) -> bool:
+        """
+        Build new settings and apply them. Returns whether they were applied.
+        """
+        self._mtimes = self._read_mtimes()
+        try:
+            settings = Settings.from_env()
+        except Exception as e:
+            logging.error("Invalid configuration, keeping the current one: %s", e)
+            return False
+
+        changed = [
+            f.name
+            for f in fields(Settings)
+            if getattr(settings, f.name) != getattr(self.settings, f.name)
+        ]
+        restart = [name for name in changed if name not in RELOADABLE]
+        if restart:
+            logging.warning(
+                "Configuration changes that need a restart: %s", ", ".join(restart)
+            )
+        # Settings that need a restart keep their current values, so the
+        # snapshot matches the clients and stores actually running.
+        settings = Settings(
+            **{
+                f.name: getattr(
+                    settings if f.name in RELOADABLE else self.settings, f.name
+                )
+                for f in fields(Settings)
+            }
+        )
+        try:
+            # The mix of old and new values must hold together too.
+            settings.validate()
+        except ValueError as e:
+            logging.error("Invalid configuration, keeping the current one: %s", e)
+            return False
+        changed = [name for name in changed if name in RELOADABLE]
+        if settings.base_prompt != self.settings.base_prompt:
+            changed.append("base prompt")
+        if not changed:
+            return False
+
+        try:
+            self.apply(settings)
+        except Exception as e:
+            logging.exception("Error applying the new configuration: %s", e)
+            return False
+        self.settings = settings
+        # The prompt path may have changed.
+        self._mtimes = self._read_mtimes()
+        self.reloads += 1
+        logging.info("Configuration reloaded, changed: %s", ", ".join(changed))
+        return True
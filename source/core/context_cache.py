@@ -0,0 +1,196 @@
+"""
+In-memory per-channel message cache used to build chat contexts.
+It keeps a ring buffer of the latest messages of every active channel, updated
+from gateway events, so replies don't need a `channel.history` round trip.
+Idle channels are evicted with an LRU + TTL policy to keep memory bounded.
+"""
+
+import time
+from collections import OrderedDict, deque
+from dataclasses import dataclass
+from typing import Deque, Iterable, List, Optional
+
+import discord
+
+
+@dataclass
+class CachedMessage:
+    """
+    Lightweight snapshot of the parts of a Discord message used in the context.
+    """
+
+    id: int
+    author_id: int
+    author_name: str
+    content: str
+    # Token count of the rendered context entry, computed lazily and reset on edit.
+    tokens: Optional[int] = None
+
+    @classmethod
+    def from_message(cls, message: discord.Message) -> "CachedMessage":
+        """
+        Build a snapshot from a discord.py message object.
+        """
+        return cls(
+            id=message.id,
+            author_id=message.author.id,
+            author_name=message.author.display_name,
+            content=message.content or "",
+        )
+
+
+class _ChannelBuffer:
+    """
+    Ring buffer with the latest messages of a single channel.
+    A buffer is "warm" once it has been seeded from the channel history, before
+    that it may be missing older messages and can't be trusted on its own.
+    """
+
+    def __init__(self, max_messages: int):
+        self.messages: Deque[CachedMessage] = deque(maxlen=max_messages)
+        self.warm = False
+        self.touched = time.monotonic()
+
+    def find(self, message_id: int) -> Optional[CachedMessage]:
+        """
+        Return the cached message with the given id, if present.
+        """
+        for cached in reversed(self.messages):
+            if cached.id == message_id:
+                return cached
+        return None
+
+
+class ChannelContextCache:
+    """
+    LRU/TTL bounded collection of per-channel ring buffers.
+    """
+
+    def __init__(self, max_messages: int, max_channels: int, ttl_seconds: float):
+        self.max_messages = max_messages
+        self.max_channels = max_channels
+        self.ttl_seconds = ttl_seconds
+        self._channels: "OrderedDict[int, _ChannelBuffer]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._channels)
+
+    def _expired(self, buffer: _ChannelBuffer, now: float) -> bool:
+        return self.ttl_seconds > 0 and (now - buffer.touched) > self.ttl_seconds
+
+    def _evict(self, now: float):
+        # Channels are kept in LRU order, so expired ones are always at the front.
+        while self._channels:
+            oldest = next(iter(self._channels.values()))
+            if len(self._channels) <= self.max_channels and not self._expired(
+                oldest, now
+            ):
+                break
+            self._channels.popitem(last=False)
+
+    def _touch(self, channel_id: int, *, create: bool) -> Optional[_ChannelBuffer]:
+        now = time.monotonic()
+        buffer = self._channels.get(channel_id)
+        if buffer is not None and self._expired(buffer, now):
+            del self._channels[channel_id]
+            buffer = None
+
+        if buffer is None:
+            if not create:
+                return None
+            buffer = _ChannelBuffer(self.max_messages)
+            self._channels[channel_id] = buffer
+
+        buffer.touched = now
+        self._channels.move_to_end(channel_id)
+        self._evict(now)
+        return buffer
+
+    def get(self, channel_id: int) -> Optional[List[CachedMessage]]:
+        """
+        Return the cached messages of a channel, oldest first.
+        Returns None on a cold start or after a gap, when the caller must fall
+        back to the channel history and `seed` the cache with it.
+        """
+        buffer = self._touch(channel_id, create=False)
+        if buffer is None or not buffer.warm:
+            return None
+        return list(buffer.messages)
+
+    def seed(self, channel_id: int, messages: Iterable[CachedMessage]):
+        """
+        Replace the buffer of a channel with messages fetched from its history
+        (oldest first) and mark it as warm. Messages added while the history
+        was being fetched are newer than it, and are kept after it.
+        """
+        buffer = self._touch(channel_id, create=True)
+        messages = list(messages)
+        newest = messages[-1].id if messages else 0
+        pending = [m for m in buffer.messages if m.id > newest]
+        buffer.messages.clear()
+        buffer.messages.extend(messages)
+        buffer.messages.extend(pending)
+        buffer.warm = True
+
+    def add(self, message: discord.Message):
+        """
+        Append a new message to its channel buffer.
+        """
+        buffer = self._touch(message.channel.id, create=True)
+        cached = CachedMessage.from_message(message)
+        if buffer.messages and cached.id <= buffer.messages[-1].id:
+            existing = buffer.find(cached.id)
+            if existing is not None:
+                existing.content = cached.content
+                existing.tokens = None
+                return
+            # Out of order delivery, the buffer can't be trusted anymore.
+            buffer.warm = False
+        buffer.messages.append(cached)
+
+    def find(self, channel_id: int, message_id: int) -> Optional[CachedMessage]:
+        """
+        Return a cached message, if its channel buffer still holds it.
+        """
+        buffer = self._channels.get(channel_id)
+        return buffer.find(message_id) if buffer is not None else None
+
+    def update(self, channel_id: int, message_id: int, content: str):
+        """
+        Update the content of a cached message after an edit.
+        """
+        buffer = self._channels.get(channel_id)
+        if buffer is None:
+            return
+        cached = buffer.find(message_id)
+        if cached is not None:
+            cached.content = content
+            cached.tokens = None
+
+    def remove(self, channel_id: int, message_ids: Iterable[int]):
+        """
+        Drop deleted messages from a channel buffer.
+        """
+        buffer = self._channels.get(channel_id)
+        if buffer is None:
+            return
+        deleted = set(message_ids)
+        remaining = [m for m in buffer.messages if m.id not in deleted]
+        if len(remaining) == len(buffer.messages):
+            return
+        buffer.messages.clear()
+        buffer.messages.extend(remaining)
+        # The ring buffer lost entries that only the history can give back.
+        buffer.warm = False
+
+    def invalidate(self, channel_id: Optional[int] = None):
+        """
+        Mark a channel (or every channel) as cold, e.g. after a gateway gap.
+        """
+        buffers = (
+            self._channels.values()
+            if channel_id is None
+            else [self._channels[channel_id]] if channel_id in self._channels else []
+        )
+        for buffer in buffers:
+            buffer.warm = False
@@ -0,0 +1,322 @@
+"""
+Persistent conversation memory.
+The chat context only holds the latest messages of a channel. The turns it
+dropped are kept in a SQLite database and folded, a batch at a time, into a
+rolling summary written by the LLM. The summary is sent ahead of the recent messages,
+so the bot recalls older conversations without paying for them in full.
+
+Turns are written behind the reply path and summaries are refreshed in
+background tasks, so neither adds latency to a reply.
+"""
+
+import asyncio
+import contextlib
+import logging
+import sqlite3
+import threading
+import time
+from typing import (
+    AsyncContextManager,
+    Callable,
+    Dict,
+    Iterable,
+    List,
+    Optional,
+    Set,
+    Tuple,
+)
+
+from core.metrics import REGISTRY
+from core.think import ThinkTagParser
+from core.tokens import count_tokens, truncate_to_tokens
+from llm.base import ChatMessage, ChatProvider
+
+SUMMARY_PROMPT = (
+    "You maintain the memory of a Discord channel. Merge the new messages into "
+    "the summary of the conversation so far. Keep who said what, facts, "
+    "decisions, preferences and open questions; drop small talk. Answer with "
+    "the updated summary only, in at most {words} words."
+)
+
+# Write operations waiting for the next flush: (sql, parameters).
+_Write = Tuple[str, tuple]
+
+
+class ConversationMemory:
+    """
+    Per-channel memory stored in SQLite: the turns not summarized yet, and a
+    rolling summary of the older ones.
+
+    Parameters
+    ----------
+    path : str
+        SQLite database file.
+    provider : ChatProvider
+        Provider used to write the summaries.
+    recent_messages : int
+        Newest turns of a channel left out of the summary until a context was
+        built for it (see `set_context_start`).
+    summary_batch : int
+        Number of turns older than the context that triggers a refresh.
+    summary_max_tokens : int
+        Length limit of a summary.
+    flush_interval_ms : int
+        Delay used to batch the writes of a burst of messages.
+    llm_slot : callable, optional
+        Returns a context manager holding an LLM slot for a summary request,
+        so summaries go through the same concurrency limits as the replies.
+    """
+
+    # Token limit of the new turns sent in one summary request.
+    MAX_INPUT_TOKENS = 3000
+
+    def __init__(
+        self,
+        path: str,
+        provider: ChatProvider,
+        *,
+        recent_messages: int,
+        summary_batch: int = 20,
+        summary_max_tokens: int = 300,
+        flush_interval_ms: int = 1000,
+        llm_slot: Optional[Callable[[], AsyncContextManager[None]]] = None,
+    ):
+        self.provider = provider
+        self.llm_slot = llm_slot or contextlib.nullcontext
+        self.recent_messages = recent_messages
+        self.summary_batch = summary_batch
+        self.summary_max_tokens = summary_max_tokens
+        self.flush_interval = flush_interval_ms / 1000.0
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._db:
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS turns ("
+                "channel_id INTEGER NOT NULL, message_id INTEGER NOT NULL, "
+                "author TEXT NOT NULL, content TEXT NOT NULL, "
+                "PRIMARY KEY (channel_id, message_id))"
+            )
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS summaries ("
+                "channel_id INTEGER PRIMARY KEY, summary TEXT NOT NULL, "
+                "updated_at REAL NOT NULL)"
+            )
+        self._summaries: Dict[int, Optional[str]] = {}
+        self._writes: List[_Write] = []
+        self._touched: Set[int] = set()
+        # Oldest turn of each channel sent in the last built context.
+        self._context_starts: Dict[int, int] = {}
+        self._flush_task: Optional[asyncio.Task] = None
+        self._refreshes: Dict[int, asyncio.Task] = {}
+        self.refreshed = 0
+        self.refresh_failures = 0
+
+    def add(self, channel_id: int, message_id: int, author: str, content: str):
+        """
+        Remember a turn of a channel.
+        """
+        self._write(
+            "INSERT OR REPLACE INTO turns VALUES (?, ?, ?, ?)",
+            (channel_id, message_id, author, content),
+            channel_id,
+        )
+
+    def update(self, channel_id: int, message_id: int, content: str):
+        """
+        Apply an edit to a turn that is not summarized yet.
+        """
+        self._write(
+            "UPDATE turns SET content = ? WHERE channel_id = ? AND message_id = ?",
+            (content, channel_id, message_id),
+        )
+
+    def remove(self, channel_id: int, message_ids: Iterable[int]):
+        """
+        Forget deleted turns that are not summarized yet.
+        """
+        for message_id in message_ids:
+            self._write(
+                "DELETE FROM turns WHERE channel_id = ? AND message_id = ?",
+                (channel_id, message_id),
+            )
+
+    def set_context_start(self, channel_id: int, message_id: int):
+        """
+        Record the oldest turn of a channel sent in its chat context. The
+        older turns, dropped by the token budget or the context layout, are
+        summarized once `summary_batch` of them are waiting.
+        """
+        if self._context_starts.get(channel_id) == message_id:
+            return
+        self._context_starts[channel_id] = message_id
+        self._touched.add(channel_id)
+        self._schedule_flush()
+
+    def _write(self, sql: str, params: tuple, channel_id: Optional[int] = None):
+        self._writes.append((sql, params))
+        if channel_id is not None:
+            self._touched.add(channel_id)
+        self._schedule_flush()
+
+    def _schedule_flush(self):
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.create_task(self._flush())
+
+    async def _flush(self):
+        # Let the burst accumulate, then write it in one transaction.
+        await asyncio.sleep(self.flush_interval)
+        writes, self._writes = self._writes, []
+        touched, self._touched = self._touched, set()
+        starts = {c: self._context_starts.get(c) for c in touched}
+        try:
+            counts = await asyncio.to_thread(self._apply, writes, starts)
+        except Exception as e:
+            logging.error("Error writing conversation memory: %s", e)
+            return
+        for channel_id, count in counts.items():
+            if count >= self.summary_batch:
+                self._schedule_refresh(channel_id)
+
+    def _apply(
+        self, writes: List[_Write], starts: Dict[int, Optional[int]]
+    ) -> Dict[int, int]:
+        """
+        Run the writes, and count the turns older than the context of the
+        touched channels.
+        """
+        with self._lock, self._db:
+            for sql, params in writes:
+                self._db.execute(sql, params)
+            counts = {}
+            for channel_id, start in starts.items():
+                if start is None:
+                    (count,) = self._db.execute(
+                        "SELECT COUNT(*) FROM turns WHERE channel_id = ?",
+                        (channel_id,),
+                    ).fetchone()
+                    counts[channel_id] = count - self.recent_messages
+                else:
+                    (counts[channel_id],) = self._db.execute(
+                        "SELECT COUNT(*) FROM turns "
+                        "WHERE channel_id = ? AND message_id < ?",
+                        (channel_id, start),
+                    ).fetchone()
+            return counts
+
+    async def summary(self, channel_id: int) -> Optional[str]:
+        """
+        Summary of the older turns of a channel, if any.
+        """
+        if channel_id not in self._summaries:
+            self._summaries[channel_id] = await asyncio.to_thread(
+                self._load_summary, channel_id
+            )
+        return self._summaries[channel_id]
+
+    def _load_summary(self, channel_id: int) -> Optional[str]:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT summary FROM summaries WHERE channel_id = ?", (channel_id,)
+            ).fetchone()
+        return row[0] if row else None
+
+    def _schedule_refresh(self, channel_id: int):
+        task = self._refreshes.get(channel_id)
+        if task is None or task.done():
+            self._refreshes[channel_id] = asyncio.create_task(self._refresh(channel_id))
+
+    async def _refresh(self, channel_id: int):
+        """
+        Fold the turns older than the context into the channel summary,
+        oldest first, as many per request as MAX_INPUT_TOKENS allows.
+        """
+        try:
+            turns = await asyncio.to_thread(
+                self._older_turns, channel_id, self._context_starts.get(channel_id)
+            )
+            while turns:
+                started = time.monotonic()
+                batch, tokens = [], 0
+                for message_id, content in turns:
+                    tokens += count_tokens(content)
+                    if batch and tokens > self.MAX_INPUT_TOKENS:
+                        break
+                    batch.append((message_id, content))
+                turns = turns[len(batch) :]
+
+                previous = await self.summary(channel_id)
+                summary = await self._summarize(previous, [c for _, c in batch])
+                if not summary:
+                    raise ValueError("empty summary")
+                await asyncio.to_thread(
+                    self._save_summary, channel_id, summary, [m for m, _ in batch]
+                )
+                self._summaries[channel_id] = summary
+                self.refreshed += 1
+                REGISTRY.observe("memory_refresh_seconds", time.monotonic() - started)
+        except Exception as e:
+            self.refresh_failures += 1
+            logging.error("Error refreshing memory of channel %s: %s", channel_id, e)
+
+    def _older_turns(
+        self, channel_id: int, start: Optional[int]
+    ) -> List[Tuple[int, str]]:
+        with self._lock:
+            if start is not None:
+                return self._db.execute(
+                    "SELECT message_id, author || ' said: ' || content FROM turns "
+                    "WHERE channel_id = ? AND message_id < ? ORDER BY message_id",
+                    (channel_id, start),
+                ).fetchall()
+            return self._db.execute(
+                "SELECT message_id, author || ' said: ' || content FROM turns "
+                "WHERE channel_id = ? "
+                "ORDER BY message_id DESC LIMIT -1 OFFSET ?",
+                (channel_id, self.recent_messages),
+            ).fetchall()[::-1]
+
+    async def _summarize(self, previous: Optional[str], turns: List[str]) -> str:
+        words = int(self.summary_max_tokens * 0.75)
+        # Only a single oversized turn can go past the limit.
+        new = truncate_to_tokens("\n".join(turns), self.MAX_INPUT_TOKENS)
+        messages: List[ChatMessage] = [
+            {"role": "system", "content": SUMMARY_PROMPT.format(words=words)},
+            {
+                "role": "user",
+                "content": f"Summary so far:\n{previous or '(empty)'}\n\n"
+                f"New messages:\n{new}",
+            },
+        ]
+        # Reasoning models may think out loud, only the answer is kept.
+        parser = ThinkTagParser()
+        async with self.llm_slot():
+            async for chunk in self.provider.stream_chat(
+                messages, temperature=0.2, max_tokens=self.summary_max_tokens
+            ):
+                parser.feed(chunk)
+        parser.flush()
+        return parser.text().strip()
+
+    def _save_summary(self, channel_id: int, summary: str, message_ids: List[int]):
+        with self._lock, self._db:
+            self._db.execute(
+                "INSERT OR REPLACE INTO summaries VALUES (?, ?, ?)",
+                (channel_id, summary, time.time()),
+            )
+            self._db.executemany(
+                "DELETE FROM turns WHERE channel_id = ? AND message_id = ?",
+                [(channel_id, message_id) for message_id in message_ids],
+            )
+
+    def metrics(self) -> Dict[str, float]:
+        """
+        Gauges and counters of the memory store.
+        """
+        return {
+            "memory_pending_writes": len(self._writes),
+            "memory_refreshes_total": self.refreshed,
+            "memory_refresh_failures_total": self.refresh_failures,
+            "memory_refreshes_running": sum(
+                1 for task in self._refreshes.values() if not task.done()
+            ),
+        }
@@ -0,0 +1,303 @@
+"""
+Lightweight metrics and per-request timing traces.
+Counters, gauges and histograms live in a registry that can be scraped in the
+Prometheus text format, and finished traces are sent to pluggable sinks
+(e.g. a JSON-lines file) so latency regressions can be tracked and alerted on.
+"""
+
+import asyncio
+import itertools
+import json
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional, Protocol, Tuple
+
+# Histogram buckets in seconds, from fast Discord edits to long generations.
+DEFAULT_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+def _labels(labels: Dict[str, Any]) -> Labels:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _escape(value: str) -> str:
+    # Label values escape backslashes, double quotes and line feeds.
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _render_labels(labels: Labels, extra: str = "") -> str:
+    parts = [f'{k}="{_escape(v)}"' for k, v in labels]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class MetricsSink(Protocol):
+    """
+    Destination of finished traces.
+    """
+
+    def emit(self, record: Dict[str, Any]):
+        """
+        Export one trace record.
+        """
+        raise NotImplementedError
+
+
+class JsonLinesSink(MetricsSink):
+    """
+    Appends every trace record as one JSON line to a file.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._file = open(path, "a", encoding="utf-8")
+
+    def emit(self, record: Dict[str, Any]):
+        line = json.dumps(record, ensure_ascii=False, default=str)
+        with self._lock:
+            self._file.write(line + "\n")
+            self._file.flush()
+
+
+class _Histogram:
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.total = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.total += 1
+        self.sum += value
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+
+
+class MetricsRegistry:
+    """
+    In-process store of counters, gauges and histograms.
+    """
+
+    def __init__(self):
+        self.counters: Dict[str, Dict[Labels, float]] = {}
+        self.gauges: Dict[str, Dict[Labels, float]] = {}
+        self.histograms: Dict[str, Dict[Labels, _Histogram]] = {}
+        self.sinks: List[MetricsSink] = []
+        self._collectors: Dict[str, Callable[[], Dict[str, float]]] = {}
+        self._ids = itertools.count(1)
+
+    def inc(self, name: str, value: float = 1, **labels: Any):
+        """
+        Increase a counter.
+        """
+        series = self.counters.setdefault(name, {})
+        key = _labels(labels)
+        series[key] = series.get(key, 0) + value
+
+    def set(self, name: str, value: float, **labels: Any):
+        """
+        Set a gauge.
+        """
+        self.gauges.setdefault(name, {})[_labels(labels)] = value
+
+    def observe(self, name: str, value: float, **labels: Any):
+        """
+        Record a value (in seconds for latencies) in a histogram.
+        """
+        series = self.histograms.setdefault(name, {})
+        key = _labels(labels)
+        if key not in series:
+            series[key] = _Histogram(DEFAULT_BUCKETS)
+        series[key].observe(value)
+
+    def add_collector(self, name: str, collector: Callable[[], Dict[str, float]]):
+        """
+        Register (or replace) a callback returning values read at scrape time:
+        gauges, and counters (running totals) whose names end with `_total`.
+        """
+        self._collectors[name] = collector
+
+    def add_sink(self, sink: MetricsSink):
+        """
+        Send finished traces to `sink`.
+        """
+        self.sinks.append(sink)
+
+    def trace(self, name: str, **fields: Any) -> "Trace":
+        """
+        Start timing a request.
+        """
+        return Trace(self, name, next(self._ids), fields)
+
+    def emit(self, record: Dict[str, Any]):
+        """
+        Send a record to every sink; a failing sink never breaks a reply.
+        """
+        for sink in self.sinks:
+            try:
+                sink.emit(record)
+            except Exception as e:
+                logging.error("Error exporting metrics: %s", e)
+
+    def render_prometheus(self) -> str:
+        """
+        Render every metric in the Prometheus text exposition format.
+        """
+        lines: List[str] = []
+        for collector in list(self._collectors.values()):
+            try:
+                for name, value in collector().items():
+                    if name.endswith("_total"):
+                        self.counters.setdefault(name, {})[()] = value
+                    else:
+                        self.set(name, value)
+            except Exception as e:
+                logging.error("Error collecting metrics: %s", e)
+
+        for name, series in sorted(self.counters.items()):
+            lines.append(f"# TYPE {name} counter")
+            for labels, value in series.items():
+                lines.append(f"{name}{_render_labels(labels)} {value}")
+        for name, series in sorted(self.gauges.items()):
+            lines.append(f"# TYPE {name} gauge")
+            for labels, value in series.items():
+                lines.append(f"{name}{_render_labels(labels)} {value}")
+        for name, series in sorted(self.histograms.items()):
+            lines.append(f"# TYPE {name} histogram")
+            for labels, histogram in series.items():
+                for bound, count in zip(histogram.buckets, histogram.counts):
+                    bucket = _render_labels(labels, f'le="{bound}"')
+                    lines.append(f"{name}_bucket{bucket} {count}")
+                inf = _render_labels(labels, 'le="+Inf"')
+                lines.append(f"{name}_bucket{inf} {histogram.total}")
+                lines.append(f"{name}_sum{_render_labels(labels)} {histogram.sum}")
+                lines.append(f"{name}_count{_render_labels(labels)} {histogram.total}")
+        return "\n".join(lines) + "\n"
+
+
+class Trace:
+    """
+    Timing spans and fields of a single request.
+    Each span is also observed in the `<trace>_<span>_seconds` histogram.
+    """
+
+    def __init__(
+        self, registry: MetricsRegistry, name: str, trace_id: int, fields: Dict
+    ):
+        self.registry = registry
+        self.name = name
+        self.id = trace_id
+        self.fields: Dict[str, Any] = dict(fields)
+        self.spans: Dict[str, float] = {}
+        self.started = time.monotonic()
+        self._finished = False
+
+    def record(self, span: str, seconds: float):
+        """
+        Record the duration of a span measured elsewhere.
+        """
+        self.spans[span] = self.spans.get(span, 0.0) + seconds
+        self.registry.observe(f"{self.name}_{span}_seconds", seconds)
+
+    def mark(self, span: str):
+        """
+        Record the time elapsed since the start of the trace (e.g. first token).
+        """
+        if span not in self.spans:
+            self.record(span, time.monotonic() - self.started)
+
+    @contextmanager
+    def span(self, span: str) -> Iterator[None]:
+        """
+        Time the enclosed block.
+        """
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.record(span, time.monotonic() - start)
+
+    def finish(self, status: str = "ok", **fields: Any):
+        """
+        Close the trace and send it to the sinks.
+        """
+        if self._finished:
+            return
+        self._finished = True
+        total = time.monotonic() - self.started
+        self.fields.update(fields)
+        self.registry.observe(f"{self.name}_seconds", total, status=status)
+        self.registry.inc(f"{self.name}_total", status=status)
+        self.registry.emit(
+            {
+                "trace": self.name,
+                "id": self.id,
+                "time": time.time(),
+                "status": status,
+                "total_ms": round(total * 1000, 3),
+                "spans_ms": {k: round(v * 1000, 3) for k, v in self.spans.items()},
+                **self.fields,
+            }
+        )
+
+
+class PrometheusExporter:
+    """
+    Minimal HTTP endpoint serving the registry in the Prometheus text format.
+    """
+
+    def __init__(self, registry: MetricsRegistry, host: str, port: int):
+        self.registry = registry
+        self.host = host
+        self.port = port
+        self._server: Optional[asyncio.AbstractServer] = None
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            request = await reader.readline()
+            while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+                pass
+            path = request.split(b" ")[1] if request.count(b" ") >= 2 else b"/"
+            if path.split(b"?")[0] == b"/metrics":
+                body = self.registry.render_prometheus().encode("utf-8")
+                status = b"200 OK"
+            else:
+                body = b"Not found\n"
+                status = b"404 Not Found"
+            writer.write(
+                b"HTTP/1.1 " + status + b"\r\n"
+                b"Content-Type: text/plain; version=0.0.4\r\n"
+                b"Content-Length: " + str(len(body)).encode() + b"\r\n"
+                b"Connection: close\r\n\r\n" + body
+            )
+            await writer.drain()
+        except Exception as e:
+            logging.error("Error serving metrics: %s", e)
+        finally:
+            writer.close()
+
+    async def start(self):
+        """
+        Start listening.
+        """
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        logging.info("Serving metrics on %s:%s/metrics", self.host, self.port)
+
+    async def stop(self):
+        """
+        Stop listening.
+        """
+        if self._server:
+            self._server.close()
+            await self._server.wait_closed()
+
+
+# Default registry used across the bot.
+REGISTRY = MetricsRegistry()
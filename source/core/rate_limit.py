@@ -1,11 +1,16 @@
 """
 Rate limiting utilities for asynchronous operations.
 This module provides a Throttle class to limit the rate of operations
-and ensure that a minimum interval is respected between calls.
+and ensure that a minimum interval is respected between calls, and the
+per-channel edit budgets used to stream replies within Discord's rate limits.
 """
 
 import time
 import asyncio
+from collections import OrderedDict
+from typing import Optional
+
+from core.state import SharedRateLimit
 
 
 class Throttle:
@@ -30,3 +35,143 @@ class Throttle:
                 self._last = now
                 return True
             return False
+
+
+class EditBudget:
+    """
+    Shared edit budget of a Discord channel.
+
+    Discord allows roughly `capacity` message edits per `capacity / rate`
+    seconds on a channel, regardless of how many replies are streaming there.
+    The budget is a token bucket shared by every stream of the channel, whose
+    refill rate adapts to the rate-limit signals discord.py reports: a 429 (or
+    `discord.RateLimited`) or an edit that discord.py had to delay halves the
+    rate, while successful edits slowly bring it back.
+    """
+
+    # Edits slower than this were most likely held back by discord.py because
+    # the channel bucket was exhausted.
+    SLOW_EDIT_SECONDS = 1.0
+
+    def __init__(self, capacity: float = 5.0, rate: float = 1.0):
+        self.capacity = capacity
+        self.max_rate = rate
+        self.rate = rate
+        self.tokens = capacity
+        self.active_streams = 0
+        self.rate_limited = 0
+        # Bot-wide request rate shared with the other processes, if any.
+        self.shared: Optional[SharedRateLimit] = None
+        self._updated = time.monotonic()
+        self._blocked_until = 0.0
+
+    def _refill(self, now: float):
+        self.tokens = min(
+            self.capacity, self.tokens + (now - self._updated) * self.rate
+        )
+        self._updated = now
+
+    def interval(self, min_interval: float) -> float:
+        """
+        Minimum time between two edits of one stream, given the streams sharing
+        the channel and the current refill rate.
+        """
+        share = max(1, self.active_streams) / self.rate
+        return max(min_interval, share)
+
+    def delay(self) -> float:
+        """
+        Seconds until an edit could be allowed.
+        """
+        now = time.monotonic()
+        self._refill(now)
+        wait = max(0.0, self._blocked_until - now)
+        if self.tokens < 1:
+            wait = max(wait, (1 - self.tokens) / self.rate)
+        return wait
+
+    def try_acquire(self) -> bool:
+        """
+        Take one edit from the budget if available.
+        """
+        now = time.monotonic()
+        if now < self._blocked_until:
+            return False
+        self._refill(now)
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+    async def acquire(self):
+        """
+        Wait until an edit is available in the budget, and take it.
+        """
+        while not self.try_acquire():
+            await asyncio.sleep(max(self.delay(), 0.01))
+
+    def on_edit(self, duration: float):
+        """
+        Feed back the duration of a successful edit.
+        """
+        if duration >= self.SLOW_EDIT_SECONDS:
+            self.rate = max(self.max_rate / 8, self.rate / 2)
+        else:
+            self.rate = min(self.max_rate, self.rate + self.max_rate / 10)
+
+    def on_rate_limited(self, retry_after: float):
+        """
+        Back off after Discord rejected an edit with a rate limit.
+        """
+        self.rate_limited += 1
+        self.rate = max(self.max_rate / 8, self.rate / 2)
+        self.tokens = 0.0
+        self._blocked_until = max(self._blocked_until, time.monotonic() + retry_after)
+
+
+class EditBudgets:
+    """
+    LRU-bounded registry of per-channel edit budgets.
+    """
+
+    def __init__(
+        self,
+        capacity: float,
+        rate: float,
+        max_channels: int = 1000,
+        shared: Optional[SharedRateLimit] = None,
+    ):
+        self.capacity = capacity
+        self.rate = rate
+        self.max_channels = max_channels
+        self.shared = shared
+        self._budgets: "OrderedDict[int, EditBudget]" = OrderedDict()
+
+    def configure(self, capacity: float, rate: float):
+        """
+        Change the capacity and rate of every budget, e.g. after a reload.
+        """
+        self.capacity = capacity
+        self.rate = rate
+        for budget in self._budgets.values():
+            budget.capacity = capacity
+            budget.max_rate = rate
+            budget.rate = min(budget.rate, rate)
+            budget.tokens = min(budget.tokens, capacity)
+
+    def get(self, channel_id: int) -> EditBudget:
+        """
+        Return the budget of a channel, creating it if needed.
+        """
+        budget = self._budgets.get(channel_id)
+        if budget is None:
+            budget = EditBudget(self.capacity, self.rate)
+            budget.shared = self.shared
+            self._budgets[channel_id] = budget
+        self._budgets.move_to_end(channel_id)
+        while len(self._budgets) > self.max_channels:
+            oldest_id, oldest = next(iter(self._budgets.items()))
+            if oldest.active_streams:
+                break
+            del self._budgets[oldest_id]
+        return budget
@@ -0,0 +1,235 @@
+"""
+Retrieval of earlier channel messages relevant to the message being answered.
+Messages of the chat channels are embedded in batches and stored in a vector
+index. The first time a channel is seen, its history is backfilled in the
+background: the messages missed while the bot was offline (the latest
+`backfill_messages` of them), then older ones, `backfill_messages` per start,
+until the start of the channel is reached.
+"""
+
+import asyncio
+import itertools
+import logging
+import time
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+import discord
+
+from core.metrics import REGISTRY
+from core.vector_index import IndexedMessage, VectorIndex
+from llm.embeddings import EmbeddingProvider
+
+
+class Retriever:
+    """
+    Indexes the messages of the chat channels and searches them.
+
+    Parameters
+    ----------
+    index : VectorIndex
+        Where the embedded messages are stored.
+    embeddings : EmbeddingProvider
+        Provider used to embed messages and queries.
+    top_k : int
+        Number of messages returned by a search.
+    min_score : float
+        Messages less similar to the query than this are not returned.
+    min_chars : int
+        Shorter messages are not indexed.
+    batch_size : int
+        Number of messages embedded per request.
+    flush_interval_ms : int
+        Delay used to batch the messages of a burst.
+    backfill_messages : int
+        Older messages indexed per channel at each start.
+    """
+
+    def __init__(
+        self,
+        index: VectorIndex,
+        embeddings: EmbeddingProvider,
+        *,
+        top_k: int = 4,
+        min_score: float = 0.3,
+        min_chars: int = 20,
+        batch_size: int = 64,
+        flush_interval_ms: int = 500,
+        backfill_messages: int = 1000,
+    ):
+        self.index = index
+        self.embeddings = embeddings
+        self.top_k = top_k
+        self.min_score = min_score
+        self.min_chars = min_chars
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval_ms / 1000.0
+        self.backfill_messages = backfill_messages
+        # Messages to embed by (channel, message) id, a newer version of a
+        # message replaces the queued one. An author of None marks an edit of
+        # an indexed message.
+        self._pending: Dict[Tuple[int, int], IndexedMessage] = {}
+        self._removals: List[Tuple[int, List[int]]] = []
+        self._flush_task: Optional[asyncio.Task] = None
+        self._backfills: Dict[int, asyncio.Task] = {}
+        self.indexed = 0
+
+    def add(self, message: discord.Message):
+        """
+        Queue a new message for indexing, and backfill its channel if needed.
+        """
+        if message.channel.id not in self._backfills:
+            self._backfills[message.channel.id] = asyncio.create_task(
+                self._backfill(message.channel)
+            )
+        self._queue(
+            IndexedMessage(
+                message.channel.id,
+                message.id,
+                message.author.display_name,
+                message.content or "",
+            )
+        )
+
+    def update(
+        self,
+        channel_id: int,
+        message_id: int,
+        content: str,
+        author: Optional[str] = None,
+    ):
+        """
+        Re-index an edited message. Without its `author`, only messages
+        already indexed are updated.
+        """
+        self._queue(IndexedMessage(channel_id, message_id, author, content))
+
+    def remove(self, channel_id: int, message_ids: Iterable[int]):
+        """
+        Drop deleted messages from the index.
+        """
+        message_ids = list(message_ids)
+        for message_id in message_ids:
+            self._pending.pop((channel_id, message_id), None)
+        self._removals.append((channel_id, message_ids))
+        self._schedule_flush()
+
+    def _queue(self, message: IndexedMessage):
+        if len(message.content) < self.min_chars:
+            return
+        key = (message.channel_id, message.message_id)
+        queued = self._pending.pop(key, None)
+        if message.author is None and queued is not None:
+            message.author = queued.author
+        self._pending[key] = message
+        self._schedule_flush()
+
+    def _schedule_flush(self):
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.create_task(self._flush())
+
+    async def _flush(self):
+        # Let the burst accumulate, then embed it batch by batch.
+        await asyncio.sleep(self.flush_interval)
+        while self._removals:
+            channel_id, message_ids = self._removals.pop(0)
+            try:
+                await asyncio.to_thread(self.index.remove, channel_id, message_ids)
+            except Exception as e:
+                logging.error("Error removing messages from the index: %s", e)
+        while self._pending:
+            keys = list(itertools.islice(self._pending, self.batch_size))
+            batch = [self._pending.pop(key) for key in keys]
+            try:
+                await self._index(batch)
+            except Exception as e:
+                logging.error("Error indexing %d messages: %s", len(batch), e)
+
+    async def _index(self, batch: List[IndexedMessage]):
+        for message in batch:
+            if message.author is None:
+                message.author = await asyncio.to_thread(
+                    self.index.author, message.channel_id, message.message_id
+                )
+        batch = [m for m in batch if m.author is not None]
+        if not batch:
+            return
+        started = time.monotonic()
+        vectors = await self.embeddings.embed(
+            [f"{m.author} said: {m.content}" for m in batch]
+        )
+        REGISTRY.observe("rag_embed_seconds", time.monotonic() - started)
+        await asyncio.to_thread(self.index.add, batch, vectors)
+        self.indexed += len(batch)
+        REGISTRY.inc("rag_indexed_total", len(batch))
+
+    async def _backfill(self, channel):
+        """
+        Index the messages missed while offline, then older history.
+        After a long downtime only the latest missed messages are indexed.
+        """
+        try:
+            oldest, newest = await asyncio.to_thread(self.index.message_ids, channel.id)
+            if newest is not None:
+                await self._backfill_range(
+                    channel,
+                    after=discord.Object(newest),
+                    oldest_first=False,
+                    limit=self.backfill_messages,
+                )
+            if await asyncio.to_thread(self.index.backfill_done, channel.id):
+                return
+            before = discord.Object(oldest) if oldest is not None else None
+            fetched = await self._backfill_range(
+                channel, before=before, limit=self.backfill_messages
+            )
+            if fetched < self.backfill_messages:
+                await asyncio.to_thread(self.index.set_backfill_done, channel.id)
+        except discord.HTTPException as e:
+            logging.error("Error backfilling channel %s: %s", channel.id, e)
+        except Exception as e:
+            logging.exception("Error backfilling channel %s: %s", channel.id, e)
+
+    async def _backfill_range(self, channel, limit: Optional[int], **kwargs) -> int:
+        fetched = 0
+        async for message in channel.history(limit=limit, **kwargs):
+            fetched += 1
+            if not message.content or await asyncio.to_thread(
+                self.index.contains, channel.id, message.id
+            ):
+                continue
+            self._queue(
+                IndexedMessage(
+                    channel.id,
+                    message.id,
+                    message.author.display_name,
+                    message.content,
+                )
+            )
+        REGISTRY.inc("rag_backfilled_total", fetched)
+        return fetched
+
+    async def search(
+        self, channel_id: int, query: str, exclude: Set[int] = frozenset()
+    ) -> List[IndexedMessage]:
+        """
+        Messages of a channel relevant to `query`, most similar first.
+        """
+        started = time.monotonic()
+        (vector,) = await self.embeddings.embed([query])
+        found = await asyncio.to_thread(
+            self.index.search, channel_id, vector, self.top_k, exclude
+        )
+        REGISTRY.observe("rag_query_seconds", time.monotonic() - started)
+        return [m for m in found if m.score >= self.min_score]
+
+    def metrics(self) -> Dict[str, float]:
+        """
+        Gauges of the retrieval index.
+        """
+        return {
+            "rag_entries": self.index.entries,
+            "rag_pending": len(self._pending),
+            "rag_backfills_running": sum(
+                1 for task in self._backfills.values() if not task.done()
+            ),
+        }
@@ -0,0 +1,210 @@
+"""
+Global concurrency limiter for LLM calls.
+It caps the number of in-flight generations, queues the rest in a bounded
+queue with a drop policy, and serves queued requests round-robin across keys
+(guilds) so one noisy server can't starve the others. Background requests
+(e.g. memory summaries) only get a slot when no reply is waiting for one.
+"""
+
+import asyncio
+import contextlib
+import logging
+import time
+from collections import OrderedDict, deque
+from typing import Any, AsyncIterator, Deque, Dict, Hashable
+
+DROP_REJECT = "reject"
+DROP_OLDEST = "drop_oldest"
+
+
+class QueueFullError(Exception):
+    """
+    Raised when a request can't be queued or is dropped from the queue.
+    """
+
+
+class _Waiter:
+    __slots__ = ("future", "enqueued_at")
+
+    def __init__(self, future: asyncio.Future):
+        self.future = future
+        self.enqueued_at = time.monotonic()
+
+
+class FairScheduler:
+    """
+    Fair-share slot scheduler.
+
+    Parameters
+    ----------
+    max_in_flight : int
+        Maximum number of concurrent slots.
+    max_queue : int
+        Maximum number of requests waiting for a slot.
+    drop_policy : str
+        What to do when the queue is full: "reject" refuses the new request,
+        "drop_oldest" drops the oldest request of the busiest key instead.
+    """
+
+    # Number of recent wait times kept to compute percentiles.
+    WAIT_SAMPLES = 1000
+
+    def __init__(
+        self, max_in_flight: int, max_queue: int, drop_policy: str = DROP_REJECT
+    ):
+        if drop_policy not in (DROP_REJECT, DROP_OLDEST):
+            raise ValueError(f"Unknown drop policy: {drop_policy}")
+        self.max_in_flight = max_in_flight
+        self.max_queue = max_queue
+        self.drop_policy = drop_policy
+        self.in_flight = 0
+        self.queue_depth = 0
+        self.dropped = 0
+        self._queues: "OrderedDict[Hashable, Deque[_Waiter]]" = OrderedDict()
+        self._background: Deque[_Waiter] = deque()
+        self._wait_times: Deque[float] = deque(maxlen=self.WAIT_SAMPLES)
+
+    @contextlib.asynccontextmanager
+    async def slot(self, key: Hashable) -> AsyncIterator[None]:
+        """
+        Hold a slot for the duration of the block.
+        """
+        await self.acquire(key)
+        try:
+            yield
+        finally:
+            self.release()
+
+    @contextlib.asynccontextmanager
+    async def background_slot(self) -> AsyncIterator[None]:
+        """
+        Hold a slot for a background request for the duration of the block.
+        """
+        await self.acquire_background()
+        try:
+            yield
+        finally:
+            self.release()
+
+    async def acquire_background(self):
+        """
+        Wait for a slot left unused by the replies. Background requests are
+        not bounded by the queue size and never dropped.
+        """
+        if self.in_flight < self.max_in_flight and not self.queue_depth:
+            if not self._background:
+                self.in_flight += 1
+                return
+
+        waiter = _Waiter(asyncio.get_running_loop().create_future())
+        self._background.append(waiter)
+        try:
+            await waiter.future
+        except asyncio.CancelledError:
+            if waiter.future.done() and not waiter.future.cancelled():
+                self.release()
+            elif waiter in self._background:
+                self._background.remove(waiter)
+            raise
+
+    async def acquire(self, key: Hashable):
+        """
+        Wait for a slot. Raises QueueFullError if the request is refused or dropped.
+        """
+        if self.in_flight < self.max_in_flight and not self.queue_depth:
+            self.in_flight += 1
+            self._wait_times.append(0.0)
+            return
+
+        if self.queue_depth >= self.max_queue:
+            if self.drop_policy == DROP_REJECT or not self._drop_oldest():
+                self.dropped += 1
+                raise QueueFullError("The LLM queue is full.")
+
+        waiter = _Waiter(asyncio.get_running_loop().create_future())
+        self._queues.setdefault(key, deque()).append(waiter)
+        self.queue_depth += 1
+        try:
+            await waiter.future
+        except asyncio.CancelledError:
+            if waiter.future.done() and not waiter.future.cancelled():
+                # The slot was granted right before the cancellation.
+                if waiter.future.exception() is None:
+                    self.release()
+            else:
+                self._discard(key, waiter)
+            raise
+        self._wait_times.append(time.monotonic() - waiter.enqueued_at)
+
+    def release(self):
+        """
+        Free a slot and hand it to the next queued request.
+        """
+        self.in_flight -= 1
+        self._dispatch()
+
+    def _dispatch(self):
+        while self.in_flight < self.max_in_flight and self._queues:
+            key, queue = self._queues.popitem(last=False)
+            waiter = queue.popleft()
+            self.queue_depth -= 1
+            if queue:
+                # Rotate the key to the back, so every key gets a turn.
+                self._queues[key] = queue
+            if waiter.future.done():
+                continue
+            self.in_flight += 1
+            waiter.future.set_result(None)
+        while self.in_flight < self.max_in_flight and self._background:
+            waiter = self._background.popleft()
+            if waiter.future.done():
+                continue
+            self.in_flight += 1
+            waiter.future.set_result(None)
+
+    def _drop_oldest(self) -> bool:
+        if not self._queues:
+            return False
+        key = max(self._queues, key=lambda k: len(self._queues[k]))
+        queue = self._queues[key]
+        waiter = queue.popleft()
+        if not queue:
+            del self._queues[key]
+        self.queue_depth -= 1
+        self.dropped += 1
+        logging.warning("LLM queue full, dropping oldest request of %s", key)
+        if not waiter.future.done():
+            waiter.future.set_exception(QueueFullError("Dropped from the LLM queue."))
+        return True
+
+    def _discard(self, key: Hashable, waiter: _Waiter):
+        queue = self._queues.get(key)
+        if queue is None or waiter not in queue:
+            return
+        queue.remove(waiter)
+        self.queue_depth -= 1
+        if not queue:
+            del self._queues[key]
+
+    def metrics(self) -> Dict[str, Any]:
+        """
+        Snapshot of the scheduler state: slots, queue depth and wait times.
+        """
+        waits = sorted(self._wait_times)
+
+        def percentile(p: float) -> float:
+            if not waits:
+                return 0.0
+            return waits[min(len(waits) - 1, int(p * len(waits)))] * 1000
+
+        return {
+            "in_flight": self.in_flight,
+            "max_in_flight": self.max_in_flight,
+            "queue_depth": self.queue_depth,
+            "queued_keys": len(self._queues),
+            "background_queue_depth": len(self._background),
+            "dropped_total": self.dropped,
+            "wait_ms_p50": percentile(0.50),
+            "wait_ms_p95": percentile(0.95),
+            "wait_ms_max": waits[-1] * 1000 if waits else 0.0,
+        }
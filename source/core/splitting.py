@@ -0,0 +1,88 @@
+"""
+Helpers to split long replies into several Discord messages.
+Splits happen at the safest boundary available (paragraph, code fence, line,
+sentence, word) and code blocks are closed and reopened across the split so
+every message renders correctly on its own.
+"""
+
+import re
+from typing import Optional, Tuple
+
+# Hard limit of a Discord message content.
+DISCORD_MAX_LENGTH = 2000
+
+FENCE = "```"
+
+# Room kept in a message to close a code block left open by the split.
+FENCE_CLOSE = "\n" + FENCE
+
+_SENTENCE_END = re.compile(r"[.!?;:][)\"'\]]*\s")
+
+_FENCE_LINE = re.compile(r"^[ \t]*```([^\n`]*)$", re.MULTILINE)
+
+
+def open_fence(text: str) -> Optional[str]:
+    """
+    Return the opening line of the code block left open at the end of `text`
+    (e.g. "```python"), or None if every code block is closed.
+    """
+    opening = None
+    for match in _FENCE_LINE.finditer(text):
+        if opening is None:
+            opening = FENCE + match.group(1).strip()
+        else:
+            opening = None
+    return opening
+
+
+def _split_index(text: str, limit: int) -> int:
+    # Don't accept boundaries that would leave a tiny first message.
+    floor = limit // 2
+    window = text[:limit]
+
+    paragraph = window.rfind("\n\n")
+    if paragraph >= floor:
+        return paragraph + 2
+
+    fences = [m.start() for m in _FENCE_LINE.finditer(window) if m.start() >= floor]
+    if fences:
+        # Split right before a fence line, so the block starts a new message.
+        return fences[-1]
+
+    line = window.rfind("\n")
+    if line >= floor:
+        return line + 1
+
+    sentences = [m.end() for m in _SENTENCE_END.finditer(window) if m.end() >= floor]
+    if sentences:
+        return sentences[-1]
+
+    space = window.rfind(" ")
+    if space >= floor:
+        return space + 1
+
+    return limit
+
+
+def split_message(text: str, limit: int) -> Tuple[str, str, int]:
+    """
+    Split `text` so the first part fits in `limit` characters.
+
+    Returns
+    -------
+    tuple[str, str, int]
+        The first message content, the prefix the next message must start
+        with (a reopened code fence, or ""), and the number of characters of
+        `text` consumed by the first message.
+    """
+    limit -= len(FENCE_CLOSE)
+    index = _split_index(text, limit)
+    head = text[:index].rstrip()
+    consumed = index
+    while consumed < len(text) and text[consumed] == "\n":
+        consumed += 1
+
+    fence = open_fence(head)
+    if fence is None:
+        return head, "", consumed
+    return head + FENCE_CLOSE, fence + "\n", consumed
@@ -0,0 +1,273 @@
+"""
+State shared by the bot processes.
+When the bot runs as several sharded processes, limits that apply to the whole
+bot (LLM backend capacity, Discord's global request rate) must be enforced
+across processes. They go through a StateStore: the in-process store serves a
+single process, the Redis store (any Redis-compatible server) serves several.
+"""
+
+import asyncio
+import contextlib
+import logging
+import random
+import time
+import uuid
+from typing import AsyncIterator, Dict, Optional, Protocol, Tuple
+
+
+class StateStore(Protocol):
+    """
+    Primitives used to coordinate the bot processes.
+    """
+
+    async def acquire_lease(
+        self, name: str, limit: int, ttl_seconds: float
+    ) -> Optional[str]:
+        """
+        Take one of `limit` leases of `name`, or return None if all are taken.
+        A lease not renewed within `ttl_seconds` expires (e.g. after a crash).
+        """
+        raise NotImplementedError
+
+    async def renew_lease(self, name: str, lease: str, ttl_seconds: float):
+        """
+        Extend a lease.
+        """
+        raise NotImplementedError
+
+    async def release_lease(self, name: str, lease: str):
+        """
+        Give a lease back.
+        """
+        raise NotImplementedError
+
+    async def take_token(self, name: str, capacity: float, rate: float) -> float:
+        """
+        Take a token from the `name` bucket. Returns 0 when a token was taken,
+        otherwise the seconds until one is available.
+        """
+        raise NotImplementedError
+
+    async def close(self):
+        """
+        Release the connections of the store.
+        """
+        raise NotImplementedError
+
+
+class MemoryStateStore(StateStore):
+    """
+    Store for a single process.
+    """
+
+    def __init__(self):
+        self._leases: Dict[str, Dict[str, float]] = {}
+        self._buckets: Dict[str, Tuple[float, float]] = {}
+
+    async def acquire_lease(
+        self, name: str, limit: int, ttl_seconds: float
+    ) -> Optional[str]:
+        now = time.monotonic()
+        leases = self._leases.setdefault(name, {})
+        for lease, expires in list(leases.items()):
+            if expires <= now:
+                del leases[lease]
+        if len(leases) >= limit:
+            return None
+        lease = uuid.uuid4().hex
+        leases[lease] = now + ttl_seconds
+        return lease
+
+    async def renew_lease(self, name: str, lease: str, ttl_seconds: float):
+        leases = self._leases.get(name, {})
+        if lease in leases:
+            leases[lease] = time.monotonic() + ttl_seconds
+
+    async def release_lease(self, name: str, lease: str):
+        self._leases.get(name, {}).pop(lease, None)
+
+    async def take_token(self, name: str, capacity: float, rate: float) -> float:
+        now = time.monotonic()
+        tokens, updated = self._buckets.get(name, (capacity, now))
+        tokens = min(capacity, tokens + (now - updated) * rate)
+        if tokens >= 1:
+            self._buckets[name] = (tokens - 1, now)
+            return 0.0
+        self._buckets[name] = (tokens, now)
+        return (1 - tokens) / rate
+
+    async def close(self):
+        pass
+
+
+# Leases are members of a sorted set scored by their expiry time.
+_ACQUIRE_LEASE = """
+local now = tonumber(ARGV[1])
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', now)
+if redis.call('ZCARD', KEYS[1]) >= tonumber(ARGV[2]) then
+    return 0
+end
+redis.call('ZADD', KEYS[1], now + tonumber(ARGV[3]), ARGV[4])
+redis.call('PEXPIRE', KEYS[1], math.ceil(tonumber(ARGV[3]) * 1000))
+return 1
+"""
+
+# Token bucket stored as a hash {tokens, updated}.
+_TAKE_TOKEN = """
+local capacity = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local now = tonumber(ARGV[3])
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+local tokens = tonumber(state[1]) or capacity
+local updated = tonumber(state[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - updated) * rate)
+local wait = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+else
+    wait = (1 - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'updated', now)
+redis.call('PEXPIRE', KEYS[1], math.ceil(capacity / rate * 1000) + 1000)
+return tostring(wait)
+"""
+
+
+class RedisStateStore(StateStore):
+    """
+    Store shared by several processes through a Redis-compatible server.
+    Times come from the server clock, so the processes don't need synced clocks.
+    """
+
+    def __init__(self, url: str, prefix: str = "discord-llm-bot:"):
+        try:
+            import redis.asyncio as redis
+        except ImportError:
+            raise ImportError("The Redis state store needs the redis package.")
+        self.prefix = prefix
+        self._client = redis.from_url(url)
+        self._acquire = self._client.register_script(_ACQUIRE_LEASE)
+        self._take = self._client.register_script(_TAKE_TOKEN)
+
+    async def _now(self) -> float:
+        seconds, microseconds = await self._client.time()
+        return seconds + microseconds / 1_000_000
+
+    async def acquire_lease(
+        self, name: str, limit: int, ttl_seconds: float
+    ) -> Optional[str]:
+        lease = uuid.uuid4().hex
+        acquired = await self._acquire(
+            keys=[self.prefix + name],
+            args=[await self._now(), limit, ttl_seconds, lease],
+        )
+        return lease if acquired else None
+
+    async def renew_lease(self, name: str, lease: str, ttl_seconds: float):
+        key = self.prefix + name
+        expires = await self._now() + ttl_seconds
+        async with self._client.pipeline(transaction=True) as pipe:
+            pipe.zadd(key, {lease: expires}, xx=True)
+            pipe.pexpire(key, int(ttl_seconds * 1000))
+            await pipe.execute()
+
+    async def release_lease(self, name: str, lease: str):
+        await self._client.zrem(self.prefix + name, lease)
+
+    async def take_token(self, name: str, capacity: float, rate: float) -> float:
+        wait = await self._take(
+            keys=[self.prefix + name], args=[capacity, rate, await self._now()]
+        )
+        return float(wait)
+
+    async def close(self):
+        await self._client.aclose()
+
+
+def build_state_store(url: str) -> StateStore:
+    """
+    In-process store for an empty url or "memory", Redis store otherwise.
+    """
+    if not url or url == "memory":
+        return MemoryStateStore()
+    return RedisStateStore(url)
+
+
+class SharedSlots:
+    """
+    Concurrency limit shared by every process using the same store.
+    Held leases are renewed in the background, and expire if a process dies.
+    """
+
+    def __init__(
+        self,
+        store: StateStore,
+        name: str,
+        limit: int,
+        lease_seconds: float = 60,
+        poll_ms: int = 100,
+    ):
+        self.store = store
+        self.name = name
+        self.limit = limit
+        self.lease_seconds = lease_seconds
+        self.poll = poll_ms / 1000.0
+
+    @contextlib.asynccontextmanager
+    async def slot(self) -> AsyncIterator[None]:
+        """
+        Hold a shared slot for the duration of the block.
+        """
+        while True:
+            lease = await self.store.acquire_lease(
+                self.name, self.limit, self.lease_seconds
+            )
+            if lease is not None:
+                break
+            # Jitter spreads the retries of processes waiting for the same slot.
+            await asyncio.sleep(self.poll * random.uniform(0.5, 1.5))
+
+        renewal = asyncio.create_task(self._renew(lease))
+        try:
+            yield
+        finally:
+            renewal.cancel()
+            try:
+                await self.store.release_lease(self.name, lease)
+            except Exception as e:
+                logging.error("Error releasing shared slot %s: %s", self.name, e)
+
+    async def _renew(self, lease: str):
+        while True:
+            await asyncio.sleep(self.lease_seconds / 3)
+            try:
+                await self.store.renew_lease(self.name, lease, self.lease_seconds)
+            except Exception as e:
+                logging.error("Error renewing shared slot %s: %s", self.name, e)
+
+
+class SharedRateLimit:
+    """
+    Token bucket shared by every process using the same store.
+    """
+
+    def __init__(self, store: StateStore, name: str, capacity: float, rate: float):
+        self.store = store
+        self.name = name
+        self.capacity = capacity
+        self.rate = rate
+
+    async def wait(self):
+        """
+        Wait until a token is available and take it. If the store can't be
+        reached, requests are let through rather than blocked.
+        """
+        while True:
+            try:
+                delay = await self.store.take_token(self.name, self.capacity, self.rate)
+            except Exception as e:
+                logging.error("Error reading shared rate limit %s: %s", self.name, e)
+                return
+            if delay <= 0:
+                return
+            await asyncio.sleep(delay)
@@ -1,58 +1,237 @@
 """
 This module provides a StreamEditor class for managing the streaming of chat messages
 and editing a reply message in a Discord bot context. It handles the buffering of
-streamed chunks, sanitizes the visible content, and edits the reply message at specified intervals.
+streamed chunks, sanitizes the visible content, and edits the reply message
+following a time and size based schedule that adapts to the channel rate limits.
 """
 
+import asyncio
 import logging
+import time
+
 import discord
-from core.rate_limit import Throttle
+from core.metrics import REGISTRY
+from core.rate_limit import EditBudget
+from core.splitting import DISCORD_MAX_LENGTH, split_message
+from core.think import ThinkTagParser
 
 
 class StreamEditor:
     """
     StreamEditor manages the streaming of chat messages and edits a reply message in Discord.
     It buffers incoming chunks, sanitizes the visible content, and edits the reply message
-    at specified intervals or when forced.
+    once enough time has passed and enough text has arrived, or when forced.
+    If the stream goes quiet with pending text, a trailing edit flushes it.
+    Replies longer than `safe_edit_length` roll over into continuation messages,
+    and only the last message keeps being edited. Text is only moved on to the
+    next message once the edit showing it succeeded, failed edits are retried.
     """
 
+    # Attempts of the final flush before giving up on the pending text.
+    FINAL_FLUSH_ATTEMPTS = 5
+
     def __init__(
         self,
         message: discord.Message,
         *,
         safe_edit_length: int,
-        edit_every_n_chunks: int,
+        edit_min_delta_chars: int,
         edit_min_interval_ms: int,
+        budget: EditBudget | None = None,
     ):
         self.message = message
-        self.safe_edit_length = safe_edit_length
-        self.every = edit_every_n_chunks
-        self.iteration = 0
-        self.buffer = ""
-        self._throttle = Throttle(edit_min_interval_ms)
+        self.safe_edit_length = min(safe_edit_length, DISCORD_MAX_LENGTH)
+        self.min_delta = edit_min_delta_chars
+        self.min_interval = edit_min_interval_ms / 1000.0
+        self.budget = budget or EditBudget()
+        self.budget.active_streams += 1
+        self.parser = ThinkTagParser()
         self.reply_message: discord.Message | None = None
+        self.messages: list[discord.Message] = []
+        # Last content sent to each message of `messages`.
+        self.contents: list[str] = []
+        self.edits = 0
+        self.skipped_edits = 0
+        self._sent_length = 0
+        self._sent_revision = 0
+        # Prefix (a reopened code fence) the current message starts with.
+        self._carry = ""
+        self._last_edit = 0.0
+        self._lock = asyncio.Lock()
+        self._flush_task: asyncio.Task | None = None
+        self._closed = False
+
+    def _tail_length(self) -> int:
+        return len(self._carry) + len(self.parser)
+
+    def _tail(self) -> str:
+        return self._carry + self.parser.text()
+
+    def _dirty(self) -> bool:
+        return self.parser.revision != self._sent_revision
+
+    async def _roll_over(self) -> bool:
+        """
+        Finalize the current message at a safe boundary and continue in a new
+        one until the remaining text fits. Returns False when the edit
+        finalizing a message failed: the text stays pending for a retry.
+        """
+        while self._tail_length() > self.safe_edit_length and self.reply_message:
+            head, carry, consumed = split_message(self._tail(), self.safe_edit_length)
+            await self.budget.acquire()
+            if not await self._edit(head):
+                return False
+            self.parser.consume(consumed - len(self._carry))
+            self._carry = carry
+            text = self._tail()
+            first = text[: self.safe_edit_length] if len(text) > len(carry) else "..."
+            try:
+                self.reply_message = await self.reply_message.reply(first)
+            except Exception as e:
+                logging.error("Error sending continuation message: %s", e)
+                self.reply_message = None
+                break
+            self.messages.append(self.reply_message)
+            self.contents.append(first)
+            self._sent_length = len(first)
+            self._sent_revision = self.parser.revision if first == text else -1
+            self._last_edit = time.monotonic()
+        return True
+
+    def _due(self, now: float) -> bool:
+        if not self._dirty():
+            return False
+        elapsed = now - self._last_edit
+        interval = self.budget.interval(self.min_interval)
+        if elapsed < interval:
+            return False
+        # Small deltas wait a bit longer, so slow streams still get refreshed.
+        delta = abs(self._tail_length() - self._sent_length)
+        return delta >= self.min_delta or elapsed >= 2 * interval
 
-    def _sanitize_visible(self, output: str) -> str:
-        visible = output.split("</think>")[-1]
-        if "<think>" in output and "</think>" not in output:
-            return ""
-        return visible
+    async def _edit(self, visible: str | None = None) -> bool:
+        """
+        Show `visible` (by default the pending text) in the current message.
+        Returns whether the message now shows it.
+        """
+        if not self.reply_message:
+            return False
+        revision = self.parser.revision
+        if visible is None:
+            # The visible text is only materialized here, right before sending.
+            visible = self._tail()
+        if not visible:
+            return True
+        if self.budget.shared:
+            await self.budget.shared.wait()
+        start = time.monotonic()
+        try:
+            await self.reply_message.edit(content=visible)
+        except discord.RateLimited as e:
+            REGISTRY.inc("discord_rate_limited_total")
+            self.budget.on_rate_limited(e.retry_after)
+            logging.warning("Rate limited editing message, retry in %ss", e.retry_after)
+            return False
+        except discord.HTTPException as e:
+            if e.status == 429:
+                REGISTRY.inc("discord_rate_limited_total")
+                self.budget.on_rate_limited(self.min_interval)
+            logging.error("Error editing message: %s", e)
+            return False
+        except Exception as e:
+            logging.error("Error editing message: %s", e)
+            return False
+        duration = time.monotonic() - start
+        REGISTRY.observe("discord_edit_seconds", duration)
+        self.budget.on_edit(duration)
+        self.edits += 1
+        self.contents[-1] = visible
+        self._sent_length = len(visible)
+        self._sent_revision = revision
+        self._last_edit = time.monotonic()
+        return True
+
+    async def _final_flush(self):
+        """
+        Show the whole remaining text, retrying failed edits within the budget.
+        """
+        for _ in range(self.FINAL_FLUSH_ATTEMPTS):
+            if await self._roll_over():
+                await self.budget.acquire()
+                if await self._edit():
+                    return
+            if not self.reply_message:
+                break
+        logging.error(
+            "Reply %s is missing its last %d characters",
+            getattr(self.reply_message, "id", None),
+            self._tail_length(),
+        )
+
+    def _schedule_flush(self):
+        if self._closed or (self._flush_task and not self._flush_task.done()):
+            return
+        self._flush_task = asyncio.create_task(self._trailing_flush())
+
+    async def _trailing_flush(self):
+        while not self._closed:
+            now = time.monotonic()
+            wait = max(
+                self.budget.delay(),
+                self._last_edit + self.budget.interval(self.min_interval) - now,
+            )
+            await asyncio.sleep(max(wait, 0.01))
+            async with self._lock:
+                if not await self._roll_over():
+                    continue
+                if not self._dirty():
+                    return
+                if not self.budget.try_acquire():
+                    continue
+                if await self._edit():
+                    return
 
     async def on_stream_chunk(self, chunk: str, *, force: bool = False):
         """
         Processes a chunk of streamed content, updates the buffer, and edits the reply message
         if conditions are met.
         """
-        self.iteration += 1
-        self.buffer += chunk
-        visible = self._sanitize_visible(self.buffer)
+        self.parser.feed(chunk)
+        if force:
+            self.parser.flush()
 
         if not self.reply_message:
+            if self.messages:
+                # A continuation message failed to be sent, nowhere to write.
+                return
             self.reply_message = await self.message.reply("Thinking...")
+            self.messages.append(self.reply_message)
+            self.contents.append("Thinking...")
 
-        if force or (self.iteration % self.every == 0 and await self._throttle.ready()):
-            try:
-                await self.reply_message.edit(content=visible)
-            except Exception as e:
-                logging.error("Error editing message (force): %s", e)
+        async with self._lock:
+            if force:
+                await self._final_flush()
+                return
+
+            if (
+                await self._roll_over()
+                and self._due(time.monotonic())
+                and self.budget.try_acquire()
+                and await self._edit()
+            ):
+                return
+
+        if self._dirty():
+            self.skipped_edits += 1
+            self._schedule_flush()
+
+    def close(self):
+        """
+        Stop the trailing flush and release this stream's share of the channel budget.
+        """
+        if self._closed:
             return
+        self._closed = True
+        self.budget.active_streams -= 1
+        if self._flush_task and not self._flush_task.done():
+            self._flush_task.cancel()
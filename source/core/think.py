@@ -0,0 +1,115 @@
+"""
+Incremental parser that hides the <think>...</think> reasoning of streamed replies.
+Chunks are consumed once, tags split across chunk boundaries are handled, and
+the visible text is kept as a list of segments that is only joined on demand.
+"""
+
+from typing import List
+
+THINK_OPEN = "<think>"
+THINK_CLOSE = "</think>"
+
+
+def _partial_tag_length(text: str, tags) -> int:
+    """
+    Length of the longest suffix of `text` that could be the start of a tag.
+    """
+    longest = 0
+    for tag in tags:
+        for size in range(min(len(tag) - 1, len(text)), longest, -1):
+            if text.endswith(tag[:size]):
+                longest = size
+                break
+    return longest
+
+
+class ThinkTagParser:
+    """
+    Streaming state machine over the reply chunks.
+
+    Text inside think blocks is dropped. A closing tag also drops everything
+    visible before it, since some servers stream the reasoning without the
+    opening tag and only the text after the last `</think>` is the answer.
+    For the same reason, nothing is visible while a think block is open.
+    """
+
+    def __init__(self):
+        self.thinking = False
+        self._pending = ""
+        self._segments: List[str] = []
+        self._length = 0
+        # Bumped on every change of the visible text.
+        self.revision = 0
+
+    def __len__(self) -> int:
+        return self._length
+
+    def _append(self, text: str):
+        if text:
+            self._segments.append(text)
+            self._length += len(text)
+            self.revision += 1
+
+    def _clear(self):
+        if self._segments:
+            self.revision += 1
+        self._segments = []
+        self._length = 0
+
+    def feed(self, chunk: str):
+        """
+        Consume a streamed chunk.
+        """
+        text = self._pending + chunk
+        self._pending = ""
+        start = 0
+        while True:
+            if self.thinking:
+                end = text.find(THINK_CLOSE, start)
+                if end == -1:
+                    keep = _partial_tag_length(text[start:], (THINK_CLOSE,))
+                    self._pending = text[len(text) - keep :] if keep else ""
+                    return
+                self.thinking = False
+                self._clear()
+                start = end + len(THINK_CLOSE)
+                continue
+
+            opening = text.find(THINK_OPEN, start)
+            closing = text.find(THINK_CLOSE, start)
+            if opening == -1 and closing == -1:
+                keep = _partial_tag_length(text[start:], (THINK_OPEN, THINK_CLOSE))
+                self._append(text[start : len(text) - keep])
+                self._pending = text[len(text) - keep :] if keep else ""
+                return
+            if closing != -1 and (opening == -1 or closing < opening):
+                self._clear()
+                start = closing + len(THINK_CLOSE)
+                continue
+            self._clear()
+            self.thinking = True
+            start = opening + len(THINK_OPEN)
+
+    def flush(self):
+        """
+        Release text held back as a possible partial tag (end of stream).
+        """
+        if not self.thinking:
+            self._append(self._pending)
+        self._pending = ""
+
+    def text(self) -> str:
+        """
+        Materialize the visible text.
+        """
+        if len(self._segments) > 1:
+            self._segments = ["".join(self._segments)]
+        return self._segments[0] if self._segments else ""
+
+    def consume(self, size: int):
+        """
+        Drop the first `size` visible characters (already sent elsewhere).
+        """
+        rest = self.text()[size:]
+        self._clear()
+        self._append(rest)
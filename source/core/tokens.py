@@ -0,0 +1,92 @@
+"""
+Token counting helpers used to keep chat contexts inside a token budget.
+Uses tiktoken when it is installed and falls back to a cheap character-based
+estimate otherwise, which is good enough for budgeting purposes.
+"""
+
+import functools
+from dataclasses import dataclass
+from typing import Optional
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None  # the estimate below is used instead
+
+# Average number of characters per token for English-like text.
+CHARS_PER_TOKEN = 4
+
+# Tokens added by the chat format around every message (role, separators).
+MESSAGE_OVERHEAD_TOKENS = 4
+
+
+@functools.lru_cache(maxsize=1)
+def _get_encoding():
+    if tiktoken is None:
+        return None
+    try:
+        return tiktoken.get_encoding("cl100k_base")
+    except Exception:
+        return None
+
+
+def count_tokens(text: str) -> int:
+    """
+    Count the tokens of a chat message content, including the per-message overhead.
+    """
+    encoding = _get_encoding()
+    if encoding is not None:
+        tokens = len(encoding.encode(text, disallowed_special=()))
+    else:
+        tokens = -(-len(text) // CHARS_PER_TOKEN)
+    return tokens + MESSAGE_OVERHEAD_TOKENS
+
+
+def truncate_to_tokens(text: str, max_tokens: int, keep_end: bool = False) -> str:
+    """
+    Cut a text so that `count_tokens` of the result fits in `max_tokens`.
+    With `keep_end`, the end of the text is kept instead of its start.
+    """
+    max_tokens -= MESSAGE_OVERHEAD_TOKENS
+    if max_tokens <= 0:
+        return ""
+    encoding = _get_encoding()
+    if encoding is not None:
+        tokens = encoding.encode(text, disallowed_special=())
+        return encoding.decode(
+            tokens[-max_tokens:] if keep_end else tokens[:max_tokens]
+        )
+    if keep_end:
+        return text[-max_tokens * CHARS_PER_TOKEN :]
+    return text[: max_tokens * CHARS_PER_TOKEN]
+
+
+@dataclass
+class ContextUsage:
+    """
+    Token accounting of a built chat context.
+    """
+
+    budget: int = 0
+    system_tokens: int = 0
+    summary_tokens: int = 0
+    retrieval_tokens: int = 0
+    history_tokens: int = 0
+    reserved_tokens: int = 0
+    messages: int = 0
+    dropped_messages: int = 0
+    # Oldest history message in the context, older ones were dropped.
+    first_message_id: Optional[int] = None
+
+    @property
+    def prompt_tokens(self) -> int:
+        """
+        Tokens sent to the model (system prompt + memory summary + retrieved
+        messages + history).
+        """
+        return (
+            self.system_tokens
+            + self.summary_tokens
+            + self.retrieval_tokens
+            + self.history_tokens
+        )
@@ -0,0 +1,229 @@
+"""
+On-disk vector index of channel messages.
+Vectors are appended as float32 rows to `<path>.vectors` and read through a
+memory map, so the index doesn't have to fit in memory and is searched with
+numpy. The messages behind the rows are stored in `<path>.sqlite3`.
+"""
+
+import logging
+import sqlite3
+import threading
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+@dataclass
+class IndexedMessage:
+    """
+    A message found in the index, with its similarity to the query.
+    """
+
+    channel_id: int
+    message_id: int
+    author: str
+    content: str
+    score: float = 0.0
+
+
+class VectorIndex:
+    """
+    Append-only vector index with per-channel top-k search.
+    Rows of edited or deleted messages are left in the vector file and just
+    unreferenced. Methods block, callers run them in a worker thread.
+    """
+
+    def __init__(self, path: str, dimensions: int):
+        if np is None:
+            raise ImportError("The vector index needs the numpy package.")
+        self.dimensions = dimensions
+        self._row_bytes = dimensions * 4
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(f"{path}.sqlite3", check_same_thread=False)
+        with self._db:
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                "channel_id INTEGER NOT NULL, message_id INTEGER NOT NULL, "
+                "row INTEGER NOT NULL, author TEXT NOT NULL, content TEXT NOT NULL, "
+                "PRIMARY KEY (channel_id, message_id))"
+            )
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS backfill ("
+                "channel_id INTEGER PRIMARY KEY, done INTEGER NOT NULL)"
+            )
+
+        self._vectors_path = f"{path}.vectors"
+        self._file = open(self._vectors_path, "ab")
+        self.rows = self._file.tell() // self._row_bytes
+        # A crash may leave a partial row or entries without their vector.
+        self._file.truncate(self.rows * self._row_bytes)
+        with self._db:
+            dropped = self._db.execute(
+                "DELETE FROM entries WHERE row >= ?", (self.rows,)
+            ).rowcount
+        if dropped:
+            logging.warning("Dropped %d index entries without a vector", dropped)
+
+        self._channels: Dict[int, Dict[int, int]] = {}
+        for channel_id, message_id, row in self._db.execute(
+            "SELECT channel_id, message_id, row FROM entries"
+        ):
+            self._channels.setdefault(channel_id, {})[message_id] = row
+        self.entries = sum(len(ids) for ids in self._channels.values())
+        self._channel_rows: Dict[int, Tuple["np.ndarray", "np.ndarray"]] = {}
+        self._map: Optional["np.ndarray"] = None
+
+    def contains(self, channel_id: int, message_id: int) -> bool:
+        """
+        Whether a message is indexed.
+        """
+        with self._lock:
+            return message_id in self._channels.get(channel_id, {})
+
+    def message_ids(self, channel_id: int) -> Tuple[Optional[int], Optional[int]]:
+        """
+        Oldest and newest indexed message ids of a channel.
+        """
+        with self._lock:
+            ids = self._channels.get(channel_id)
+            if not ids:
+                return None, None
+            return min(ids), max(ids)
+
+    def author(self, channel_id: int, message_id: int) -> Optional[str]:
+        """
+        Author of an indexed message.
+        """
+        with self._lock:
+            row = self._db.execute(
+                "SELECT author FROM entries WHERE channel_id = ? AND message_id = ?",
+                (channel_id, message_id),
+            ).fetchone()
+        return row[0] if row else None
+
+    def add(self, messages: Sequence[IndexedMessage], vectors: Sequence[List[float]]):
+        """
+        Append messages and their vectors. Indexed messages are replaced.
+        """
+        if not messages:
+            return
+        matrix = np.asarray(vectors, dtype=np.float32).reshape(-1, self.dimensions)
+        with self._lock:
+            first = self.rows
+            self._file.write(matrix.tobytes())
+            self._file.flush()
+            self.rows += len(matrix)
+            with self._db:
+                self._db.executemany(
+                    "INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?)",
+                    [
+                        (m.channel_id, m.message_id, first + i, m.author, m.content)
+                        for i, m in enumerate(messages)
+                    ],
+                )
+            for i, m in enumerate(messages):
+                ids = self._channels.setdefault(m.channel_id, {})
+                if m.message_id not in ids:
+                    self.entries += 1
+                ids[m.message_id] = first + i
+                self._channel_rows.pop(m.channel_id, None)
+
+    def remove(self, channel_id: int, message_ids: Iterable[int]):
+        """
+        Drop messages from the index.
+        """
+        with self._lock:
+            ids = self._channels.get(channel_id, {})
+            message_ids = [m for m in message_ids if m in ids]
+            if not message_ids:
+                return
+            self.entries -= len(set(message_ids))
+            with self._db:
+                self._db.executemany(
+                    "DELETE FROM entries WHERE channel_id = ? AND message_id = ?",
+                    [(channel_id, m) for m in message_ids],
+                )
+            for message_id in message_ids:
+                ids.pop(message_id, None)
+            self._channel_rows.pop(channel_id, None)
+
+    def _vectors(self) -> "np.ndarray":
+        # The map is reopened once rows were appended since the last search.
+        if self._map is None or len(self._map) != self.rows:
+            self._map = np.memmap(
+                self._vectors_path,
+                dtype=np.float32,
+                mode="r",
+                shape=(self.rows, self.dimensions),
+            )
+        return self._map
+
+    def search(
+        self,
+        channel_id: int,
+        vector: List[float],
+        k: int,
+        exclude: Set[int] = frozenset(),
+    ) -> List[IndexedMessage]:
+        """
+        The `k` messages of a channel most similar to `vector` (cosine
+        similarity, vectors are normalized), skipping `exclude` message ids.
+        """
+        with self._lock:
+            if not self._channels.get(channel_id) or not self.rows:
+                return []
+            if channel_id not in self._channel_rows:
+                ids = self._channels[channel_id]
+                self._channel_rows[channel_id] = (
+                    np.fromiter(ids.keys(), dtype=np.int64, count=len(ids)),
+                    np.fromiter(ids.values(), dtype=np.int64, count=len(ids)),
+                )
+            message_ids, rows = self._channel_rows[channel_id]
+            query = np.asarray(vector, dtype=np.float32)
+            scores = self._vectors()[rows] @ query
+
+            top = min(len(scores), k + len(exclude))
+            best = np.argpartition(-scores, top - 1)[:top]
+            best = best[np.argsort(-scores[best])]
+            found = []
+            for i in best:
+                message_id = int(message_ids[i])
+                if message_id in exclude:
+                    continue
+                row = self._db.execute(
+                    "SELECT author, content FROM entries "
+                    "WHERE channel_id = ? AND message_id = ?",
+                    (channel_id, message_id),
+                ).fetchone()
+                if row is not None:
+                    found.append(
+                        IndexedMessage(
+                            channel_id, message_id, row[0], row[1], float(scores[i])
+                        )
+                    )
+                if len(found) == k:
+                    break
+            return found
+
+    def backfill_done(self, channel_id: int) -> bool:
+        """
+        Whether the whole history of a channel was indexed.
+        """
+        with self._lock:
+            row = self._db.execute(
+                "SELECT done FROM backfill WHERE channel_id = ?", (channel_id,)
+            ).fetchone()
+        return bool(row and row[0])
+
+    def set_backfill_done(self, channel_id: int):
+        """
+        Record that the whole history of a channel was indexed.
+        """
+        with self._lock, self._db:
+            self._db.execute(
+                "INSERT OR REPLACE INTO backfill VALUES (?, 1)", (channel_id,)
+            )
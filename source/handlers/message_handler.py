@@ -4,23 +4,48 @@ It handles incoming messages, checks if a response is needed, builds a chat cont
 and streams a response using a chat provider.
 """
 
-import re
+import time
 import asyncio
-from typing import List, Dict
+import contextlib
+import logging
+from typing import TYPE_CHECKING, List, Dict, Optional, Tuple
 
 import discord
 
+from core.channels import ChannelMatcher
 from core.config import Settings
 
+from core.coalesce import ChannelCoalescer
+from core.context_cache import CachedMessage, ChannelContextCache
+from core.metrics import REGISTRY, Trace
+from core.scheduler import FairScheduler, QueueFullError
+from core.state import MemoryStateStore, SharedRateLimit, SharedSlots, StateStore
+from core.rate_limit import EditBudgets
 from core.stream import StreamEditor
-from llm.openai_provider import OpenAIProvider
-from addons.emoji_only_channel import manage_emojis_channel
+from core.tokens import (
+    CHARS_PER_TOKEN,
+    MESSAGE_OVERHEAD_TOKENS,
+    ContextUsage,
+    count_tokens,
+    truncate_to_tokens,
+)
+from llm.base import ChatProvider, StreamResult, open_stream
+from addons.emoji_only_channel import EmojiModerator
 from addons.commands import (
+    cancel_image,
     change_status,
     generate_image,
     ping,
 )
-from addons.stable_diffusion_conection import SDClient
+
+# Optional subsystems are imported when they are enabled, to keep startup fast.
+if TYPE_CHECKING:
+    from core.memory import ConversationMemory
+    from core.retrieval import Retriever
+    from llm.cache import ResponseCache
+
+# Tokens of the message being answered kept when it doesn't fit in the budget.
+MIN_TRUNCATED_TOKENS = 64
 
 
 class MessageHandler:
@@ -33,16 +58,152 @@ class MessageHandler:
     def __init__(
         self,
         settings: Settings,
-        provider: OpenAIProvider,
+        provider: ChatProvider,
         bot_user: discord.ClientUser | None,
+        state_store: StateStore | None = None,
     ):
         self.provider = provider
         self.bot_user = bot_user
         self.settings = settings
+        # Limits shared with the other bot processes when sharded.
+        self.state_store = state_store or MemoryStateStore()
         self.prompt = self.settings.base_prompt
+        self.chat_channels = ChannelMatcher(self.settings.chat_channels_data)
+        self.emoji_only_channels = ChannelMatcher(
+            self.settings.emoji_only_channels_data
+        )
+        self.emoji_moderator = EmojiModerator(
+            flush_interval_ms=self.settings.emoji_flush_interval_ms
+        )
+        # First message of the history window of each channel (stable layout).
+        self.context_anchors: Dict[int, int] = {}
+        if self.settings.context_layout not in ("sliding", "stable"):
+            raise ValueError(f"Unknown CONTEXT_LAYOUT: {self.settings.context_layout}")
+        self.context_cache = ChannelContextCache(
+            max_messages=self.settings.context_candidate_messages,
+            max_channels=self.settings.context_cache_max_channels,
+            ttl_seconds=self.settings.context_cache_ttl_seconds,
+        )
+        self.coalescer = ChannelCoalescer(
+            window_ms=self.settings.coalesce_window_ms,
+            cancel_superseded=self.settings.cancel_superseded,
+            # Replies that never stream still close their trace.
+            on_dropped=lambda job, reason: job[1].finish(reason),
+        )
+        self.edit_budgets = EditBudgets(
+            capacity=self.settings.channel_edit_burst,
+            rate=self.settings.channel_edits_per_second,
+            shared=self._initialize_global_rate_limit(),
+        )
+        self.llm_scheduler = FairScheduler(
+            max_in_flight=self.settings.llm_max_in_flight,
+            max_queue=self.settings.llm_max_queue,
+            drop_policy=self.settings.llm_drop_policy,
+        )
+        self.llm_global_slots = None
+        if self.settings.llm_global_max_in_flight > 0:
+            self.llm_global_slots = SharedSlots(
+                self.state_store,
+                "llm:slots",
+                limit=self.settings.llm_global_max_in_flight,
+            )
+        self.response_cache = self._initialize_response_cache()
+        self.memory = self._initialize_memory()
+        self.retriever = self._initialize_retriever()
         self.discord_commands = self._initialize_commands()
+        REGISTRY.add_collector("message_handler", self._collect_metrics)
         self.stable_diffusion_connection = self._initialize_stable_diffusion()
 
+    def apply_settings(self, settings: Settings):
+        """
+        Swap in reloaded settings (see core.config.RELOADABLE). Everything that
+        can fail is built first, so a bad configuration changes nothing.
+        Replies already streaming keep the settings they started with.
+        """
+        chat_channels = ChannelMatcher(settings.chat_channels_data)
+        emoji_only_channels = ChannelMatcher(settings.emoji_only_channels_data)
+
+        self.settings = settings
+        self.prompt = settings.base_prompt
+        self.chat_channels = chat_channels
+        self.emoji_only_channels = emoji_only_channels
+        self.edit_budgets.configure(
+            settings.channel_edit_burst, settings.channel_edits_per_second
+        )
+        self.coalescer.window = settings.coalesce_window_ms / 1000.0
+        self.coalescer.cancel_superseded = settings.cancel_superseded
+        self.emoji_moderator.flush_interval = settings.emoji_flush_interval_ms / 1000.0
+        if self.memory:
+            self.memory.summary_max_tokens = settings.memory_summary_max_tokens
+        if self.retriever:
+            self.retriever.top_k = settings.rag_top_k
+            self.retriever.min_score = settings.rag_min_score
+
+    def _initialize_global_rate_limit(self) -> SharedRateLimit | None:
+        rate = self.settings.discord_global_requests_per_second
+        if rate <= 0:
+            return None
+        return SharedRateLimit(
+            self.state_store, "discord:requests", capacity=rate, rate=rate
+        )
+
+    def _initialize_response_cache(self) -> "ResponseCache | None":
+        backend_name = self.settings.response_cache
+        if not backend_name:
+            return None
+        from llm.cache import MemoryCacheBackend, ResponseCache, SQLiteCacheBackend
+
+        if backend_name == "memory":
+            backend = MemoryCacheBackend(
+                max_entries=self.settings.response_cache_max_entries,
+                ttl_seconds=self.settings.response_cache_ttl_seconds,
+            )
+        elif backend_name == "sqlite":
+            backend = SQLiteCacheBackend(
+                path=self.settings.response_cache_path,
+                max_entries=self.settings.response_cache_max_entries,
+                ttl_seconds=self.settings.response_cache_ttl_seconds,
+            )
+        else:
+            raise ValueError(f"Unknown RESPONSE_CACHE backend: {backend_name}")
+        return ResponseCache(
+            backend,
+            model=self.settings.model,
+            trailing_messages=self.settings.response_cache_trailing_messages,
+            min_chars=self.settings.response_cache_min_chars,
+            max_temperature=self.settings.response_cache_max_temperature,
+        )
+
+    def _initialize_memory(self) -> "ConversationMemory | None":
+        if not self.settings.memory_path:
+            return None
+        from core.memory import ConversationMemory
+
+        return ConversationMemory(
+            self.settings.memory_path,
+            self.provider,
+            recent_messages=self.settings.max_context_messages,
+            summary_batch=self.settings.memory_summary_batch,
+            summary_max_tokens=self.settings.memory_summary_max_tokens,
+            llm_slot=self._background_llm_slot,
+        )
+
+    def _initialize_retriever(self) -> "Retriever | None":
+        if not self.settings.rag_index_path:
+            return None
+        from core.retrieval import Retriever
+        from core.vector_index import VectorIndex
+        from llm.factory import build_embedding_provider
+
+        return Retriever(
+            VectorIndex(self.settings.rag_index_path, self.settings.rag_dimensions),
+            build_embedding_provider(self.settings),
+            top_k=self.settings.rag_top_k,
+            min_score=self.settings.rag_min_score,
+            min_chars=self.settings.rag_min_chars,
+            backfill_messages=self.settings.rag_backfill_messages,
+        )
+
     def _initialize_stable_diffusion(self):
         if not self.settings.use_stable_diffusion:
             return None
@@ -50,20 +211,33 @@ class MessageHandler:
             raise ValueError(
                 "Stable Diffusion is enabled but SD_URL or SD_CHECKPOINT is not set."
             )
+        from addons.image_cache import ImageCache
+        from addons.stable_diffusion_conection import SDClient
+
+        cache = None
+        if self.settings.sd_cache_path:
+            cache = ImageCache(
+                self.settings.sd_cache_path,
+                max_bytes=self.settings.sd_cache_max_mb * 1024 * 1024,
+            )
         return SDClient(
             url=self.settings.sd_url,
             sd_checkpoint=self.settings.sd_checkpoint,
             steps=15,
+            max_queue=self.settings.sd_max_queue,
+            health_interval_seconds=self.settings.sd_health_interval_seconds,
+            cache=cache,
+            pin_seed=self.settings.sd_pin_seed,
         )
 
     def _initialize_commands(self):
         """
         Initialize the commands that the bot can respond to.
-        This method should be called after the bot is ready.
         """
         return {
             "!change_status": change_status,
             "!generate-image": generate_image,
+            "!cancel-image": cancel_image,
             "!ping": ping,
         }
 
@@ -82,19 +256,17 @@ class MessageHandler:
                 return True
         return False
 
-    def _is_valid_channel(self, message, channels) -> bool:
+    def _is_valid_channel(self, message, channels: ChannelMatcher) -> bool:
         """
         Check if a message is in a valid channel.
         """
         if message.guild is None or message.channel is None:
             return False
 
-        final_id = f"{message.guild.id}:{message.channel.id}"
-        for channel in channels:
-            if re.search(channel, final_id):
-                return True
+        return channels.matches(message.guild.id, message.channel.id)
 
-        return False
+    def _is_own(self, author_id: int) -> bool:
+        return self.bot_user is not None and author_id == self.bot_user.id
 
     def _should_respond(self, message: discord.Message) -> bool:
         if not self.bot_user:
@@ -105,37 +277,286 @@ class MessageHandler:
             return any(u.id == self.bot_user.id for u in message.mentions)
         return True
 
-    async def build_context_from_channel(self, channel):
+    async def _fetch_channel_messages(self, channel) -> List[CachedMessage]:
         """
-        Build the chat context from the channel's message history.
+        Get the latest messages of a channel, oldest first: up to
+        CONTEXT_CANDIDATE_MESSAGES candidates, the token budget decides how
+        many of them make it into the context. Served from the context cache,
+        the channel history is only fetched on a cold start or after a gap.
         """
+        cached = self.context_cache.get(channel.id)
+        if cached is not None:
+            REGISTRY.inc("context_cache_hits_total")
+            return cached
 
-        msgs: List[discord.Message] = []
+        REGISTRY.inc("context_history_fetches_total")
+        started = time.monotonic()
+        msgs: List[CachedMessage] = []
         async for m in channel.history(
-            limit=self.settings.max_context_messages, oldest_first=False
+            limit=self.settings.context_candidate_messages, oldest_first=False
         ):
             if m.content is None:
                 continue
-            msgs.append(m)
+            msgs.append(CachedMessage.from_message(m))
         msgs = list(reversed(msgs))
+        REGISTRY.observe("history_fetch_seconds", time.monotonic() - started)
+        self.context_cache.seed(channel.id, msgs)
+        return msgs
+
+    async def build_context(
+        self, channel, token_budget: Optional[int] = None
+    ) -> Tuple[List[Dict[str, str]], ContextUsage]:
+        """
+        Build the chat context from the channel's message history, filling the
+        token budget (system prompt + memory summary + retrieved messages +
+        history + reserved completion tokens) with the newest messages first.
+        With CONTEXT_LAYOUT=stable, the history window rolls in large steps
+        instead (see `_stable_history`).
+        """
+        # One snapshot for the whole build, even if the settings are reloaded.
+        settings, prompt = self.settings, self.prompt
+        if token_budget is None:
+            token_budget = settings.context_token_budget
 
-        chat: List[Dict[str, str]] = []
-        if self.prompt:
-            chat.append({"role": "system", "content": self.prompt})
+        msgs = await self._fetch_channel_messages(channel)
 
-        for m in msgs:
-            role = (
-                "assistant"
-                if (self.bot_user and m.author.id == self.bot_user.id)
-                else "user"
-            )
-            content = m.content
-            author = m.author.display_name
-            if not content:
+        usage = ContextUsage(
+            budget=token_budget,
+            reserved_tokens=settings.reserved_completion_tokens,
+        )
+        system: List[Dict[str, str]] = []
+        if prompt:
+            system.append({"role": "system", "content": prompt})
+            usage.system_tokens = count_tokens(prompt)
+
+        if self.memory:
+            summary = await self.memory.summary(channel.id)
+            if summary:
+                content = f"Summary of the earlier conversation:\n{summary}"
+                content = truncate_to_tokens(
+                    content, settings.memory_summary_max_tokens
+                )
+                system.append({"role": "system", "content": content})
+                usage.summary_tokens = count_tokens(content)
+
+        retrieval = None
+        if self.retriever and msgs:
+            content = await self._retrieve(channel.id, msgs, settings.rag_max_tokens)
+            if content:
+                retrieval = {"role": "system", "content": content}
+                usage.retrieval_tokens = count_tokens(content)
+
+        available = (
+            token_budget
+            - usage.system_tokens
+            - usage.summary_tokens
+            - usage.reserved_tokens
+        )
+        if settings.context_layout == "stable":
+            # The retrieved messages change with every question: they go
+            # after the stable prefix, and their room is always set aside so
+            # they don't make the window roll.
+            if self.retriever:
+                available -= settings.rag_max_tokens
+            history = self._stable_history(channel.id, msgs, available, usage)
+            if retrieval:
+                history.insert(len(history) - 1, retrieval)
+        else:
+            if retrieval:
+                system.append(retrieval)
+                available -= usage.retrieval_tokens
+            history = self._sliding_history(msgs, available, usage)
+
+        if self.memory and usage.first_message_id is not None:
+            # Turns that didn't make it into the context go to the summary.
+            self.memory.set_context_start(channel.id, usage.first_message_id)
+        return system + history, usage
+
+    def _sliding_history(
+        self, msgs: List[CachedMessage], available: int, usage: ContextUsage
+    ) -> List[Dict[str, str]]:
+        """
+        History of the sliding layout: the newest messages that fit in the
+        budget, at most MAX_CONTEXT_MESSAGES of them.
+        """
+        history: List[Dict[str, str]] = []
+        for m in reversed(msgs):
+            if not m.content:
                 continue
-            chat.append({"role": role, "content": f"{author} said: {content}"})
+            if len(history) >= self.settings.max_context_messages:
+                break
+            role, content, tokens = self._render(m)
+            if tokens > available:
+                if history:
+                    break
+                # Always keep (part of) the message being answered.
+                content, tokens = self._truncate(m, available)
+
+            history.append({"role": role, "content": content})
+            usage.history_tokens += tokens
+            usage.first_message_id = m.id
+            available -= tokens
+
+        usage.messages = len(history)
+        usage.dropped_messages = sum(1 for m in msgs if m.content) - usage.messages
+        return list(reversed(history))
+
+    def _render(self, m: CachedMessage) -> Tuple[str, str, int]:
+        """
+        Role, content and token count of a history entry.
+        """
+        role = "assistant" if self._is_own(m.author_id) else "user"
+        content = f"{m.author_name} said: {m.content}"
+        if m.tokens is None:
+            m.tokens = count_tokens(content)
+        return role, content, m.tokens
+
+    def _truncate(self, m: CachedMessage, available: int) -> Tuple[str, int]:
+        """
+        Content and token count of a history entry cut to the budget. The end
+        of the message is kept, at least MIN_TRUNCATED_TOKENS of it even when
+        the budget is spent, so the question being answered is never lost.
+        """
+        prefix = f"{m.author_name} said: "
+        room = max(available, MIN_TRUNCATED_TOKENS) - count_tokens(prefix)
+        room += MESSAGE_OVERHEAD_TOKENS
+        content = prefix + truncate_to_tokens(m.content, room, keep_end=True)
+        return content, count_tokens(content)
+
+    def _stable_history(
+        self,
+        channel_id: int,
+        msgs: List[CachedMessage],
+        available: int,
+        usage: ContextUsage,
+    ) -> List[Dict[str, str]]:
+        """
+        History window of the stable layout: it starts at an anchor message
+        and only grows, so consecutive requests share their whole prefix and
+        hit the upstream prompt cache. When the anchor leaves the message
+        buffer or the window outgrows the budget or MAX_CONTEXT_MESSAGES, the
+        window rolls in one large step: it restarts from the newest messages,
+        using half of the budget and of MAX_CONTEXT_MESSAGES to leave room to
+        grow again.
+        """
+        entries = [m for m in msgs if m.content]
+        if not entries:
+            return []
+
+        anchor = self.context_anchors.get(channel_id)
+        window = None
+        if anchor is not None and entries[0].id <= anchor:
+            window = [m for m in entries if m.id >= anchor]
+        if (
+            not window
+            or len(window) > self.settings.max_context_messages
+            or sum(self._render(m)[2] for m in window) > available
+        ):
+            limit = max(1, self.settings.max_context_messages // 2)
+            window, tokens = [], 0
+            for m in reversed(entries):
+                message_tokens = self._render(m)[2]
+                if window and (
+                    tokens + message_tokens > available // 2 or len(window) >= limit
+                ):
+                    break
+                window.append(m)
+                tokens += message_tokens
+            window.reverse()
+            self.context_anchors[channel_id] = window[0].id
+            REGISTRY.inc("context_window_rolls_total")
+
+        history: List[Dict[str, str]] = []
+        for m in window:
+            role, content, tokens = self._render(m)
+            if tokens > available:
+                # Only a lone message can be larger than the budget.
+                content, tokens = self._truncate(m, available)
+            history.append({"role": role, "content": content})
+            usage.history_tokens += tokens
+
+        usage.messages = len(history)
+        usage.dropped_messages = len(entries) - usage.messages
+        usage.first_message_id = window[0].id
+        return history
+
+    async def _retrieve(
+        self, channel_id: int, msgs: List[CachedMessage], max_tokens: int
+    ) -> str:
+        """
+        Earlier messages of the channel relevant to the newest one, outside
+        of the history window. Retrieval errors don't block the reply.
+        """
+        try:
+            found = await self.retriever.search(
+                channel_id, msgs[-1].content, exclude={m.id for m in msgs}
+            )
+        except Exception as e:
+            logging.error("Error retrieving messages of channel %s: %s", channel_id, e)
+            return ""
+        if not found:
+            return ""
+        lines = [
+            f"{m.author} said: {m.content}"
+            for m in sorted(found, key=lambda m: m.message_id)
+        ]
+        return truncate_to_tokens(
+            "Earlier messages of this channel that may be relevant:\n"
+            + "\n".join(lines),
+            max_tokens,
+        )
+
+    async def build_context_from_channel(self, channel):
+        """
+        Build the chat context from the channel's message history, preceded
+        by the summary of older turns when the conversation memory is enabled.
+        """
+        chat, _ = await self.build_context(channel)
         return chat
 
+    def handle_message_edit(self, payload: discord.RawMessageUpdateEvent):
+        """
+        Keep the context cache in sync with edited messages.
+        """
+        content = payload.data.get("content")
+        if content is None:
+            return
+        self.context_cache.update(payload.channel_id, payload.message_id, content)
+        if self.memory:
+            self.memory.update(payload.channel_id, payload.message_id, content)
+        if self.retriever:
+            cached = self.context_cache.find(payload.channel_id, payload.message_id)
+            if cached is None:
+                self.retriever.update(payload.channel_id, payload.message_id, content)
+            elif not self._is_own(cached.author_id):
+                # Also indexes messages too short to be indexed when posted.
+                self.retriever.update(
+                    payload.channel_id,
+                    payload.message_id,
+                    content,
+                    author=cached.author_name,
+                )
+
+    def handle_message_delete(self, payload: discord.RawMessageDeleteEvent):
+        """
+        Drop deleted messages from the context cache.
+        """
+        self.context_cache.remove(payload.channel_id, [payload.message_id])
+        if self.memory:
+            self.memory.remove(payload.channel_id, [payload.message_id])
+        if self.retriever:
+            self.retriever.remove(payload.channel_id, [payload.message_id])
+
+    def handle_bulk_message_delete(self, payload: discord.RawBulkMessageDeleteEvent):
+        """
+        Drop bulk-deleted messages from the context cache.
+        """
+        self.context_cache.remove(payload.channel_id, payload.message_ids)
+        if self.memory:
+            self.memory.remove(payload.channel_id, payload.message_ids)
+        if self.retriever:
+            self.retriever.remove(payload.channel_id, payload.message_ids)
+
     async def handle_message(self, message: discord.Message):
         """
         Handle an incoming message by checking if a response is needed,
@@ -143,39 +564,238 @@ class MessageHandler:
         """
 
         # Manage emoji-only channels
-        if self._is_valid_channel(message, self.settings.emoji_only_channels_data):
-            await manage_emojis_channel(message)
+        if self._is_valid_channel(message, self.emoji_only_channels):
+            self.emoji_moderator.submit(message)
             return
 
-        if not self._is_valid_channel(message, self.settings.chat_channels_data):
+        if not self._is_valid_channel(message, self.chat_channels):
             return
 
+        self.context_cache.add(message)
+        if self.memory and message.content:
+            self.memory.add(
+                message.channel.id,
+                message.id,
+                message.author.display_name,
+                message.content,
+            )
+        if self.retriever and not self._is_own(message.author.id):
+            # Replies are indexed once streamed, see _stream_reply.
+            self.retriever.add(message)
+
         if self._manage_commands(message):
             return
 
         if not self._should_respond(message):
             return
 
-        chat_messages = await self.build_context_from_channel(
-            message.channel,
+        trace = REGISTRY.trace(
+            "reply",
+            guild=message.guild.id if message.guild else None,
+            channel=message.channel.id,
+            message=message.id,
+        )
+        self.coalescer.submit(message.channel.id, (message, trace), self._reply)
+
+    async def _reply(self, job: Tuple[discord.Message, Trace]):
+        """
+        Build the context of the channel and stream a reply to the message.
+        Bursts are coalesced before getting here, so the context already
+        includes every message of the burst.
+        """
+        message, trace = job
+        trace.mark("coalesce")
+        try:
+            with trace.span("build_context"):
+                chat_messages, usage = await self.build_context(message.channel)
+        except Exception as e:
+            logging.exception("Error building context: %s", e)
+            trace.finish("error")
+            return
+        trace.fields.update(
+            context_messages=usage.messages,
+            prompt_tokens=usage.prompt_tokens,
+            summary_tokens=usage.summary_tokens,
+            retrieval_tokens=usage.retrieval_tokens,
+            dropped_messages=usage.dropped_messages,
+        )
+        logging.info(
+            "Context for channel %s: %d messages, %d prompt tokens "
+            "(%d system, %d summary, %d retrieved, %d history, %d dropped), "
+            "budget %d",
+            message.channel.id,
+            usage.messages,
+            usage.prompt_tokens,
+            usage.system_tokens,
+            usage.summary_tokens,
+            usage.retrieval_tokens,
+            usage.history_tokens,
+            usage.dropped_messages,
+            usage.budget,
         )
 
-        asyncio.create_task(self._run_stream(chat_messages, message))
+        await self._run_stream(chat_messages, message, trace)
+
+    def _schedule_key(self, message: discord.Message):
+        """
+        Fair-share key of a message: its guild, or its channel in DMs.
+        """
+        if message.guild is not None:
+            return message.guild.id
+        return message.channel.id
+
+    def _collect_metrics(self) -> Dict[str, float]:
+        """
+        Gauges and counters of the reply pipeline, read at scrape time.
+        """
+        gauges = {f"llm_{k}": v for k, v in self.llm_scheduler.metrics().items()}
+        gauges["context_cache_channels"] = len(self.context_cache)
+        gauges["replies_coalesced_total"] = self.coalescer.coalesced
+        gauges["replies_cancelled_total"] = self.coalescer.cancelled
+        if self.response_cache:
+            gauges["response_cache_hits_total"] = self.response_cache.hits
+            gauges["response_cache_misses_total"] = self.response_cache.misses
+        gauges.update(self.emoji_moderator.metrics())
+        if self.memory:
+            gauges.update(self.memory.metrics())
+        if self.retriever:
+            gauges.update(self.retriever.metrics())
+        if self.stable_diffusion_connection:
+            gauges.update(self.stable_diffusion_connection.metrics())
+        return gauges
+
+    async def _run_stream(
+        self, chat_messages, message: discord.Message, trace: Trace | None = None
+    ):
+        trace = trace or REGISTRY.trace("reply", channel=message.channel.id)
+        sampling = {"temperature": 0.2}
+        result = StreamResult()
 
-    async def _run_stream(self, chat_messages, message: discord.Message):
-        editor = StreamEditor(
+        cache_key = None
+        if self.response_cache:
+            cache_key, cached = await self.response_cache.lookup(
+                chat_messages, **sampling
+            )
+            trace.fields["response_cache"] = "hit" if cached is not None else "miss"
+            if cached is not None:
+                # Cache hits don't need an LLM slot.
+                await self._stream_reply(
+                    self.response_cache.replay(cached, result), message, trace, result
+                )
+                return
+
+        try:
+            queued = time.monotonic()
+            async with (
+                self.llm_scheduler.slot(self._schedule_key(message)),
+                self._global_llm_slot(),
+            ):
+                trace.record("queue_wait", time.monotonic() - queued)
+                stream = open_stream(self.provider, chat_messages, result, **sampling)
+                if cache_key and self.response_cache:
+                    stream = self.response_cache.record(cache_key, stream, result)
+                await self._stream_reply(stream, message, trace, result)
+        except QueueFullError as e:
+            logging.warning("Reply to %s not generated: %s", message.id, e)
+            trace.finish("rejected")
+            await message.reply(
+                "I'm a bit busy right now, please try again in a moment.",
+                mention_author=True,
+            )
+
+    def _global_llm_slot(self):
+        if self.llm_global_slots is None:
+            return contextlib.nullcontext()
+        return self.llm_global_slots.slot()
+
+    @contextlib.asynccontextmanager
+    async def _background_llm_slot(self):
+        """
+        LLM slot of a background request: only granted when no reply waits.
+        """
+        async with self.llm_scheduler.background_slot(), self._global_llm_slot():
+            yield
+
+    def _create_editor(self, message: discord.Message) -> StreamEditor:
+        """
+        Editor of a new reply, configured with the current settings. Editors
+        of replies in flight keep the settings they were created with.
+        """
+        settings = self.settings
+        return StreamEditor(
             message,
-            safe_edit_length=self.settings.safe_edit_length,
-            edit_every_n_chunks=self.settings.edit_every_n_chunks,
-            edit_min_interval_ms=self.settings.edit_min_interval_ms,
+            safe_edit_length=settings.safe_edit_length,
+            edit_min_delta_chars=settings.edit_min_delta_chars,
+            edit_min_interval_ms=settings.edit_min_interval_ms,
+            budget=self.edit_budgets.get(message.channel.id),
         )
+
+    async def _stream_reply(
+        self,
+        stream,
+        message: discord.Message,
+        trace: Trace,
+        result: StreamResult | None = None,
+    ):
+        editor = self._create_editor(message)
+        status = "ok"
+        chars = 0
+        started = time.monotonic()
+        first_token = None
         try:
-            stream = self.provider.stream_chat(chat_messages, temperature=0.2)
             async for chunk in stream:
+                if first_token is None:
+                    first_token = time.monotonic()
+                    trace.record("provider_ttft", first_token - started)
+                    trace.mark("first_token")
+                chars += len(chunk)
                 await editor.on_stream_chunk(chunk, force=False)
-            await editor.on_stream_chunk("", force=True)
+            trace.record("generation", time.monotonic() - started)
+            with trace.span("final_flush"):
+                await editor.on_stream_chunk("", force=True)
+        except asyncio.CancelledError:
+            # Superseded by a newer message: stop the upstream generation and
+            # leave whatever was already streamed in place.
+            status = "cancelled"
+            await stream.aclose()
+            if editor.reply_message:
+                await editor.on_stream_chunk("", force=True)
+            raise
         except Exception as e:
-            print(f"Error processing message: {e}")
+            status = "error"
+            logging.exception("Error processing message: %s", e)
             await message.channel.send(
                 "An error occurred while processing your message, please contact support."
             )
+        finally:
+            editor.close()
+            if self.retriever:
+                for reply, content in zip(editor.messages, editor.contents):
+                    self.retriever.update(
+                        reply.channel.id,
+                        reply.id,
+                        content,
+                        author=reply.author.display_name,
+                    )
+            result = result or StreamResult()
+            # Prefer the usage reported by the provider over the estimate.
+            tokens = result.completion_tokens or chars / CHARS_PER_TOKEN
+            REGISTRY.inc("llm_completion_tokens_total", tokens)
+            if result.prompt_tokens:
+                REGISTRY.inc("llm_prompt_tokens_total", result.prompt_tokens)
+            if result.cached_tokens:
+                REGISTRY.inc("llm_cached_prompt_tokens_total", result.cached_tokens)
+            REGISTRY.inc("discord_edits_total", editor.edits)
+            REGISTRY.inc("discord_edits_skipped_total", editor.skipped_edits)
+            streaming = time.monotonic() - first_token if first_token else 0
+            trace.finish(
+                status,
+                completion_tokens=round(tokens),
+                prompt_tokens=result.prompt_tokens,
+                cached_tokens=result.cached_tokens,
+                finish_reason=result.finish_reason,
+                tokens_per_second=round(tokens / streaming, 2) if streaming else None,
+                edits=editor.edits,
+                skipped_edits=editor.skipped_edits,
+                messages=len(editor.messages),
+            )
@@ -0,0 +1,132 @@
+"""
+Multi-process launcher for sharded bots.
+It splits the shards of the bot into contiguous ranges and runs one `app.py`
+process per range, restarting a process when it exits with an error. The
+processes coordinate bot-wide limits through STATE_STORE_URL (e.g. Redis).
+
+Run from the `source` directory, e.g.:
+    python launcher.py --processes 4
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import sys
+import time
+from typing import Dict, List
+
+import discord
+
+from core.config import Settings, process_environ
+
+
+async def recommended_shard_count(token: str) -> int:
+    """
+    Number of shards Discord recommends for the bot.
+    """
+    http = discord.http.HTTPClient(asyncio.get_running_loop())
+    try:
+        await http.static_login(token)
+        shard_count, _ = await http.get_bot_gateway()
+        return shard_count
+    finally:
+        await http.close()
+
+
+def shard_ranges(shard_count: int, processes: int) -> List[List[int]]:
+    """
+    Split the shards into `processes` contiguous ranges of near-equal size.
+    """
+    processes = max(1, min(processes, shard_count))
+    size, extra = divmod(shard_count, processes)
+    ranges, start = [], 0
+    for i in range(processes):
+        end = start + size + (1 if i < extra else 0)
+        ranges.append(list(range(start, end)))
+        start = end
+    return ranges
+
+
+def worker_env(
+    settings: Settings, index: int, shard_ids: List[int], shard_count: int
+) -> Dict[str, str]:
+    """
+    Environment of one worker process. Variables of the .env file are left
+    out, so they don't take precedence over the file when it is reloaded.
+    """
+    env = process_environ()
+    env["SHARD_COUNT"] = str(shard_count)
+    env["SHARD_IDS"] = f"{shard_ids[0]}-{shard_ids[-1]}"
+    if settings.metrics_port:
+        env["METRICS_PORT"] = str(settings.metrics_port + index)
+    if settings.metrics_jsonl_path:
+        env["METRICS_JSONL_PATH"] = f"{settings.metrics_jsonl_path}.{index}"
+    return env
+
+
+async def run_worker(
+    index: int,
+    env: Dict[str, str],
+    max_backoff: float = 60,
+    stable_seconds: float = 300,
+):
+    """
+    Run one worker process, restarting it with backoff when it fails. The
+    backoff starts over once a worker stayed up for `stable_seconds`.
+    """
+    backoff = 1.0
+    app = os.path.join(os.path.dirname(os.path.abspath(__file__)), "app.py")
+    while True:
+        logging.info("Starting worker %d (shards %s)", index, env["SHARD_IDS"])
+        started = time.monotonic()
+        process = await asyncio.create_subprocess_exec(sys.executable, app, env=env)
+        code = await process.wait()
+        if code == 0:
+            logging.info("Worker %d exited", index)
+            return
+        if time.monotonic() - started >= stable_seconds:
+            backoff = 1.0
+        logging.error(
+            "Worker %d exited with %d, restarting in %ss", index, code, backoff
+        )
+        await asyncio.sleep(backoff)
+        backoff = min(backoff * 2, max_backoff)
+
+
+async def main(argv=None):
+    """
+    Compute the shard layout and supervise the workers.
+    """
+    args = argparse.ArgumentParser(description=__doc__)
+    args.add_argument("--processes", type=int, default=os.cpu_count() or 1)
+    args.add_argument(
+        "--shard-count",
+        type=int,
+        help="total shards (default: SHARD_COUNT, or Discord's recommendation)",
+    )
+    options = args.parse_args(argv)
+
+    settings = Settings.get_settings()
+    shard_count = options.shard_count or settings.shard_count
+    if not shard_count:
+        shard_count = await recommended_shard_count(settings.discord_token)
+    if options.processes > 1 and not settings.state_store_url:
+        logging.warning(
+            "STATE_STORE_URL is not set: bot-wide limits won't be shared "
+            "between the worker processes."
+        )
+
+    ranges = shard_ranges(shard_count, options.processes)
+    logging.info("Running %d shards in %d processes", shard_count, len(ranges))
+    await asyncio.gather(
+        *(
+            run_worker(i, worker_env(settings, i, shard_ids, shard_count))
+            for i, shard_ids in enumerate(ranges)
+        )
+    )
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(main())
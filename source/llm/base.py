@@ -1,14 +1,39 @@
-from typing import AsyncGenerator, Protocol, List, Dict, Any
+from dataclasses import dataclass, fields
+from typing import AsyncGenerator, AsyncIterator, Protocol, List, Dict, Any, Optional
 
 # {"role": "system|user|assistant", "content": "..."}
 ChatMessage = Dict[str, str]
 
 
+@dataclass
+class StreamResult:
+    """
+    Outcome of a stream, filled by the provider when the stream ends.
+    Callers opt in by passing one to `open_stream`; fields the provider
+    doesn't report stay None.
+    """
+
+    finish_reason: Optional[str] = None
+    prompt_tokens: Optional[int] = None
+    completion_tokens: Optional[int] = None
+    cached_tokens: Optional[int] = None
+
+    def update(self, other: "StreamResult"):
+        """
+        Copy the fields of another result into this one.
+        """
+        for field in fields(self):
+            setattr(self, field.name, getattr(other, field.name))
+
+
 class ChatProvider(Protocol):
     """
     Protocol for chat providers that can handle streaming chat messages.
     """
 
+    # Whether `stream_chat` accepts a `result` keyword (see `open_stream`).
+    reports_result = False
+
     async def stream_chat(
         self,
         messages: List[ChatMessage],
@@ -16,5 +41,43 @@ class ChatProvider(Protocol):
     ) -> AsyncGenerator[str, None]:
         """
         Streams chat messages from the provider.
+        Providers that set `reports_result` also accept a `result` keyword
+        (StreamResult) that receives the finish reason and token usage once
+        the stream ends.
         """
         raise NotImplementedError("stream_chat must be implemented by the provider.")
+
+    async def warmup(self):
+        """
+        Open connections ahead of the first request. Optional for providers.
+        """
+
+
+def open_stream(
+    provider: ChatProvider,
+    messages: List[ChatMessage],
+    result: Optional[StreamResult] = None,
+    **kwargs: Any,
+) -> AsyncIterator[str]:
+    """
+    Stream from `provider`, passing `result` only to the providers that report
+    one. For the others, the finish reason is filled in when the stream ends,
+    and the token usage stays unknown.
+    """
+    if result is not None and getattr(provider, "reports_result", False):
+        return provider.stream_chat(messages, result=result, **kwargs)
+    stream = provider.stream_chat(messages, **kwargs)
+    if result is None:
+        return stream
+    return _fill_result(stream, result)
+
+
+async def _fill_result(
+    stream: AsyncGenerator[str, None], result: StreamResult
+) -> AsyncGenerator[str, None]:
+    try:
+        async for chunk in stream:
+            yield chunk
+        result.finish_reason = "stop"
+    finally:
+        await stream.aclose()
@@ -0,0 +1,260 @@
+"""
+Response cache for repeated prompts.
+Answers are keyed on a normalized hash of the model, the system prompt, the
+trailing messages of the conversation and the sampling parameters, and stored
+in a pluggable backend (in-memory or SQLite) with LRU + TTL eviction.
+"""
+
+import asyncio
+import hashlib
+import json
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Any, AsyncGenerator, Dict, List, Optional, Protocol, Tuple
+
+from llm.base import ChatMessage, StreamResult
+
+# "{author} said: " prefix added when rendering the channel history.
+_AUTHOR_PREFIX = re.compile(r"^[^\n:]{1,100} said: ")
+_PUNCTUATION = re.compile(r"[^\w\s]")
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_text(text: str) -> str:
+    """
+    Normalize a message so trivially different phrasings share a cache key:
+    author prefix, case, punctuation and whitespace are ignored.
+    """
+    text = _AUTHOR_PREFIX.sub("", text)
+    text = unicodedata.normalize("NFKC", text).casefold()
+    text = _PUNCTUATION.sub(" ", text)
+    return _WHITESPACE.sub(" ", text).strip()
+
+
+class CacheBackend(Protocol):
+    """
+    Storage of cached responses.
+    """
+
+    async def get(self, key: str) -> Optional[str]:
+        """
+        Return the cached value of `key` if present and not expired.
+        """
+        raise NotImplementedError
+
+    async def set(self, key: str, value: str):
+        """
+        Store a value, evicting the least recently used entries if needed.
+        """
+        raise NotImplementedError
+
+
+class MemoryCacheBackend(CacheBackend):
+    """
+    In-process LRU + TTL cache.
+    """
+
+    def __init__(self, max_entries: int, ttl_seconds: float):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+
+    async def get(self, key: str) -> Optional[str]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at < time.time():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    async def set(self, key: str, value: str):
+        self._entries[key] = (time.time() + self.ttl_seconds, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+
+class SQLiteCacheBackend(CacheBackend):
+    """
+    On-disk LRU + TTL cache stored in a SQLite database, so it survives restarts.
+    Queries run in a worker thread to keep the event loop free.
+    """
+
+    def __init__(self, path: str, max_entries: int, ttl_seconds: float):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._db:
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, "
+                "expires_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+            )
+            self._db.execute(
+                "CREATE INDEX IF NOT EXISTS responses_accessed "
+                "ON responses (accessed_at)"
+            )
+
+    def _get(self, key: str) -> Optional[str]:
+        now = time.time()
+        with self._lock, self._db:
+            row = self._db.execute(
+                "SELECT value, expires_at FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            if row[1] < now:
+                self._db.execute("DELETE FROM responses WHERE key = ?", (key,))
+                return None
+            self._db.execute(
+                "UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key)
+            )
+            return row[0]
+
+    def _set(self, key: str, value: str):
+        now = time.time()
+        with self._lock, self._db:
+            self._db.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?)",
+                (key, value, now + self.ttl_seconds, now),
+            )
+            self._db.execute("DELETE FROM responses WHERE expires_at < ?", (now,))
+            self._db.execute(
+                "DELETE FROM responses WHERE key IN (SELECT key FROM responses "
+                "ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
+
+    async def get(self, key: str) -> Optional[str]:
+        return await asyncio.to_thread(self._get, key)
+
+    async def set(self, key: str, value: str):
+        await asyncio.to_thread(self._set, key, value)
+
+
+class ResponseCache:
+    """
+    Cache of complete answers in front of a chat provider.
+
+    Parameters
+    ----------
+    backend : CacheBackend
+        Where the answers are stored.
+    model : str
+        Model name, part of the key.
+    trailing_messages : int
+        Number of non-system messages, counted from the end, part of the key.
+        Several are needed for the key to reflect the conversation, not only
+        the last message.
+    min_chars : int
+        Requests whose last message is shorter than this once normalized
+        ("yes", "why?") depend on the conversation and are not cached.
+    max_temperature : float
+        Requests sampled above this temperature are not cached.
+    """
+
+    # Cached answers are replayed in chunks, to stream like live ones.
+    REPLAY_CHUNK_CHARS = 40
+    REPLAY_DELAY_SECONDS = 0.03
+
+    def __init__(
+        self,
+        backend: CacheBackend,
+        model: str,
+        trailing_messages: int = 3,
+        min_chars: int = 16,
+        max_temperature: float = 0.3,
+    ):
+        self.backend = backend
+        self.model = model
+        self.trailing_messages = trailing_messages
+        self.min_chars = min_chars
+        self.max_temperature = max_temperature
+        self.hits = 0
+        self.misses = 0
+
+    def key_for(self, messages: List[ChatMessage], **kwargs: Any) -> Optional[str]:
+        """
+        Cache key of a request, or None if the request must not be cached.
+        """
+        temperature = kwargs.get("temperature", 1.0)
+        if temperature is None or temperature > self.max_temperature:
+            return None
+
+        system = [m["content"] for m in messages if m["role"] == "system"]
+        history = [m for m in messages if m["role"] != "system"]
+        if not history:
+            return None
+        trailing = [
+            (m["role"], normalize_text(m["content"]))
+            for m in history[-self.trailing_messages :]
+        ]
+        if len(trailing[-1][1]) < self.min_chars:
+            return None
+        params: Dict[str, Any] = {k: v for k, v in kwargs.items() if v is not None}
+        raw = json.dumps(
+            [self.model, system, trailing, params], sort_keys=True, ensure_ascii=False
+        )
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    async def lookup(
+        self, messages: List[ChatMessage], **kwargs: Any
+    ) -> Tuple[Optional[str], Optional[str]]:
+        """
+        Return the cache key of a request and the cached answer, if any.
+        """
+        key = self.key_for(messages, **kwargs)
+        if key is None:
+            return None, None
+        cached = await self.backend.get(key)
+        if cached is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return key, cached
+
+    async def replay(
+        self, text: str, result: Optional[StreamResult] = None
+    ) -> AsyncGenerator[str, None]:
+        """
+        Stream a cached answer in chunks.
+        Only complete answers are stored, so the finish reason is "stop".
+        """
+        for i in range(0, len(text), self.REPLAY_CHUNK_CHARS):
+            if i:
+                await asyncio.sleep(self.REPLAY_DELAY_SECONDS)
+            yield text[i : i + self.REPLAY_CHUNK_CHARS]
+        if result is not None:
+            result.finish_reason = "stop"
+
+    async def record(
+        self,
+        key: str,
+        stream: AsyncGenerator[str, None],
+        result: Optional[StreamResult] = None,
+    ) -> AsyncGenerator[str, None]:
+        """
+        Pass a live stream through, storing the answer once it completes.
+        Interrupted or failed streams are not stored, nor answers cut short by
+        the provider (any finish reason other than "stop" in `result`, the one
+        the live stream reports into).
+        """
+        chunks: List[str] = []
+        try:
+            async for chunk in stream:
+                chunks.append(chunk)
+                yield chunk
+        finally:
+            await stream.aclose()
+        if result is not None and result.finish_reason not in (None, "stop"):
+            return
+        if chunks:
+            await self.backend.set(key, "".join(chunks))
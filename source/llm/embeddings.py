@@ -0,0 +1,92 @@
+"""
+Embedding providers used by the retrieval index.
+Embeddings come from any OpenAI-compatible /embeddings endpoint, or from a
+local deterministic hash of the words, which needs no model at all.
+"""
+
+import hashlib
+import math
+import re
+from typing import List, Protocol
+
+_WORD = re.compile(r"\w+")
+
+
+class EmbeddingProvider(Protocol):
+    """
+    Protocol for providers that turn texts into fixed-size vectors.
+    """
+
+    dimensions: int
+
+    async def embed(self, texts: List[str]) -> List[List[float]]:
+        """
+        Embed a batch of texts, one vector of `dimensions` floats per text.
+        """
+        raise NotImplementedError("embed must be implemented by the provider.")
+
+
+class HashEmbeddingProvider(EmbeddingProvider):
+    """
+    Deterministic local embeddings: words and word pairs hashed into a signed
+    bag of features, L2-normalized. It matches shared words rather than
+    meanings, which is enough for tests and offline runs.
+    """
+
+    def __init__(self, dimensions: int = 256):
+        self.dimensions = dimensions
+
+    def _embed_one(self, text: str) -> List[float]:
+        vector = [0.0] * self.dimensions
+        words = _WORD.findall(text.casefold())
+        features = words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+        for feature in features:
+            digest = hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest()
+            value = int.from_bytes(digest, "little")
+            vector[value % self.dimensions] += 1.0 if value >> 63 else -1.0
+        norm = math.sqrt(sum(x * x for x in vector))
+        return [x / norm for x in vector] if norm else vector
+
+    async def embed(self, texts: List[str]) -> List[List[float]]:
+        return [self._embed_one(text) for text in texts]
+
+
+class OpenAIEmbeddingProvider(EmbeddingProvider):
+    """
+    Embeddings from an OpenAI-compatible API. The vectors are requested with
+    `dimensions` components, which the text-embedding-3 models support.
+    """
+
+    def __init__(
+        self,
+        api_key: str | None,
+        model: str,
+        dimensions: int,
+        base_url: str = "",
+        *,
+        http_client=None,
+    ):
+        # Imported here, the openai package is slow to import.
+        try:
+            from openai import AsyncOpenAI
+        except ImportError:
+            raise RuntimeError(
+                "openai package is not installed. Please install it to use OpenAIEmbeddingProvider."
+            )
+        self.client = AsyncOpenAI(
+            api_key=api_key, base_url=base_url or None, http_client=http_client
+        )
+        self.model = model
+        self.dimensions = dimensions
+
+    async def embed(self, texts: List[str]) -> List[List[float]]:
+        response = await self.client.embeddings.create(
+            model=self.model, input=texts, dimensions=self.dimensions
+        )
+        vectors = [d.embedding for d in sorted(response.data, key=lambda d: d.index)]
+        if vectors and len(vectors[0]) != self.dimensions:
+            raise ValueError(
+                f"{self.model} returned {len(vectors[0])} dimensions, "
+                f"RAG_DIMENSIONS is {self.dimensions}."
+            )
+        return vectors
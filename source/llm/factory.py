@@ -0,0 +1,115 @@
+"""
+Builds the chat provider described by the settings.
+A single OpenAI-compatible provider by default, or a router over several
+backends when LLM_BACKENDS is set. Also builds the embedding provider of the
+retrieval index. Provider modules are imported only when they are configured:
+the openai package alone takes a large part of the startup time.
+"""
+
+import json
+from typing import TYPE_CHECKING, Any, Dict
+
+from core.config import Settings
+from llm.base import ChatProvider
+
+if TYPE_CHECKING:
+    from llm.embeddings import EmbeddingProvider
+    from llm.router import Backend
+
+
+def _build_openai(settings: Settings, config: Dict[str, Any], retries: int):
+    from llm.openai_provider import OpenAIProvider, build_http_client
+
+    return OpenAIProvider(
+        api_key=config.get("api_key", settings.llm_api_key),
+        model=config.get("model", settings.model),
+        base_url=config.get("base_url", settings.llm_base_url),
+        http_client=build_http_client(
+            max_connections=settings.llm_max_connections,
+            max_keepalive_connections=settings.llm_max_keepalive_connections,
+            keepalive_expiry_seconds=settings.llm_keepalive_expiry_seconds,
+            http2=settings.llm_http2,
+            connect_timeout_ms=settings.llm_connect_timeout_ms,
+            read_timeout_ms=settings.llm_read_timeout_ms,
+        ),
+        first_token_timeout_ms=config.get(
+            "first_token_timeout_ms", settings.llm_first_token_timeout_ms
+        ),
+        retries=config.get("retries", retries),
+        flush_window_ms=config.get("stream_flush_ms", settings.llm_stream_flush_ms),
+        flush_chars=config.get("stream_flush_chars", settings.llm_stream_flush_chars),
+        stream_usage=config.get("stream_usage", settings.llm_stream_usage),
+    )
+
+
+def _build_backend(settings: Settings, config: Dict[str, Any]) -> "Backend":
+    """
+    Build one routed backend from its LLM_BACKENDS entry.
+    """
+    from llm.router import Backend
+
+    kind = config.get("type", "openai")
+    name = config.get("name", kind)
+    if kind == "fake":
+        from llm.fake_provider import FakeProvider
+
+        provider: ChatProvider = FakeProvider(
+            config.get("response", "This is a fake answer."),
+            ttft_ms=config.get("ttft_ms", 0),
+            tokens_per_second=config.get("tokens_per_second", 0),
+            fail=config.get("fail", False),
+        )
+    elif kind == "openai":
+        # The router fails over to another backend instead of retrying.
+        provider = _build_openai(settings, config, retries=0)
+    else:
+        raise ValueError(f"Unknown LLM backend type: {kind}")
+    return Backend(name, provider)
+
+
+def build_provider(settings: Settings) -> ChatProvider:
+    """
+    Create the chat provider used to answer messages.
+
+    LLM_BACKENDS is a JSON list of backends, e.g.
+    [{"name": "local", "base_url": "http://ollama:11434/v1", "model": "llama3"},
+     {"name": "hosted", "base_url": "https://api.openai.com/v1", "api_key": "..."}]
+    Missing keys fall back to the LLM_* settings.
+    """
+    if not settings.llm_backends:
+        return _build_openai(settings, {}, retries=settings.llm_retries)
+
+    from llm.router import RouterProvider
+
+    configs = json.loads(settings.llm_backends)
+    return RouterProvider(
+        [_build_backend(settings, config) for config in configs],
+        first_token_timeout_ms=settings.llm_first_token_timeout_ms,
+        hedge_after_ms=settings.llm_hedge_after_ms,
+        probe_interval_ms=settings.llm_probe_interval_ms,
+    )
+
+
+def build_embedding_provider(settings: Settings) -> "EmbeddingProvider":
+    """
+    Create the embedding provider of the retrieval index (RAG_EMBEDDINGS):
+    "hash" for local deterministic embeddings, "openai" for the LLM_* API.
+    """
+    from llm.embeddings import HashEmbeddingProvider, OpenAIEmbeddingProvider
+
+    if settings.rag_embeddings == "hash":
+        return HashEmbeddingProvider(settings.rag_dimensions)
+    if settings.rag_embeddings == "openai":
+        from llm.openai_provider import build_http_client
+
+        return OpenAIEmbeddingProvider(
+            api_key=settings.llm_api_key,
+            model=settings.rag_embedding_model,
+            dimensions=settings.rag_dimensions,
+            base_url=settings.llm_base_url,
+            http_client=build_http_client(
+                connect_timeout_ms=settings.llm_connect_timeout_ms,
+                read_timeout_ms=settings.llm_read_timeout_ms,
+            ),
+        )
+    raise ValueError(f"Unknown RAG_EMBEDDINGS provider: {settings.rag_embeddings}")
@@ -0,0 +1,65 @@
+"""
+Offline chat provider that streams a canned answer.
+Useful to exercise the reply pipeline (routing, scheduling, editing) without
+any LLM server: time to first token, throughput and failures are configurable.
+"""
+
+import asyncio
+from typing import Any, AsyncGenerator, List
+
+from llm.base import ChatMessage, ChatProvider
+
+
+class FakeProvider(ChatProvider):
+    """
+    Chat provider that streams `response` word by word.
+
+    Parameters
+    ----------
+    response : str
+        Text streamed back for every request.
+    ttft_ms : float
+        Delay before the first chunk.
+    tokens_per_second : float
+        Streaming rate after the first chunk (0 streams without delay).
+    fail : bool
+        Raise an error instead of answering, before the first chunk.
+    """
+
+    reports_result = True
+
+    def __init__(
+        self,
+        response: str = "This is a fake answer.",
+        *,
+        ttft_ms: float = 0,
+        tokens_per_second: float = 0,
+        fail: bool = False,
+    ):
+        self.response = response
+        self.ttft = ttft_ms / 1000.0
+        self.tokens_per_second = tokens_per_second
+        self.fail = fail
+        self.calls = 0
+
+    async def stream_chat(
+        self, messages: List[ChatMessage], **kwargs: Any
+    ) -> AsyncGenerator[str, None]:
+        """
+        Streams the canned response.
+        """
+        result = kwargs.pop("result", None)
+        self.calls += 1
+        await asyncio.sleep(self.ttft)
+        if self.fail:
+            raise RuntimeError("Fake provider failure.")
+
+        delay = 1 / self.tokens_per_second if self.tokens_per_second > 0 else 0
+        words = self.response.split(" ")
+        for i, word in enumerate(words):
+            if i and delay:
+                await asyncio.sleep(delay)
+            yield word if i == len(words) - 1 else word + " "
+        if result is not None:
+            result.finish_reason = "stop"
+            result.completion_tokens = len(words)
@@ -4,36 +4,163 @@ Also compatible with Groq, Anthropic, and other OpenAI-compatible APIs.
 """
 
 import asyncio
-from typing import Any, AsyncGenerator, List
+import importlib.util
+import logging
+import random
+import time
+from typing import Any, AsyncGenerator, List, Tuple
 
-from llm.base import ChatMessage, ChatProvider
+from llm.base import ChatMessage, ChatProvider, StreamResult
 
 try:
-    from openai import AsyncOpenAI
+    import httpx
+    from openai import (
+        APIConnectionError,
+        AsyncOpenAI,
+        InternalServerError,
+        RateLimitError,
+    )
     from openai._streaming import AsyncStream
 except ImportError:
     AsyncOpenAI = None  # para test sin dependencia
 
 
+def build_http_client(
+    *,
+    max_connections: int = 100,
+    max_keepalive_connections: int = 20,
+    keepalive_expiry_seconds: float = 60,
+    http2: bool = False,
+    connect_timeout_ms: int = 5000,
+    read_timeout_ms: int = 60000,
+) -> "httpx.AsyncClient":
+    """
+    Pooled keep-alive HTTP client for the OpenAI SDK.
+    The read timeout bounds the silence between two streamed events.
+    HTTP/2 needs the optional `h2` package and is disabled without it.
+    """
+    if http2 and importlib.util.find_spec("h2") is None:
+        logging.warning(
+            "HTTP/2 requested but the h2 package is missing, using HTTP/1.1"
+        )
+        http2 = False
+    return httpx.AsyncClient(
+        http2=http2,
+        limits=httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry_seconds,
+        ),
+        timeout=httpx.Timeout(
+            connect=connect_timeout_ms / 1000.0,
+            read=read_timeout_ms / 1000.0,
+            write=connect_timeout_ms / 1000.0,
+            pool=connect_timeout_ms / 1000.0,
+        ),
+    )
+
+
+def _consume(event, result: StreamResult) -> str:
+    """
+    Record the finish reason and usage carried by an event, return its text.
+    """
+    usage = event.usage
+    if usage is not None:
+        result.prompt_tokens = usage.prompt_tokens
+        result.completion_tokens = usage.completion_tokens
+        details = usage.prompt_tokens_details
+        if details is not None:
+            result.cached_tokens = details.cached_tokens
+    # llama.cpp reports its KV cache reuse in a non-standard `timings` field.
+    timings = (event.model_extra or {}).get("timings")
+    if isinstance(timings, dict) and result.cached_tokens is None:
+        result.cached_tokens = timings.get("cache_n")
+    if not event.choices:
+        return ""
+    choice = event.choices[0]
+    if choice.finish_reason:
+        result.finish_reason = choice.finish_reason
+    return (choice.delta.content if choice.delta else None) or ""
+
+
 class OpenAIProvider(ChatProvider):
     """
     OpenAI chat provider for streaming chat completions.
     Also compatible with Groq, Anthropic, and other OpenAI-compatible APIs.
+
+    Requests that fail or stay silent for `first_token_timeout_ms` before the
+    first token are retried up to `retries` times with jittered exponential
+    backoff. Once a token has been streamed, errors are raised as they are.
+
+    After the first token, deltas are coalesced: a batch is yielded at most
+    `flush_window_ms` after its first delta arrived, even if the stream stays
+    silent, or once `flush_chars` characters are buffered, so consumers run
+    per batch rather than per token.
+    With `stream_usage`, the token usage is requested at the end of the stream.
     """
 
-    def __init__(self, api_key: str | None, model: str, base_url: str = ""):
+    reports_result = True
+
+    # Base delay between two attempts, doubled at each retry.
+    RETRY_BACKOFF_SECONDS = 0.5
+
+    def __init__(
+        self,
+        api_key: str | None,
+        model: str,
+        base_url: str = "",
+        *,
+        http_client: "httpx.AsyncClient | None" = None,
+        first_token_timeout_ms: int = 0,
+        retries: int = 0,
+        flush_window_ms: int = 50,
+        flush_chars: int = 256,
+        stream_usage: bool = True,
+    ):
         if AsyncOpenAI is None:
             raise RuntimeError(
                 "openai package is not installed. Please install it to use OpenAIProvider."
             )
-        self.client = AsyncOpenAI(api_key=api_key, base_url=base_url)
+        # Retries are handled here, where the first-token deadline is known.
+        self.client = AsyncOpenAI(
+            api_key=api_key,
+            base_url=base_url or None,
+            http_client=http_client,
+            max_retries=0,
+        )
         self.model = model
+        self.first_token_timeout = first_token_timeout_ms / 1000.0 or None
+        self.retries = retries
+        self.flush_window = flush_window_ms / 1000.0
+        self.flush_chars = flush_chars
+        self.stream_usage = stream_usage
+        self._retryable = (
+            APIConnectionError,
+            RateLimitError,
+            InternalServerError,
+            asyncio.TimeoutError,
+        )
 
-    async def stream_chat(
-        self, messages: List[ChatMessage], **kwargs: Any
-    ) -> AsyncGenerator[str, None]:
+    async def warmup(self):
         """
-        Streams chat messages from the OpenAI API.
+        Open a pooled connection (DNS, TCP, TLS) before the first request.
+        """
+        start = time.monotonic()
+        try:
+            await self.client.models.list()
+            logging.info(
+                "LLM connection to %s warmed up in %.0f ms",
+                self.client.base_url,
+                (time.monotonic() - start) * 1000,
+            )
+        except Exception as e:
+            logging.warning("LLM warmup failed: %s", e)
+
+    async def _open(
+        self, messages: List[ChatMessage], kwargs: Any, result: StreamResult
+    ) -> Tuple["AsyncStream", str]:
+        """
+        Start a stream and wait for its first non-empty delta.
         """
         resp = await self.client.chat.completions.create(
             model=self.model, messages=messages, stream=True, **kwargs
@@ -42,11 +169,87 @@ class OpenAIProvider(ChatProvider):
         if not isinstance(resp, AsyncStream):
             raise TypeError("The response is not an AsyncStream.")
 
-        async for event in resp:
+        try:
+            async for event in resp:
+                delta = _consume(event, result)
+                if delta:
+                    return resp, delta
+            return resp, ""
+        except BaseException:
+            await resp.close()
+            raise
+
+    async def stream_chat(
+        self, messages: List[ChatMessage], **kwargs: Any
+    ) -> AsyncGenerator[str, None]:
+        """
+        Streams chat messages from the OpenAI API.
+        """
+        result = kwargs.pop("result", None)
+        if result is None:
+            result = StreamResult()
+        if self.stream_usage:
+            kwargs.setdefault("stream_options", {"include_usage": True})
+
+        attempt = 0
+        while True:
             try:
-                delta = event.choices[0].delta.content or ""
-            except Exception:
-                delta = ""
-            if delta:
-                yield delta
-            await asyncio.sleep(0)
+                resp, first = await asyncio.wait_for(
+                    self._open(messages, kwargs, result), self.first_token_timeout
+                )
+                break
+            except self._retryable as e:
+                if attempt >= self.retries:
+                    raise
+                delay = self.RETRY_BACKOFF_SECONDS * 2**attempt
+                delay *= random.uniform(0.5, 1.5)
+                attempt += 1
+                logging.warning(
+                    "LLM request failed before the first token (%s), retry %d in %.1fs",
+                    type(e).__name__,
+                    attempt,
+                    delay,
+                )
+                await asyncio.sleep(delay)
+
+        events = resp.__aiter__()
+        next_event: "asyncio.Future | None" = None
+        try:
+            if first:
+                yield first
+            buffer: List[str] = []
+            size = 0
+            deadline = 0.0
+            while True:
+                if next_event is None:
+                    next_event = asyncio.ensure_future(events.__anext__())
+                # Wait for the next event, but no longer than the buffered
+                # deltas may wait.
+                timeout = max(0.0, deadline - time.monotonic()) if buffer else None
+                done, _ = await asyncio.wait({next_event}, timeout=timeout)
+                if done:
+                    try:
+                        event = next_event.result()
+                    except StopAsyncIteration:
+                        break
+                    finally:
+                        next_event = None
+                    delta = _consume(event, result)
+                    if not delta:
+                        continue
+                    if not buffer:
+                        deadline = time.monotonic() + self.flush_window
+                    buffer.append(delta)
+                    size += len(delta)
+                    if size < self.flush_chars and time.monotonic() < deadline:
+                        continue
+                yield "".join(buffer)
+                buffer.clear()
+                size = 0
+            if buffer:
+                yield "".join(buffer)
+        finally:
+            if next_event is not None:
+                next_event.cancel()
+            # Release the HTTP stream when the consumer stops early (cancellation).
+            await resp.close()
@@ -0,0 +1,259 @@
+"""
+Chat provider that routes requests across several backends.
+Backends are ranked by their rolling time-to-first-token percentiles. Errors
+and timeouts before the first token fail over to the next backend, and a
+second request can be hedged on another backend when the first token is late.
+Failed backends are ranked last for a while, and backends left unused are
+periodically probed, so the ranking recovers when a backend does.
+"""
+
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Any, AsyncGenerator, Deque, List, Optional, Set, Tuple
+
+from llm.base import ChatMessage, ChatProvider, StreamResult, open_stream
+
+
+class Backend:
+    """
+    A routed provider and its rolling latency statistics.
+    """
+
+    # Number of recent time-to-first-token samples kept per backend.
+    SAMPLES = 100
+
+    def __init__(self, name: str, provider: ChatProvider):
+        self.name = name
+        self.provider = provider
+        self.ttft: Deque[float] = deque(maxlen=self.SAMPLES)
+        self.failures = 0
+        # A failed backend is ranked last until then (monotonic time).
+        self.demoted_until = 0.0
+        # Last time a request was sent to the backend.
+        self.last_used = time.monotonic()
+
+    def percentile(self, p: float) -> Optional[float]:
+        """
+        Time to first token percentile in seconds, None without samples.
+        """
+        if not self.ttft:
+            return None
+        samples = sorted(self.ttft)
+        return samples[min(len(samples) - 1, int(p * len(samples)))]
+
+
+class _Attempt:
+    def __init__(
+        self,
+        backend: Backend,
+        stream: AsyncGenerator[str, None],
+        result: StreamResult,
+    ):
+        self.backend = backend
+        self.stream = stream
+        self.result = result
+        self.started = time.monotonic()
+        self.first = asyncio.ensure_future(stream.__anext__())
+
+    async def close(self):
+        if not self.first.done():
+            self.first.cancel()
+        await asyncio.gather(self.first, return_exceptions=True)
+        try:
+            await self.stream.aclose()
+        except Exception as e:
+            logging.debug("Error closing %s stream: %s", self.backend.name, e)
+
+
+class RouterProvider(ChatProvider):
+    """
+    Latency-aware router with failover and optional hedged requests.
+
+    Parameters
+    ----------
+    backends : list[Backend]
+        Backends in order of preference, used until they have latency samples.
+    first_token_timeout_ms : int
+        Time a backend has to produce its first token before failing over.
+    hedge_after_ms : int
+        Start a second request on the next backend when the first token takes
+        longer than this. 0 disables hedging.
+    probe_interval_ms : int
+        How long a failed backend is ranked last, and how long a backend can
+        stay unused before it gets a request to refresh its latency samples.
+    """
+
+    reports_result = True
+
+    def __init__(
+        self,
+        backends: List[Backend],
+        *,
+        first_token_timeout_ms: int,
+        hedge_after_ms: int = 0,
+        probe_interval_ms: int = 30000,
+    ):
+        if not backends:
+            raise ValueError("RouterProvider needs at least one backend.")
+        self.backends = backends
+        self.first_token_timeout = first_token_timeout_ms / 1000.0
+        self.hedge_after = hedge_after_ms / 1000.0
+        self.probe_interval = probe_interval_ms / 1000.0
+        # Losing hedged attempts, kept until their first token is measured.
+        self._losers: Set[asyncio.Task] = set()
+
+    def ranked(self) -> List[Backend]:
+        """
+        Backends sorted by p95 time to first token. Backends without samples
+        keep their configured position at the front, so they get measured.
+        Failed backends come last, and the backend unused for the longest
+        time goes first once it was unused for `probe_interval_ms`, to be
+        measured again.
+        """
+        now = time.monotonic()
+        healthy = sorted(
+            (b for b in self.backends if b.demoted_until <= now),
+            key=lambda b: b.percentile(0.95) or 0.0,
+        )
+        demoted = sorted(
+            (b for b in self.backends if b.demoted_until > now),
+            key=lambda b: b.demoted_until,
+        )
+        if healthy:
+            stale = min(healthy, key=lambda b: b.last_used)
+            if stale is not healthy[0] and now - stale.last_used >= self.probe_interval:
+                logging.info("Probing LLM backend %s", stale.name)
+                healthy.remove(stale)
+                healthy.insert(0, stale)
+        return healthy + demoted
+
+    def _succeeded(self, attempt: _Attempt, now: float):
+        attempt.backend.ttft.append(now - attempt.started)
+        attempt.backend.demoted_until = 0.0
+
+    def _failed(self, attempt: _Attempt, error: BaseException):
+        backend = attempt.backend
+        backend.failures += 1
+        backend.demoted_until = time.monotonic() + self.probe_interval
+        logging.warning("LLM backend %s failed: %r", backend.name, error)
+
+    def _measure_loser(self, attempt: _Attempt):
+        """
+        Let a losing hedged attempt run until its first token, so its real
+        time to first token is recorded, then close it.
+        """
+
+        async def measure():
+            remaining = attempt.started + self.first_token_timeout - time.monotonic()
+            done, _ = await asyncio.wait([attempt.first], timeout=max(0.0, remaining))
+            if not done:
+                self._failed(attempt, asyncio.TimeoutError("No first token in time."))
+            else:
+                error = attempt.first.exception()
+                if error is None or isinstance(error, StopAsyncIteration):
+                    self._succeeded(attempt, time.monotonic())
+                else:
+                    self._failed(attempt, error)
+            await attempt.close()
+
+        task = asyncio.create_task(measure())
+        self._losers.add(task)
+        task.add_done_callback(self._losers.discard)
+
+    async def _first_token(
+        self, candidates: List[Backend], messages: List[ChatMessage], kwargs: Any
+    ) -> Tuple[_Attempt, Optional[str]]:
+        """
+        Wait for the first token of the first candidate, hedging on (or failing
+        over to) the next ones. Returns the winning attempt and its first chunk.
+        """
+        queue = list(candidates)
+        attempts: List[_Attempt] = []
+
+        def start():
+            # Each attempt reports into its own result, only the winner's is kept.
+            backend = queue.pop(0)
+            backend.last_used = time.monotonic()
+            result = StreamResult()
+            stream = open_stream(backend.provider, messages, result, **kwargs)
+            attempts.append(_Attempt(backend, stream, result))
+
+        start()
+        try:
+            while attempts:
+                now = time.monotonic()
+                wake = min(a.started + self.first_token_timeout for a in attempts)
+                can_hedge = self.hedge_after > 0 and queue and len(attempts) == 1
+                if can_hedge:
+                    wake = min(wake, attempts[0].started + self.hedge_after)
+
+                await asyncio.wait(
+                    [a.first for a in attempts],
+                    timeout=max(0.0, wake - now),
+                    return_when=asyncio.FIRST_COMPLETED,
+                )
+
+                now = time.monotonic()
+                for attempt in list(attempts):
+                    if attempt.first.done():
+                        error = attempt.first.exception()
+                        if error is None or isinstance(error, StopAsyncIteration):
+                            attempts.remove(attempt)
+                            self._succeeded(attempt, now)
+                            for loser in attempts:
+                                self._measure_loser(loser)
+                            attempts.clear()
+                            first = None if error else attempt.first.result()
+                            return attempt, first
+                    elif now - attempt.started >= self.first_token_timeout:
+                        error = asyncio.TimeoutError("No first token in time.")
+                    else:
+                        continue
+                    attempts.remove(attempt)
+                    self._failed(attempt, error)
+                    await attempt.close()
+
+                if queue and (
+                    not attempts
+                    or (can_hedge and now - attempts[0].started >= self.hedge_after)
+                ):
+                    if attempts:
+                        logging.info("First token late, hedging on %s", queue[0].name)
+                    start()
+            raise RuntimeError("All LLM backends failed before the first token.")
+        finally:
+            for attempt in attempts:
+                await attempt.close()
+
+    async def warmup(self):
+        """
+        Warm up every backend concurrently.
+        """
+        warmups = [
+            getattr(backend.provider, "warmup", None) for backend in self.backends
+        ]
+        await asyncio.gather(
+            *(warmup() for warmup in warmups if warmup),
+            return_exceptions=True,
+        )
+
+    async def stream_chat(
+        self, messages: List[ChatMessage], **kwargs: Any
+    ) -> AsyncGenerator[str, None]:
+        """
+        Streams chat messages from the fastest healthy backend.
+        """
+        result = kwargs.pop("result", None)
+        attempt, first = await self._first_token(self.ranked(), messages, kwargs)
+        try:
+            if first is None:
+                return
+            yield first
+            async for chunk in attempt.stream:
+                yield chunk
+        finally:
+            await attempt.stream.aclose()
+            if result is not None:
+                result.update(attempt.result)
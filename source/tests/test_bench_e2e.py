@@ -0,0 +1,32 @@
+"""
+Regression gate of the reply pipeline: a short run of the offline end-to-end
+benchmark must stay within the thresholds. They are loose enough for shared
+CI runners, and still catch lost replies, edit storms and blocking calls.
+"""
+
+import asyncio
+
+from benchmarks import bench_e2e
+
+
+def test_reply_pipeline_within_thresholds():
+    options = bench_e2e.parse_args(
+        [
+            "--messages=30",
+            "--rate=10",
+            "--channels=10",
+            "--ttft-ms=50",
+            "--tokens-per-second=400",
+            "--answer-tokens=60",
+            "--history-latency-ms=20",
+            "--timeout=60",
+            "--max-p95-ms=10000",
+            "--max-edits-per-reply=4",
+            "--max-loop-lag-ms=200",
+            "--max-memory-mb=50",
+        ]
+    )
+    report = asyncio.run(bench_e2e.run(options))
+
+    assert report["errors"] == 0
+    assert bench_e2e.check(report, options) == []
@@ -0,0 +1,68 @@
+"""
+Tests of the response cache keys: answers are only shared between requests
+of the same conversation.
+"""
+
+import asyncio
+
+from llm.cache import MemoryCacheBackend, ResponseCache
+
+
+def conversation(*contents):
+    roles = ["user", "assistant"] * len(contents)
+    return [{"role": "system", "content": "You are a bot."}] + [
+        {"role": role, "content": content} for role, content in zip(roles, contents)
+    ]
+
+
+def cache() -> ResponseCache:
+    return ResponseCache(
+        MemoryCacheBackend(max_entries=10, ttl_seconds=60), model="model"
+    )
+
+
+def test_hits_the_same_conversation():
+    async def scenario():
+        responses = cache()
+        messages = conversation(
+            "alice said: hi",
+            "bot said: hello!",
+            "alice said: what is the python language?",
+        )
+        key, _ = await responses.lookup(messages, temperature=0.2)
+        await responses.backend.set(key, "A programming language.")
+        # Another author asking the same question, with other punctuation.
+        messages[-1]["content"] = "bob said: What is the Python language"
+        return await responses.lookup(messages, temperature=0.2)
+
+    key, cached = asyncio.run(scenario())
+    assert cached == "A programming language."
+
+
+def test_misses_after_another_history():
+    async def scenario():
+        responses = cache()
+        first = conversation(
+            "alice said: tell me about snakes",
+            "bot said: Snakes are reptiles.",
+            "alice said: how long do they live?",
+        )
+        key, _ = await responses.lookup(first, temperature=0.2)
+        await responses.backend.set(key, "Snakes live 10 to 30 years.")
+        second = conversation(
+            "bob said: tell me about parrots",
+            "bot said: Parrots are birds.",
+            "bob said: how long do they live?",
+        )
+        return await responses.lookup(second, temperature=0.2)
+
+    key, cached = asyncio.run(scenario())
+    assert key is not None
+    assert cached is None
+
+
+def test_skips_short_messages():
+    responses = cache()
+
+    assert responses.key_for(conversation("alice said: why?"), temperature=0.2) is None
+    assert responses.key_for(conversation("bob said: yes"), temperature=0.2) is None
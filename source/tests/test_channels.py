@@ -0,0 +1,55 @@
+"""
+Tests of the channel allowlists.
+"""
+
+from core.channels import ChannelMatcher
+
+
+def test_literal_entries_match_exactly():
+    matcher = ChannelMatcher(["123:456"])
+
+    assert matcher.matches(123, 456)
+    assert not matcher.matches(9123, 456)
+    assert not matcher.matches(123, 4567)
+    assert not matcher.matches(123, 789)
+
+
+def test_regex_entries_are_searched():
+    matcher = ChannelMatcher(["123:.*", "^77:(1|2)$"])
+
+    assert matcher.matches(123, 1)
+    assert matcher.matches(9123, 1)
+    assert matcher.matches(77, 2)
+    assert not matcher.matches(77, 3)
+    assert not matcher.matches(1, 1)
+
+
+def test_literal_and_regex_entries_together():
+    matcher = ChannelMatcher(["1:2", "", "5:.*"])
+
+    assert matcher
+    assert matcher.exact_ids == {"1:2"}
+    assert matcher.matches(1, 2)
+    assert matcher.matches(5, 42)
+    assert not matcher.matches(1, 3)
+
+
+def test_empty_allowlist():
+    matcher = ChannelMatcher([""])
+
+    assert not matcher
+    assert not matcher.matches(1, 2)
+
+
+def test_memo_keeps_recent_channels():
+    matcher = ChannelMatcher(["1:.*"], memo_size=2)
+
+    assert matcher.matches(1, 1)
+    assert not matcher.matches(2, 1)
+    matcher.matches(1, 1)
+    matcher.matches(3, 1)
+
+    assert list(matcher._memo) == [(1, 1), (3, 1)]
+    # Memoized results are served without matching again.
+    matcher.regex = None
+    assert matcher.matches(1, 1)
@@ -0,0 +1,56 @@
+"""
+Tests of the per-channel coalescer: the items whose job never completes are
+reported as dropped.
+"""
+
+import asyncio
+
+from core.coalesce import ChannelCoalescer
+
+
+def test_reports_superseded_and_cancelled_items():
+    async def scenario():
+        outcomes = []
+
+        async def job(item):
+            await asyncio.sleep(0.2)
+            outcomes.append((item, "ok"))
+
+        coalescer = ChannelCoalescer(
+            50,
+            cancel_superseded=True,
+            on_dropped=lambda item, reason: outcomes.append((item, reason)),
+        )
+        coalescer.submit(1, "first", job)
+        coalescer.submit(1, "second", job)
+        await asyncio.sleep(0.1)
+        # Cancels the generation of "second", already running.
+        coalescer.submit(1, "third", job)
+        await asyncio.sleep(0.4)
+        return outcomes
+
+    assert asyncio.run(scenario()) == [
+        ("first", "superseded"),
+        ("second", "cancelled"),
+        ("third", "ok"),
+    ]
+
+
+def test_reports_job_cancelled_before_it_started():
+    async def scenario():
+        outcomes = []
+
+        async def job(item):
+            outcomes.append((item, "ok"))
+
+        coalescer = ChannelCoalescer(
+            0,
+            cancel_superseded=True,
+            on_dropped=lambda item, reason: outcomes.append((item, reason)),
+        )
+        coalescer.submit(1, "first", job)
+        coalescer.submit(1, "second", job)
+        await asyncio.sleep(0.05)
+        return outcomes
+
+    assert sorted(asyncio.run(scenario())) == [("first", "cancelled"), ("second", "ok")]
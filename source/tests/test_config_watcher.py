@@ -0,0 +1,65 @@
+"""
+Tests of configuration reloads: reloadable settings are applied, the others
+wait for a restart, and invalid configurations are ignored.
+"""
+
+import pytest
+
+from core.config import Settings
+from core.config_watcher import ConfigWatcher
+
+
+def watcher(monkeypatch, new: Settings):
+    applied = []
+    current = Settings(base_prompt_path="", coalesce_window_ms=0, llm_max_queue=64)
+    monkeypatch.setattr(Settings, "from_env", staticmethod(lambda: new))
+    return ConfigWatcher(current, applied.append, interval_seconds=0), applied
+
+
+def test_applies_reloadable_settings(monkeypatch):
+    new = Settings(base_prompt_path="", coalesce_window_ms=300, llm_max_queue=8)
+    config, applied = watcher(monkeypatch, new)
+
+    assert config.reload()
+    assert len(applied) == 1
+    assert applied[0].coalesce_window_ms == 300
+    # Needs a restart: the running value is kept.
+    assert applied[0].llm_max_queue == 64
+    assert config.settings is applied[0]
+    assert config.reloads == 1
+
+
+def test_ignores_unchanged_configuration(monkeypatch):
+    config, applied = watcher(monkeypatch, Settings(base_prompt_path=""))
+
+    assert not config.reload()
+    assert not applied
+
+
+@pytest.mark.parametrize(
+    "invalid",
+    [
+        {"reserved_completion_tokens": 5000},
+        {"context_layout": "spiral"},
+        {"chat_channels": "1:("},
+    ],
+)
+def test_rejects_invalid_settings(monkeypatch, invalid):
+    new = Settings(base_prompt_path="", **invalid)
+    config, applied = watcher(monkeypatch, new)
+    current = config.settings
+
+    assert not config.reload()
+    assert not applied
+    assert config.settings is current
+
+
+def test_rejects_unreadable_configuration(monkeypatch):
+    config, applied = watcher(monkeypatch, Settings(base_prompt_path=""))
+
+    def broken():
+        raise ValueError("invalid literal for int()")
+
+    monkeypatch.setattr(Settings, "from_env", staticmethod(broken))
+    assert not config.reload()
+    assert not applied
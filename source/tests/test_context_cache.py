@@ -0,0 +1,129 @@
+"""
+Tests of the per-channel context cache: seeding, eviction, gateway updates
+and invalidation.
+"""
+
+from benchmarks.fakes import FakeChannel, FakeGuild, FakeUser
+from core.context_cache import CachedMessage, ChannelContextCache
+
+USER = FakeUser(2, "user")
+
+
+def cache(max_messages: int = 5, max_channels: int = 10, ttl_seconds: float = 0):
+    return ChannelContextCache(max_messages, max_channels, ttl_seconds)
+
+
+def history(*ids: int):
+    return [CachedMessage(i, USER.id, USER.display_name, f"message {i}") for i in ids]
+
+
+def ids(messages):
+    return [m.id for m in messages]
+
+
+def test_cold_until_seeded():
+    contexts = cache()
+    channel = FakeChannel(1, FakeGuild(1))
+
+    message = channel.post("hello", USER)
+    contexts.add(message)
+    assert contexts.get(channel.id) is None
+
+    contexts.seed(channel.id, [CachedMessage.from_message(message)])
+    assert ids(contexts.get(channel.id)) == [message.id]
+
+
+def test_seed_keeps_messages_added_during_the_fetch():
+    contexts = cache(max_messages=10)
+    channel = FakeChannel(1, FakeGuild(1))
+    fetched = history(*range(1, 4))
+    # Two messages arrive while the history (up to message 3) is fetched.
+    newer = [channel.post("new", USER) for _ in range(2)]
+    for message in newer:
+        contexts.add(message)
+
+    contexts.seed(channel.id, fetched)
+    assert ids(contexts.get(channel.id)) == [1, 2, 3] + [m.id for m in newer]
+
+
+def test_keeps_latest_messages_at_capacity():
+    contexts = cache(max_messages=3)
+    channel = FakeChannel(1, FakeGuild(1))
+    contexts.seed(channel.id, [])
+    posted = [channel.post(f"message {i}", USER) for i in range(5)]
+    for message in posted:
+        contexts.add(message)
+
+    assert ids(contexts.get(channel.id)) == [m.id for m in posted[-3:]]
+
+
+def test_evicts_least_recently_used_channel():
+    contexts = cache(max_channels=2)
+    for channel_id in (1, 2):
+        contexts.seed(channel_id, history(channel_id))
+    contexts.get(1)
+    contexts.seed(3, history(3))
+
+    assert len(contexts) == 2
+    assert contexts.get(2) is None
+    assert contexts.get(1) is not None
+
+
+def test_expires_idle_channels():
+    contexts = cache(ttl_seconds=0.01)
+    contexts.seed(1, history(1))
+    contexts._channels[1].touched -= 1
+
+    assert contexts.get(1) is None
+    assert len(contexts) == 0
+
+
+def test_edits_update_the_cached_message():
+    contexts = cache()
+    contexts.seed(1, history(1, 2))
+    cached = contexts.find(1, 2)
+    cached.tokens = 10
+
+    contexts.update(1, 2, "edited")
+    assert contexts.find(1, 2).content == "edited"
+    assert contexts.find(1, 2).tokens is None
+    assert contexts.get(1) is not None
+
+
+def test_deletes_mark_the_buffer_cold():
+    contexts = cache()
+    contexts.seed(1, history(1, 2, 3))
+
+    contexts.remove(1, [4])
+    assert contexts.get(1) is not None
+
+    contexts.remove(1, [2])
+    assert contexts.get(1) is None
+    assert contexts.find(1, 2) is None
+
+
+def test_out_of_order_message_marks_the_buffer_cold():
+    contexts = cache(max_messages=10)
+    channel = FakeChannel(1, FakeGuild(1))
+    early, late = channel.post("early", USER), channel.post("late", USER)
+    contexts.seed(channel.id, [])
+    contexts.add(late)
+    contexts.add(early)
+
+    assert contexts.get(channel.id) is None
+
+
+def test_invalidate_on_resume():
+    contexts = cache()
+    for channel_id in (1, 2):
+        contexts.seed(channel_id, history(channel_id))
+
+    contexts.invalidate(1)
+    assert contexts.get(1) is None
+    assert contexts.get(2) is not None
+
+    # After a gateway resume, every channel may have missed events.
+    contexts.invalidate()
+    assert contexts.get(2) is None
+    contexts.seed(2, history(2, 3))
+    assert ids(contexts.get(2)) == [2, 3]
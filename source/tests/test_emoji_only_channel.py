@@ -0,0 +1,112 @@
+"""
+Tests of the emoji-only channel rule and of the batched deletions.
+"""
+
+import asyncio
+import datetime
+
+import discord
+import pytest
+
+from addons.emoji_only_channel import EmojiModerator, is_emoji_only
+
+
+@pytest.mark.parametrize(
+    "content",
+    [
+        "😀",
+        "😀 🎉\n🔥",
+        "   ",
+        "",
+        "👨‍👩‍👧",  # ZWJ sequence
+        "👍🏽 👋🏿",  # skin tones
+        "🇫🇷🇯🇵",  # flags (regional indicators)
+        "🏴\U000e0067\U000e0062\U000e0065\U000e006e\U000e0067\U000e007f",  # tag flag
+        "1️⃣ #⃣ *️⃣",  # keycaps
+        "❤️ ☀",
+        "<:party:123456789> <a:dance:987654321>",
+        "<:party:123>😀<a:dance:456>",
+    ],
+)
+def test_emoji_only(content):
+    assert is_emoji_only(content)
+
+
+@pytest.mark.parametrize(
+    "content",
+    [
+        "hello",
+        "😀 nice",
+        "1",
+        "+",
+        "¡olé!",
+        "日本語",
+        "<:party:123>text<:party:123>",
+        "<:not an emoji:123>",
+        "<@123456>",
+    ],
+)
+def test_not_emoji_only(content):
+    assert not is_emoji_only(content)
+
+
+class FakeMessage:
+    def __init__(self, channel, age: datetime.timedelta):
+        self.channel = channel
+        self.content = "not an emoji"
+        self.created_at = discord.utils.utcnow() - age
+        self.deleted = False
+
+    async def delete(self):
+        self.channel.single_deletes += 1
+        self.deleted = True
+
+
+class FakeChannel:
+    id = 1
+
+    def __init__(self):
+        self.batches = []
+        self.single_deletes = 0
+
+    async def delete_messages(self, messages):
+        assert 2 <= len(messages) <= 100
+        self.batches.append(len(messages))
+        for message in messages:
+            message.deleted = True
+
+
+def moderate(recent: int, old: int):
+    async def scenario():
+        channel = FakeChannel()
+        moderator = EmojiModerator(flush_interval_ms=10)
+        messages = [
+            FakeMessage(channel, datetime.timedelta(minutes=1)) for _ in range(recent)
+        ] + [FakeMessage(channel, datetime.timedelta(days=20)) for _ in range(old)]
+        for message in messages:
+            assert moderator.submit(message)
+        assert moderator.backlog == len(messages)
+        await asyncio.sleep(0.1)
+        return channel, moderator, messages
+
+    return asyncio.run(scenario())
+
+
+def test_bulk_deletes_in_batches_of_100():
+    channel, moderator, messages = moderate(recent=230, old=0)
+
+    assert channel.batches == [100, 100, 30]
+    assert channel.single_deletes == 0
+    assert all(m.deleted for m in messages)
+    assert moderator.deleted == 230
+    assert moderator.backlog == 0
+
+
+def test_old_and_leftover_messages_are_deleted_one_by_one():
+    channel, moderator, messages = moderate(recent=101, old=2)
+
+    # The last recent message is alone in its batch, bulk deletes need two.
+    assert channel.batches == [100]
+    assert channel.single_deletes == 3
+    assert all(m.deleted for m in messages)
+    assert moderator.deleted == 103
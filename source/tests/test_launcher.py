@@ -0,0 +1,46 @@
+"""
+Tests of the multi-process launcher: shard layout and worker restarts.
+"""
+
+import asyncio
+
+import launcher
+
+
+def test_shard_ranges():
+    assert launcher.shard_ranges(10, 3) == [[0, 1, 2, 3], [4, 5, 6], [7, 8, 9]]
+    assert launcher.shard_ranges(2, 4) == [[0], [1]]
+
+
+def test_restart_backoff_resets_after_a_stable_run(monkeypatch):
+    # Exit codes and run times of the successive worker processes.
+    runs = [(1, 0), (1, 0), (1, 0), (1, 600), (1, 0), (0, 0)]
+    clock = [0.0]
+    delays = []
+
+    class FakeTime:
+        @staticmethod
+        def monotonic():
+            return clock[0]
+
+    class FakeProcess:
+        def __init__(self, code, seconds):
+            self.code, self.seconds = code, seconds
+
+        async def wait(self):
+            clock[0] += self.seconds
+            return self.code
+
+    async def create_subprocess_exec(*_, **__):
+        return FakeProcess(*runs.pop(0))
+
+    async def sleep(seconds):
+        delays.append(seconds)
+
+    monkeypatch.setattr(launcher, "time", FakeTime)
+    monkeypatch.setattr(asyncio, "create_subprocess_exec", create_subprocess_exec)
+    monkeypatch.setattr(asyncio, "sleep", sleep)
+
+    asyncio.run(launcher.run_worker(0, {"SHARD_IDS": "0-1"}, stable_seconds=300))
+    assert delays == [1.0, 2.0, 4.0, 1.0, 2.0]
+    assert not runs
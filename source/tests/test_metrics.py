@@ -0,0 +1,40 @@
+"""
+Tests of the Prometheus rendering of the metrics registry.
+"""
+
+from core.metrics import MetricsRegistry
+
+
+def test_escapes_label_values():
+    registry = MetricsRegistry()
+    registry.inc("errors_total", reason='bad "quote"\\path\nnext')
+
+    assert (
+        'errors_total{reason="bad \\"quote\\"\\\\path\\nnext"} 1'
+        in registry.render_prometheus().splitlines()
+    )
+
+
+def test_collected_totals_are_counters():
+    registry = MetricsRegistry()
+    registry.add_collector(
+        "handler", lambda: {"replies_coalesced_total": 3, "queue_depth": 2}
+    )
+
+    lines = registry.render_prometheus().splitlines()
+    assert "# TYPE replies_coalesced_total counter" in lines
+    assert "replies_coalesced_total 3" in lines
+    assert "# TYPE queue_depth gauge" in lines
+    assert "queue_depth 2" in lines
+
+
+def test_renders_histograms():
+    registry = MetricsRegistry()
+    registry.observe("edit_seconds", 0.02, channel="1")
+
+    lines = registry.render_prometheus().splitlines()
+    assert "# TYPE edit_seconds histogram" in lines
+    assert 'edit_seconds_bucket{channel="1",le="0.01"} 0' in lines
+    assert 'edit_seconds_bucket{channel="1",le="0.025"} 1' in lines
+    assert 'edit_seconds_bucket{channel="1",le="+Inf"} 1' in lines
+    assert 'edit_seconds_count{channel="1"} 1' in lines
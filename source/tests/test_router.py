@@ -0,0 +1,159 @@
+"""
+Tests of the LLM router: failover, hedging and first-token timeouts, with
+fake backends.
+"""
+
+import asyncio
+import time
+
+import pytest
+
+from llm.base import StreamResult
+from llm.fake_provider import FakeProvider
+from llm.router import Backend, RouterProvider
+
+
+def router(*providers: FakeProvider, **kwargs) -> RouterProvider:
+    kwargs.setdefault("first_token_timeout_ms", 1000)
+    return RouterProvider(
+        [Backend(f"backend{i}", p) for i, p in enumerate(providers)], **kwargs
+    )
+
+
+async def collect(provider, result=None) -> str:
+    chunks = []
+    async for chunk in provider.stream_chat([], result=result):
+        chunks.append(chunk)
+    return "".join(chunks)
+
+
+def test_fails_over_on_error():
+    failing = FakeProvider("first", fail=True)
+    routed = router(failing, FakeProvider("second"))
+
+    assert asyncio.run(collect(routed)) == "second"
+    assert routed.backends[0].failures == 1
+    assert routed.ranked()[-1] is routed.backends[0]
+
+
+def test_fails_over_on_first_token_timeout():
+    routed = router(
+        FakeProvider("slow", ttft_ms=2000),
+        FakeProvider("fast"),
+        first_token_timeout_ms=100,
+    )
+
+    started = time.monotonic()
+    assert asyncio.run(collect(routed)) == "fast"
+    assert time.monotonic() - started < 1
+    assert routed.backends[0].failures == 1
+    # A timeout is not a latency sample.
+    assert not routed.backends[0].ttft
+
+
+def test_raises_when_every_backend_fails():
+    routed = router(FakeProvider(fail=True), FakeProvider(fail=True))
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(collect(routed))
+
+
+def test_hedges_late_first_token():
+    async def scenario():
+        routed = router(
+            FakeProvider("primary", ttft_ms=300),
+            FakeProvider("hedge"),
+            hedge_after_ms=50,
+        )
+        started = time.monotonic()
+        answer = await collect(routed)
+        elapsed = time.monotonic() - started
+        # The losing attempt is measured until its first token arrives.
+        await asyncio.sleep(0.4)
+        return routed, answer, elapsed
+
+    routed, answer, elapsed = asyncio.run(scenario())
+    assert answer == "hedge"
+    assert elapsed < 0.25
+    primary, hedge = routed.backends
+    assert primary.provider.calls == hedge.provider.calls == 1
+    assert list(primary.ttft) == [pytest.approx(0.3, abs=0.1)]
+    assert list(hedge.ttft) == [pytest.approx(0.05, abs=0.05)]
+
+
+def test_no_hedge_without_delay():
+    routed = router(FakeProvider("primary"), FakeProvider("hedge"), hedge_after_ms=50)
+
+    assert asyncio.run(collect(routed)) == "primary"
+    assert routed.backends[1].provider.calls == 0
+
+
+def test_ranks_by_time_to_first_token():
+    routed = router(FakeProvider("slow"), FakeProvider("fast"))
+    slow, fast = routed.backends
+    slow.ttft.extend([0.5] * 10)
+    fast.ttft.extend([0.1] * 10)
+
+    assert routed.ranked() == [fast, slow]
+    assert asyncio.run(collect(routed)) == "fast"
+
+
+def test_probes_failed_backend_again():
+    async def scenario():
+        routed = router(FakeProvider("first", fail=True), FakeProvider("second"))
+        routed.probe_interval = 0.05
+        first, second = routed.backends
+        assert await collect(routed) == "second"
+        assert routed.ranked() == [second, first]
+
+        first.provider.fail = False
+        await asyncio.sleep(0.06)
+        return routed, await collect(routed)
+
+    routed, answer = asyncio.run(scenario())
+    assert answer == "first"
+    assert routed.backends[0].demoted_until == 0.0
+
+
+def test_probes_backend_left_unused():
+    routed = router(FakeProvider("slow"), FakeProvider("fast"))
+    slow, fast = routed.backends
+    slow.ttft.extend([0.5] * 10)
+    fast.ttft.extend([0.1] * 10)
+    slow.last_used = time.monotonic() - routed.probe_interval
+
+    assert routed.ranked() == [slow, fast]
+
+
+def test_reports_the_winner_result():
+    routed = router(FakeProvider(fail=True), FakeProvider("one two three"))
+    result = StreamResult()
+
+    asyncio.run(collect(routed, result))
+    assert result.finish_reason == "stop"
+    assert result.completion_tokens == 3
+
+
+class LegacyProvider:
+    """
+    Provider written before `result` existed: forwards its keywords to its
+    client and has no warmup.
+    """
+
+    async def stream_chat(self, messages, **kwargs):
+        for word in self.create(**kwargs):
+            yield word
+
+    @staticmethod
+    def create(temperature=None):
+        return ["legacy ", "answer"]
+
+
+def test_supports_providers_without_result():
+    routed = router(LegacyProvider())
+    result = StreamResult()
+
+    asyncio.run(routed.warmup())
+    assert asyncio.run(collect(routed, result)) == "legacy answer"
+    assert result.finish_reason == "stop"
+    assert result.completion_tokens is None
@@ -0,0 +1,119 @@
+"""
+Tests of the fair LLM slot scheduler: round-robin between keys, overflow
+policies and background requests.
+"""
+
+import asyncio
+
+import pytest
+
+from core.scheduler import FairScheduler, QueueFullError
+
+
+async def settle():
+    """
+    Let every ready task run until it blocks.
+    """
+    for _ in range(10):
+        await asyncio.sleep(0)
+
+
+def queue_behind_holder(scheduler: FairScheduler, requests, order: list):
+    """
+    Coroutine that holds the only slot, queues `requests` ((key, label)
+    pairs) in order, then releases the slot and returns their tasks.
+    """
+
+    async def request(key, label):
+        async with scheduler.slot(key):
+            order.append(label)
+
+    async def scenario():
+        await scheduler.acquire("holder")
+        tasks = []
+        for key, label in requests:
+            tasks.append(asyncio.create_task(request(key, label)))
+            await settle()
+        scheduler.release()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        return tasks
+
+    return scenario()
+
+
+def test_serves_keys_round_robin():
+    scheduler = FairScheduler(max_in_flight=1, max_queue=10)
+    order = []
+    requests = [("a", "a1"), ("a", "a2"), ("a", "a3"), ("b", "b1"), ("c", "c1")]
+
+    asyncio.run(queue_behind_holder(scheduler, requests, order))
+    assert order == ["a1", "b1", "c1", "a2", "a3"]
+    assert scheduler.in_flight == 0
+    assert scheduler.queue_depth == 0
+
+
+def test_rejects_when_queue_is_full():
+    scheduler = FairScheduler(max_in_flight=1, max_queue=2)
+    order = []
+    requests = [("a", "a1"), ("b", "b1"), ("c", "c1")]
+
+    tasks = asyncio.run(queue_behind_holder(scheduler, requests, order))
+    assert order == ["a1", "b1"]
+    assert isinstance(tasks[2].exception(), QueueFullError)
+    assert scheduler.dropped == 1
+
+
+def test_drops_oldest_request_of_busiest_key():
+    scheduler = FairScheduler(max_in_flight=1, max_queue=3, drop_policy="drop_oldest")
+    order = []
+    requests = [("a", "a1"), ("a", "a2"), ("b", "b1"), ("c", "c1")]
+
+    tasks = asyncio.run(queue_behind_holder(scheduler, requests, order))
+    assert isinstance(tasks[0].exception(), QueueFullError)
+    assert order == ["a2", "b1", "c1"]
+    assert scheduler.dropped == 1
+
+
+def test_unknown_drop_policy():
+    with pytest.raises(ValueError):
+        FairScheduler(max_in_flight=1, max_queue=1, drop_policy="random")
+
+
+def test_background_waits_for_queued_replies():
+    scheduler = FairScheduler(max_in_flight=1, max_queue=10)
+    order = []
+
+    async def background(label):
+        async with scheduler.background_slot():
+            order.append(label)
+
+    async def reply(key, label):
+        async with scheduler.slot(key):
+            order.append(label)
+
+    async def scenario():
+        await scheduler.acquire("holder")
+        tasks = [asyncio.create_task(background("summary"))]
+        await settle()
+        # Replies queued after the background request still go first.
+        tasks.append(asyncio.create_task(reply("a", "a1")))
+        tasks.append(asyncio.create_task(reply("b", "b1")))
+        await settle()
+        assert scheduler.metrics()["background_queue_depth"] == 1
+        scheduler.release()
+        await asyncio.gather(*tasks)
+
+    asyncio.run(scenario())
+    assert order == ["a1", "b1", "summary"]
+    assert scheduler.in_flight == 0
+
+
+def test_background_runs_when_idle():
+    scheduler = FairScheduler(max_in_flight=2, max_queue=10)
+
+    async def scenario():
+        async with scheduler.background_slot():
+            return scheduler.in_flight
+
+    assert asyncio.run(scenario()) == 1
+    assert scheduler.in_flight == 0
@@ -0,0 +1,83 @@
+"""
+Tests of the splitting of long replies into several Discord messages.
+"""
+
+import pytest
+
+from core.splitting import FENCE_CLOSE, open_fence, split_message
+
+PROSE = " ".join(
+    f"Sentence number {i} of the answer is here." + ("\n\n" if i % 7 == 6 else "")
+    for i in range(120)
+)
+CODE = (
+    "Here is the code:\n```python\n"
+    + "\n".join(f"print({i})  # line {i}" for i in range(150))
+    + "\n```\nThat's all."
+)
+WORDS = "x" * 3000 + " " + "word " * 400
+
+
+def split_all(text: str, limit: int):
+    """
+    Split like StreamEditor does: each message starts with the carried prefix.
+    Returns the messages, and the part of `text` each one shows.
+    """
+    messages, parts = [], []
+    carry, position = "", 0
+    while len(carry) + len(text) - position > limit:
+        head, next_carry, consumed = split_message(carry + text[position:], limit)
+        messages.append(head)
+        parts.append(text[position : position + consumed - len(carry)])
+        position += consumed - len(carry)
+        carry = next_carry
+    messages.append(carry + text[position:])
+    parts.append(text[position:])
+    return messages, parts
+
+
+@pytest.mark.parametrize("text", [PROSE, CODE, WORDS])
+@pytest.mark.parametrize("limit", [200, 500, 2000])
+def test_chunks_fit_and_cover_the_input(text, limit):
+    messages, parts = split_all(text, limit)
+
+    assert len(messages) > 1
+    assert all(len(m) <= limit for m in messages)
+    assert "".join(parts) == text
+    for message, part in zip(messages, parts):
+        # Messages only drop the whitespace at the split, and add fences.
+        assert part.strip() in message
+
+
+def test_split_inside_code_block_reopens_the_fence():
+    messages, _ = split_all(CODE, 500)
+
+    assert messages[0].endswith(FENCE_CLOSE)
+    for message in messages[1:-1]:
+        assert message.startswith("```python\n")
+        assert message.endswith(FENCE_CLOSE)
+    assert messages[-1].startswith("```python\n")
+    assert all(open_fence(m) is None for m in messages)
+
+
+def test_prefers_paragraph_boundaries():
+    head, carry, consumed = split_message(PROSE, 500)
+
+    assert carry == ""
+    assert PROSE[:consumed].endswith("\n\n")
+    assert head == PROSE[:consumed].rstrip()
+
+
+@pytest.mark.parametrize(
+    "text, fence",
+    [
+        ("no code", None),
+        ("```\ncode", "```"),
+        ("```js\ncode", "```js"),
+        ("```py\ncode\n```\ntext", None),
+        ("```py\na\n```\n```sh\nb", "```sh"),
+        ("inline ``` is not a fence", None),
+    ],
+)
+def test_open_fence(text, fence):
+    assert open_fence(text) == fence
@@ -0,0 +1,145 @@
+"""
+Tests of the Stable Diffusion client against stub A1111 nodes: dispatch,
+eviction and re-admission of unhealthy nodes, and cancellation.
+"""
+
+import asyncio
+import socket
+import time
+
+from addons.stable_diffusion_conection import SDClient
+from benchmarks.sd_stub_server import StubNode
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def run_with_nodes(scenario, count: int = 2, steps: int = 3, **node_options):
+    """
+    Run `scenario(client, nodes)` against started stub nodes.
+    """
+
+    async def main():
+        node_options.setdefault("step_ms", 10)
+        node_options.setdefault("swap_ms", 0)
+        nodes = [StubNode(free_port(), **node_options) for _ in range(count)]
+        for node in nodes:
+            await node.start()
+        client = SDClient(
+            [node.url for node in nodes],
+            sd_checkpoint="model",
+            steps=steps,
+            health_interval_seconds=3600,
+        )
+        try:
+            return await scenario(client, nodes)
+        finally:
+            await client.close()
+            for node in nodes:
+                await node.stop()
+
+    return asyncio.run(main())
+
+
+def test_dispatches_across_nodes():
+    async def scenario(client, nodes):
+        jobs = [client.submit(f"prompt {i}") for i in range(4)]
+        assert {job.node.url for job in jobs} == {node.url for node in nodes}
+        return await asyncio.gather(*(job.result() for job in jobs))
+
+    results = run_with_nodes(scenario)
+    assert all(len(images) == 1 for images in results)
+
+
+def test_prefers_node_with_checkpoint_loaded():
+    async def scenario(client, nodes):
+        nodes[0].checkpoint = "other"
+        nodes[1].checkpoint = "model"
+        for node in client.nodes:
+            await client.check_health(node)
+        job = client.submit("prompt")
+        await job.result()
+        return job, nodes
+
+    job, nodes = run_with_nodes(scenario)
+    assert job.node.url == nodes[1].url
+    assert nodes[1].swaps == 0
+
+
+def test_evicts_and_readmits_unhealthy_node():
+    async def scenario(client, nodes):
+        down, up = client.nodes
+        nodes[0].down = True
+        for _ in range(client.MAX_FAILURES):
+            await client.check_health(down)
+        assert not down.healthy
+
+        jobs = [client.submit(f"prompt {i}") for i in range(3)]
+        assert all(job.node is up for job in jobs)
+        await asyncio.gather(*(job.result() for job in jobs))
+
+        nodes[0].down = False
+        assert await client.check_health(down)
+        assert down.healthy
+        return nodes
+
+    nodes = run_with_nodes(scenario)
+    assert nodes[0].generations == 0
+    assert nodes[1].generations == 3
+
+
+def test_failed_generations_evict_and_redispatch():
+    async def scenario(client, nodes):
+        failing = client.nodes[0]
+        nodes[0].down = True
+        # Queue several jobs on the failing node, they move once it is evicted.
+        jobs = [client.submit(f"prompt {i}") for i in range(3)]
+        for job in jobs:
+            if job.node is not failing:
+                client.nodes[1].queue.remove(job)
+                client._dispatch(job, failing)
+        results = await asyncio.gather(*(job.result() for job in jobs))
+        return failing, results, nodes
+
+    failing, results, nodes = run_with_nodes(scenario)
+    assert not failing.healthy
+    # Jobs that ran on the node before its eviction fail, the others moved.
+    served = sum(1 for images in results if images)
+    assert served >= 1
+    assert nodes[1].generations == served
+    assert nodes[0].generations == 0
+
+
+def test_cancels_queued_job():
+    async def scenario(client, nodes):
+        running = client.submit("first")
+        queued = client.submit("second")
+        assert client.position(queued) == 1
+        await client.cancel(queued)
+        assert await queued.result() == []
+        assert await running.result()
+        return nodes
+
+    nodes = run_with_nodes(scenario, count=1, steps=10)
+    assert nodes[0].generations == 1
+
+
+def test_cancels_running_job():
+    async def scenario(client, nodes):
+        job = client.submit("prompt")
+        while not job.running:
+            await asyncio.sleep(0.01)
+        started = time.monotonic()
+        await client.cancel(job)
+        images = await job.result()
+        return images, time.monotonic() - started, client.nodes[0].latency
+
+    images, elapsed, latency = run_with_nodes(scenario, count=1, steps=100, step_ms=20)
+    assert images == []
+    # The partial generation isn't a latency sample of the node.
+    assert latency is None
+    # Interrupted after the current step, not after the 2s of the 100 steps.
+    assert elapsed < 1
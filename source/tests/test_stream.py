@@ -0,0 +1,64 @@
+"""
+Tests of the stream editor: long replies roll over into continuation messages
+without losing text, even when edits fail.
+"""
+
+import asyncio
+import random
+
+import discord
+
+from benchmarks.fakes import FakeChannel, FakeGuild, FakeMessage, FakeUser
+from core.rate_limit import EditBudget
+from core.stream import StreamEditor
+
+ANSWER = " ".join(f"word{i}" for i in range(800)) + "\n"
+
+
+def stream_answer(failure_rate: float, monkeypatch) -> list:
+    rng = random.Random(7)
+    edit = FakeMessage.edit
+
+    async def flaky_edit(self, content, **kwargs):
+        if rng.random() < failure_rate:
+            raise discord.RateLimited(0.01)
+        await edit(self, content, **kwargs)
+
+    monkeypatch.setattr(FakeMessage, "edit", flaky_edit)
+
+    async def scenario():
+        channel = FakeChannel(
+            1, FakeGuild(1), request_latency_ms=0, edits_per_window=1000
+        )
+        question = channel.post("question?", FakeUser(2, "user"))
+        editor = StreamEditor(
+            question,
+            safe_edit_length=500,
+            edit_min_delta_chars=40,
+            edit_min_interval_ms=0,
+            budget=EditBudget(capacity=100, rate=100),
+        )
+        for start in range(0, len(ANSWER), 37):
+            await editor.on_stream_chunk(ANSWER[start : start + 37])
+        await editor.on_stream_chunk("", force=True)
+        editor.close()
+        return editor.messages
+
+    return asyncio.run(scenario())
+
+
+def test_rolls_over_into_continuation_messages(monkeypatch):
+    messages = stream_answer(0, monkeypatch)
+
+    assert len(messages) > 1
+    assert all(len(m.content) <= 500 for m in messages)
+    # Splits happen at spaces, which the messages don't keep.
+    assert " ".join(m.content for m in messages).split() == ANSWER.split()
+
+
+def test_failed_edits_lose_no_text(monkeypatch):
+    messages = stream_answer(0.3, monkeypatch)
+
+    assert all(len(m.content) <= 500 for m in messages)
+    # Splits happen at spaces, which the messages don't keep.
+    assert " ".join(m.content for m in messages).split() == ANSWER.split()
@@ -0,0 +1,76 @@
+"""
+Tests of the incremental <think> tag parser.
+"""
+
+import pytest
+
+from core.think import ThinkTagParser
+
+
+def parse(*chunks: str) -> str:
+    parser = ThinkTagParser()
+    for chunk in chunks:
+        parser.feed(chunk)
+    parser.flush()
+    return parser.text()
+
+
+def test_keeps_text_without_tags():
+    assert parse("Hello ", "world", "!") == "Hello world!"
+
+
+def test_hides_think_block():
+    assert parse("<think>reasoning</think>The answer.") == "The answer."
+
+
+@pytest.mark.parametrize(
+    "chunks",
+    [
+        ["<thi", "nk>reasoning</think>The answer."],
+        ["<think>reasoning</th", "ink>The answer."],
+        ["<", "t", "h", "i", "n", "k", ">reasoning<", "/", "think>The answer."],
+        ["<think>reas", "oning</think", ">The ", "answer."],
+    ],
+)
+def test_tags_split_across_chunks(chunks):
+    assert parse(*chunks) == "The answer."
+
+
+def test_text_around_tags():
+    # Only the text after the last closing tag is the answer.
+    assert parse("Intro <think>reasoning</think> The answer.") == " The answer."
+
+
+def test_closing_tag_without_opening_tag():
+    assert parse("reasoning streamed without tag</think>The answer.") == "The answer."
+
+
+def test_unclosed_tag_hides_everything():
+    assert parse("x <think> y") == ""
+
+    parser = ThinkTagParser()
+    parser.feed("Intro <think>still thinking")
+    assert parser.text() == ""
+
+
+def test_nested_tags():
+    # The first closing tag ends the block, the rest is cleared by the second.
+    assert parse("<think>a <think>b</think> c</think>The answer.") == "The answer."
+
+
+def test_partial_tag_released_at_end_of_stream():
+    parser = ThinkTagParser()
+    parser.feed("1 < 2 and 3 <thi")
+    assert parser.text() == "1 < 2 and 3 "
+    parser.flush()
+    assert parser.text() == "1 < 2 and 3 <thi"
+
+
+def test_consume_drops_sent_text():
+    parser = ThinkTagParser()
+    parser.feed("first part, second part")
+    revision = parser.revision
+    parser.consume(len("first part, "))
+    assert parser.text() == "second part"
+    assert len(parser) == len("second part")
+    assert parser.revision > revision